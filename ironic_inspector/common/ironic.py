@@ -11,12 +11,20 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import collections
+import functools
+import random
 import socket
+import time
 
+import eventlet
+from eventlet import semaphore
 from ironicclient import client
+from ironicclient.common import base as ironic_base
 from ironicclient import exceptions as ironic_exc
 import netaddr
 from oslo_config import cfg
+from oslo_utils import uuidutils
 
 from ironic_inspector.common.i18n import _, _LW
 from ironic_inspector.common import keystone
@@ -55,12 +63,38 @@ IRONIC_OPTS = [
                help=_('Ironic endpoint type.')),
     cfg.IntOpt('retry_interval',
                default=2,
-               help=_('Interval between retries in case of conflict error '
-                      '(HTTP 409).')),
+               help=_('Interval before the first retry in case of conflict '
+                      '(HTTP 409) or service unavailable (HTTP 503) error. '
+                      'It is doubled on every next retry, up to '
+                      'max_retry_interval, and randomized by up to a half.')),
+    cfg.IntOpt('max_retry_interval',
+               default=10,
+               help=_('Maximum interval between retries in case of conflict '
+                      '(HTTP 409) or service unavailable (HTTP 503) '
+                      'error.')),
     cfg.IntOpt('max_retries',
                default=30,
-               help=_('Maximum number of retries in case of conflict error '
-                      '(HTTP 409).')),
+               help=_('Maximum number of retries in case of conflict '
+                      '(HTTP 409) or service unavailable (HTTP 503) '
+                      'error. Requests changing data are not retried on '
+                      'service unavailable errors.')),
+    cfg.IntOpt('max_retry_time',
+               default=60,
+               help=_('Maximum total time (in seconds) to wait between '
+                      'retries of one request to Ironic. Set to 0 to only '
+                      'limit the number of retries.')),
+    cfg.IntOpt('max_concurrent_requests',
+               default=16,
+               help=_('Maximum number of requests of the same type (e.g. '
+                      'node updates) sent to Ironic at the same time. The '
+                      'limit is halved on every conflict or service '
+                      'unavailable error and grows back by one with every '
+                      'successful request. Set to 0 to disable limiting.')),
+    cfg.IntOpt('node_name_cache_ttl',
+               default=60,
+               help=_('For how much time (in seconds) to cache the UUID of a '
+                      'node found by its name. Set to 0 to disable '
+                      'caching.')),
 ]
 
 
@@ -68,6 +102,32 @@ CONF.register_opts(IRONIC_OPTS, group=IRONIC_GROUP)
 keystone.register_auth_opts(IRONIC_GROUP)
 
 IRONIC_SESSION = None
+# (token, API version) -> client, the least recently used first
+_CLIENTS = collections.OrderedDict()
+# Maximum number of cached clients, most of them are for user tokens
+_MAX_CLIENTS = 32
+_CLIENT_STATISTICS = {'requested': 0, 'created': 0}
+# BMC host name -> (expiration time, IP address or None on failure),
+# the least recently used first
+_RESOLVED = collections.OrderedDict()
+_MAX_RESOLVED = 4096
+# Maximum number of host names resolved at the same time
+_RESOLVE_CONCURRENCY = 16
+_RESOLVE_STATISTICS = {'hits': 0, 'misses': 0}
+# Operation name (e.g. node.update) -> _Limiter
+_LIMITERS = {}
+_RETRY_EXCEPTIONS = (ironic_exc.Conflict, ironic_exc.ServiceUnavailable,
+                     ironic_exc.ConnectionRefused)
+# Errors after which a request may have been processed by Ironic, only
+# read-only requests are retried on them
+_UNSAFE_RETRY_EXCEPTIONS = (ironic_exc.ServiceUnavailable,)
+# Prefixes of names of resource manager methods that do not change data
+_READ_ONLY_PREFIXES = ('get', 'list', 'states', 'validate')
+# Node name -> (expiration time, node UUID), the least recently used first
+_NODE_UUIDS = collections.OrderedDict()
+_MAX_NODE_UUIDS = 4096
+# Size of the first page of list_newer with a watermark
+_FIRST_PAGE_SIZE = 10
 
 
 class NotFound(utils.Error):
@@ -79,45 +139,188 @@ class NotFound(utils.Error):
 
 
 def reset_ironic_session():
-    """Reset the global session variable.
+    """Reset the global session variable and the cached clients.
 
     Mostly useful for unit tests.
     """
     global IRONIC_SESSION
     IRONIC_SESSION = None
+    _CLIENTS.clear()
 
 
-def get_ipmi_address(node):
-    ipmi_fields = ['ipmi_address'] + CONF.ipmi_address_fields
+def invalidate_client(ironic=None):
+    """Drop a client from the cache, e.g. after an authentication error.
+
+    :param ironic: client instance to drop, all clients are dropped if None
+    """
+    if ironic is None:
+        _CLIENTS.clear()
+        return
+
+    for key, value in list(_CLIENTS.items()):
+        if value is ironic:
+            LOG.debug('Dropping cached Ironic client for API version %s',
+                      key[1])
+            del _CLIENTS[key]
+
+
+def client_statistics():
+    """Get statistics of the client cache.
+
+    :returns: dict with keys ``requested`` (number of get_client calls),
+              ``created`` (number of clients actually created) and
+              ``cached`` (number of clients in the cache now)
+    """
+    return dict(_CLIENT_STATISTICS, cached=len(_CLIENTS))
+
+
+def log_statistics():
+    """Log statistics of the Ironic clients on the debug level."""
+    LOG.debug('Ironic client cache statistics: %s', client_statistics())
+    LOG.debug('BMC host names resolution statistics: %s',
+              resolution_statistics())
+    for operation, stats in sorted(request_statistics().items()):
+        LOG.debug('Ironic %(op)s request statistics: %(stats)s',
+                  {'op': operation, 'stats': stats})
+
+
+def _bmc_hostname(node):
+    """Get the BMC host name or IP address from the node's driver_info."""
     # NOTE(sambetts): IPMI Address is useless to us if bridging is enabled so
     # just ignore it and return None
     if node.driver_info.get("ipmi_bridging", "no") != "no":
         return
-    for name in ipmi_fields:
+    for name in ['ipmi_address'] + CONF.ipmi_address_fields:
         value = node.driver_info.get(name)
-        if not value:
-            continue
+        if value:
+            return value
+
+
+def _resolve(hostname):
+    """Resolve a host name, using the cache.
+
+    :raises: socket.gaierror on failure, also on a cached one
+    """
+    if netaddr.valid_ipv4(hostname, netaddr.INET_PTON):
+        return hostname
+
+    try:
+        expires_at, ip = _RESOLVED.pop(hostname)
+    except KeyError:
+        pass
+    else:
+        if expires_at > time.time():
+            _RESOLVED[hostname] = (expires_at, ip)
+            _RESOLVE_STATISTICS['hits'] += 1
+            if ip is None:
+                raise socket.gaierror(
+                    'Resolving %s failed recently' % hostname)
+            return ip
+
+    _RESOLVE_STATISTICS['misses'] += 1
+    try:
+        ip = socket.gethostbyname(hostname)
+    except socket.gaierror:
+        _remember(hostname, None, CONF.bmc_address_negative_cache_ttl)
+        raise
+
+    _remember(hostname, ip, CONF.bmc_address_cache_ttl)
+    return ip
+
+
+def _remember(hostname, ip, ttl):
+    if ttl <= 0:
+        return
 
+    while len(_RESOLVED) >= _MAX_RESOLVED:
+        _RESOLVED.popitem(last=False)
+    _RESOLVED[hostname] = (time.time() + ttl, ip)
+
+
+def get_ipmi_address(node):
+    value = _bmc_hostname(node)
+    if not value:
+        return
+
+    try:
+        ip = _resolve(value)
+    except socket.gaierror:
+        msg = _('Failed to resolve the hostname (%(value)s)'
+                ' for node %(uuid)s')
+        raise utils.Error(msg % {'value': value,
+                                 'uuid': node.uuid},
+                          node_info=node)
+
+    if netaddr.IPAddress(ip).is_loopback():
+        LOG.warning(_LW('Ignoring loopback BMC address %s'), ip,
+                    node_info=node)
+        ip = None
+
+    return ip
+
+
+def resolve_ipmi_addresses(nodes):
+    """Resolve BMC host names of many nodes at once.
+
+    Host names are resolved concurrently and put into the cache, so that
+    the following get_ipmi_address calls for these nodes do not block.
+    Failures are cached too and reported by get_ipmi_address.
+
+    :param nodes: list of nodes with driver_info
+    """
+    hostnames = {_bmc_hostname(node) for node in nodes}
+    hostnames = [name for name in hostnames
+                 if name and not netaddr.valid_ipv4(name, netaddr.INET_PTON)]
+    if not hostnames:
+        return
+
+    def _resolve_ignore_errors(hostname):
         try:
-            ip = socket.gethostbyname(value)
+            _resolve(hostname)
         except socket.gaierror:
-            msg = _('Failed to resolve the hostname (%(value)s)'
-                    ' for node %(uuid)s')
-            raise utils.Error(msg % {'value': value,
-                                     'uuid': node.uuid},
-                              node_info=node)
+            pass
+
+    pool = eventlet.GreenPool(_RESOLVE_CONCURRENCY)
+    for _result in pool.imap(_resolve_ignore_errors, hostnames):
+        pass
+    LOG.debug('Resolved %d BMC host names', len(hostnames))
+
 
-        if netaddr.IPAddress(ip).is_loopback():
-            LOG.warning(_LW('Ignoring loopback BMC address %s'), ip,
-                        node_info=node)
-            ip = None
+def resolution_statistics():
+    """Get statistics of the BMC host names resolution cache.
 
-        return ip
+    :returns: dict with keys ``hits``, ``misses`` and ``cached`` (number of
+              host names in the cache now)
+    """
+    return dict(_RESOLVE_STATISTICS, cached=len(_RESOLVED))
 
 
 def get_client(token=None,
-               api_version=DEFAULT_IRONIC_API_VERSION):  # pragma: no cover
-    """Get Ironic client instance."""
+               api_version=DEFAULT_IRONIC_API_VERSION):
+    """Get Ironic client instance.
+
+    Clients are cached by the token and the API version, so that the endpoint
+    lookup is done and the HTTP connections are kept alive only once per
+    combination of them.
+
+    :param token: authentication token, None to use the service credentials
+    :param api_version: Ironic API version to request
+    """
+    key = (token, api_version)
+    _CLIENT_STATISTICS['requested'] += 1
+    try:
+        ironic = _CLIENTS.pop(key)
+    except KeyError:
+        ironic = _create_client(token, api_version)
+        _CLIENT_STATISTICS['created'] += 1
+        while len(_CLIENTS) >= _MAX_CLIENTS:
+            _CLIENTS.popitem(last=False)
+
+    _CLIENTS[key] = ironic
+    return ironic
+
+
+def _create_client(token, api_version):
     # NOTE: To support standalone ironic without keystone
     if CONF.ironic.auth_strategy == 'noauth':
         args = {'token': 'noauth',
@@ -138,9 +341,186 @@ def get_client(token=None,
             args = {'token': token,
                     'endpoint': ironic_url}
     args['os_ironic_api_version'] = api_version
-    args['max_retries'] = CONF.ironic.max_retries
-    args['retry_interval'] = CONF.ironic.retry_interval
-    return client.Client(1, **args)
+    # NOTE(dtantsur): retries are handled by _LimitedClient
+    args['max_retries'] = 0
+    return _LimitedClient(client.Client(1, **args))
+
+
+class _Limiter(object):
+    """Limit on concurrent Ironic requests of one type.
+
+    The limit is halved on every error showing that Ironic is overloaded and
+    grows back by one with every successful request.
+    """
+
+    def __init__(self):
+        self.max_limit = CONF.ironic.max_concurrent_requests
+        self.limit = self.max_limit
+        self._semaphore = semaphore.Semaphore(max(self.limit, 0))
+        # Number of released slots to keep after the limit was lowered
+        self._debt = 0
+        self.in_flight = 0
+        self.waiting = 0
+        self.requests = 0
+        self.retries = 0
+        self.total_time = 0.0
+
+    def acquire(self):
+        if self.max_limit > 0:
+            self.waiting += 1
+            try:
+                self._semaphore.acquire()
+            finally:
+                self.waiting -= 1
+        self.in_flight += 1
+
+    def release(self, elapsed):
+        self.in_flight -= 1
+        self.requests += 1
+        self.total_time += elapsed
+        if self.max_limit > 0:
+            self._give_back()
+
+    def decrease(self):
+        if self.max_limit <= 0 or self.limit <= 1:
+            return
+
+        new_limit = max(1, self.limit // 2)
+        for _i in range(self.limit - new_limit):
+            if not self._semaphore.acquire(blocking=False):
+                self._debt += 1
+        self.limit = new_limit
+
+    def increase(self):
+        if 0 < self.limit < self.max_limit:
+            self.limit += 1
+            self._give_back()
+
+    def _give_back(self):
+        if self._debt:
+            self._debt -= 1
+        else:
+            self._semaphore.release()
+
+
+def _retry_delay(attempt):
+    interval = min(CONF.ironic.retry_interval * 2 ** attempt,
+                   CONF.ironic.max_retry_interval)
+    return interval / 2.0 + random.uniform(0, interval / 2.0)
+
+
+def _is_read_only(operation):
+    method = operation.split('.', 1)[-1]
+    return method.split('_', 1)[0] in _READ_ONLY_PREFIXES
+
+
+def _call_limited(ironic, operation, func, *args, **kwargs):
+    limiter = _LIMITERS.get(operation)
+    if limiter is None:
+        limiter = _LIMITERS[operation] = _Limiter()
+
+    max_time = CONF.ironic.max_retry_time
+    attempt = 0
+    waited = 0.0
+    while True:
+        limiter.acquire()
+        start = time.time()
+        try:
+            result = func(*args, **kwargs)
+        except ironic_exc.Unauthorized:
+            # The token may have expired, do not reuse the client
+            if ironic is not None:
+                invalidate_client(ironic)
+            raise
+        except _RETRY_EXCEPTIONS as exc:
+            limiter.decrease()
+            if (attempt >= CONF.ironic.max_retries
+                    or (max_time > 0 and waited >= max_time)
+                    or (isinstance(exc, _UNSAFE_RETRY_EXCEPTIONS)
+                        and not _is_read_only(operation))):
+                raise
+            delay = _retry_delay(attempt)
+            if max_time > 0:
+                delay = min(delay, max_time - waited)
+            waited += delay
+            LOG.debug('Ironic %(op)s failed: %(exc)s. Retrying in '
+                      '%(delay).1f seconds, attempt %(attempt)d of %(max)d',
+                      {'op': operation, 'exc': exc, 'delay': delay,
+                       'attempt': attempt + 1,
+                       'max': CONF.ironic.max_retries})
+        else:
+            limiter.increase()
+            return result
+        finally:
+            limiter.release(time.time() - start)
+
+        limiter.retries += 1
+        attempt += 1
+        time.sleep(delay)
+
+
+class _LimitedManager(object):
+    """Wrapper for a client resource manager, limiting and retrying calls."""
+
+    def __init__(self, name, manager, ironic=None):
+        self._name = name
+        self._manager = manager
+        self._ironic = ironic
+
+    def __getattr__(self, attr):
+        value = getattr(self._manager, attr)
+        if attr.startswith('_') or not callable(value):
+            return value
+
+        operation = '%s.%s' % (self._name, attr)
+
+        @functools.wraps(value)
+        def _wrapper(*args, **kwargs):
+            return _call_limited(self._ironic, operation, value,
+                                 *args, **kwargs)
+
+        return _wrapper
+
+
+class _LimitedClient(object):
+    """Wrapper for an Ironic client, see _LimitedManager."""
+
+    def __init__(self, ironic):
+        self._client = ironic
+        self._managers = {}
+
+    def __getattr__(self, attr):
+        try:
+            return self._managers[attr]
+        except KeyError:
+            pass
+
+        value = getattr(self._client, attr)
+        if isinstance(value, ironic_base.Manager):
+            value = self._managers[attr] = _LimitedManager(attr, value,
+                                                           self)
+        return value
+
+
+def request_statistics():
+    """Get statistics of the requests to Ironic.
+
+    :returns: dict operation name (e.g. ``node.update``) -> dict with keys
+              ``requests`` (number of finished requests, including failed
+              and retried ones), ``retries``, ``in_flight``, ``waiting``
+              (number of requests waiting for the concurrency limit),
+              ``limit`` (the current concurrency limit, 0 if disabled) and
+              ``average_time`` (in seconds)
+    """
+    return {operation: {'requests': limiter.requests,
+                        'retries': limiter.retries,
+                        'in_flight': limiter.in_flight,
+                        'waiting': limiter.waiting,
+                        'limit': max(limiter.limit, 0),
+                        'average_time': (limiter.total_time /
+                                         limiter.requests
+                                         if limiter.requests else 0.0)}
+            for operation, limiter in _LIMITERS.items()}
 
 
 def check_provision_state(node, with_credentials=False):
@@ -191,5 +571,93 @@ def get_node(node_id, ironic=None, **kwargs):
                           {'node': node_id, 'exc': exc})
 
 
+def get_node_uuid(node_id, ironic=None):
+    """Get the UUID of a node by its UUID or name.
+
+    Names are resolved using Ironic, the result is cached for
+    ``[ironic]node_name_cache_ttl`` seconds.
+
+    :param node_id: node UUID or name.
+    :param ironic: ironic client instance.
+    :raises: Error on failure
+    """
+    if uuidutils.is_uuid_like(node_id):
+        return node_id
+
+    try:
+        expires_at, uuid = _NODE_UUIDS.pop(node_id)
+    except KeyError:
+        pass
+    else:
+        if expires_at > time.time():
+            _NODE_UUIDS[node_id] = (expires_at, uuid)
+            return uuid
+
+    uuid = get_node(node_id, ironic=ironic, fields=['uuid']).uuid
+    ttl = CONF.ironic.node_name_cache_ttl
+    if ttl > 0:
+        while len(_NODE_UUIDS) >= _MAX_NODE_UUIDS:
+            _NODE_UUIDS.popitem(last=False)
+        _NODE_UUIDS[node_id] = (time.time() + ttl, uuid)
+    return uuid
+
+
+def invalidate_node_names(uuids):
+    """Drop cached names of the given nodes.
+
+    :param uuids: node UUIDs
+    """
+    uuids = set(uuids)
+    for name, (_expires_at, uuid) in list(_NODE_UUIDS.items()):
+        if uuid in uuids:
+            del _NODE_UUIDS[name]
+
+
+def list_newer(manager, key, watermark, fields, page_size=100):
+    """List Ironic resources with a timestamp not older than the given one.
+
+    Resources are fetched newest first, page by page, until an older one
+    is met, so only the changed resources are transferred. With a watermark
+    the first page is small and the following ones grow up to page_size,
+    since usually only a few resources have changed.
+
+    Listing also stops on the first resource without the timestamp. Such
+    resources go last on most databases, but first on PostgreSQL, where
+    nothing is returned for a key that is not set for all resources (e.g.
+    ``updated_at``). This avoids paging through all such resources.
+
+    :param manager: client resource manager, e.g. ``ironic.port``
+    :param key: timestamp field to sort on, e.g. ``updated_at``
+    :param watermark: the latest timestamp seen, None to list everything
+    :param fields: fields to fetch, must include the ``key``
+    :param page_size: maximum number of resources to fetch in one request
+    :returns: list of resources
+    """
+    result = []
+    marker = None
+    limit = page_size if watermark is None else min(_FIRST_PAGE_SIZE,
+                                                    page_size)
+    while True:
+        page = manager.list(limit=limit, marker=marker,
+                            sort_key=key, sort_dir='desc', fields=fields)
+        for item in page:
+            value = getattr(item, key)
+            if value is None:
+                if not result and marker is None:
+                    LOG.debug('Resources without %s are listed first, '
+                              'no changed resources can be found by it', key)
+                return result
+            # NOTE(dtantsur): resources with the same timestamp as the
+            # watermark may have not been seen yet, so they are fetched again
+            if watermark is not None and value < watermark:
+                return result
+            result.append(item)
+
+        if len(page) < limit:
+            return result
+        marker = page[-1].uuid
+        limit = min(limit * 2, page_size)
+
+
 def list_opts():
     return keystone.add_auth_options(IRONIC_OPTS, IRONIC_GROUP)
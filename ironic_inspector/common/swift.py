@@ -14,8 +14,12 @@
 # Mostly copied from ironic/common/swift.py
 
 import json
+import zlib
 
+from eventlet import pools
 from oslo_config import cfg
+from oslo_log import log
+from oslo_utils import excutils
 from swiftclient import client as swift_client
 from swiftclient import exceptions as swift_exceptions
 
@@ -24,7 +28,7 @@ from ironic_inspector.common import keystone
 from ironic_inspector import utils
 
 CONF = cfg.CONF
-
+LOG = log.getLogger(__name__)
 
 SWIFT_GROUP = 'swift'
 SWIFT_OPTS = [
@@ -49,22 +53,110 @@ SWIFT_OPTS = [
                help=_('Swift endpoint type.')),
     cfg.StrOpt('os_region',
                help=_('Keystone region to get endpoint for.')),
+    cfg.StrOpt('data_compression',
+               default='none',
+               choices=('none', 'gzip', 'zlib'),
+               help=_('Compression to apply to introspection data stored '
+                      'in Swift. The algorithm is recorded in the '
+                      'X-Object-Meta-Inspector-Encoding header of the '
+                      'object.')),
+    cfg.IntOpt('connection_pool_size',
+               default=10,
+               min=1,
+               help=_('Maximum number of connections to Swift kept open and '
+                      'used at the same time.')),
 ]
 
 CONF.register_opts(SWIFT_OPTS, group=SWIFT_GROUP)
 keystone.register_auth_opts(SWIFT_GROUP)
 
 OBJECT_NAME_PREFIX = 'inspector_data'
+ENCODING_HEADER = 'X-Object-Meta-Inspector-Encoding'
+# Size of chunks to stream objects in
+CHUNK_SIZE = 65536
+# Compression algorithm -> zlib window bits
+_WBITS = {'gzip': 16 + zlib.MAX_WBITS, 'zlib': zlib.MAX_WBITS}
 SWIFT_SESSION = None
+# Pool of Swift connections, None if not created yet
+_POOL = None
+# Names of containers known to exist
+_CONTAINERS = set()
 
 
 def reset_swift_session():
     """Reset the global session variable.
 
+    Also drops the connection pool and the containers known to exist.
     Mostly useful for unit tests.
     """
-    global SWIFT_SESSION
+    global SWIFT_SESSION, _POOL
     SWIFT_SESSION = None
+    _POOL = None
+    _CONTAINERS.clear()
+
+
+def _create_connection():
+    global SWIFT_SESSION
+    if not SWIFT_SESSION:
+        SWIFT_SESSION = keystone.get_session(SWIFT_GROUP)
+
+    return swift_client.Connection(session=SWIFT_SESSION)
+
+
+def _get_pool():
+    global _POOL
+    if _POOL is None:
+        _POOL = pools.Pool(max_size=CONF.swift.connection_pool_size,
+                           create=_create_connection)
+    return _POOL
+
+
+def _connection():
+    """Get a context manager with a connection from the pool.
+
+    Connections are created on demand and returned to the pool on exit.
+    A connection is never used by two green threads at the same time.
+    """
+    return _get_pool().item()
+
+
+class _ObjectStream(object):
+    """Iterable over the body of a Swift object.
+
+    The connection is returned to the pool once the body is read or the
+    stream is closed.
+    """
+
+    def __init__(self, pool, connection, body):
+        self._pool = pool
+        self._connection = connection
+        self._body = body
+        self._finished = False
+
+    def __iter__(self):
+        try:
+            for chunk in self._body:
+                yield chunk
+            self._finished = True
+        finally:
+            self.close()
+
+    def close(self):
+        if self._connection is None:
+            return
+
+        if not self._finished:
+            # NOTE(dtantsur): the rest of the response cannot be read by the
+            # next user of the connection, make it reconnect instead.
+            self._connection.close()
+        self._pool.put(self._connection)
+        self._connection = None
+
+
+def _put_error(object, container, error):
+    return (_('Swift failed to create object %(object)s in '
+              'container %(container)s. Error was: %(error)s') %
+            {'object': object, 'container': container, 'error': error})
 
 
 class SwiftAPI(object):
@@ -73,18 +165,29 @@ class SwiftAPI(object):
     def __init__(self):
         """Constructor for creating a SwiftAPI object.
 
-        Authentification is loaded from config file.
+        Authentification is loaded from config file. Connections are taken
+        from a pool shared by all instances.
         """
-        global SWIFT_SESSION
-        if not SWIFT_SESSION:
-            SWIFT_SESSION = keystone.get_session(SWIFT_GROUP)
 
-        self.connection = swift_client.Connection(session=SWIFT_SESSION)
+    def _ensure_container(self, connection, container):
+        if container in _CONTAINERS:
+            return
+
+        try:
+            connection.put_container(container)
+        except swift_exceptions.ClientException as e:
+            err_msg = (_('Swift failed to create container %(container)s. '
+                         'Error was: %(error)s') %
+                       {'container': container, 'error': e})
+            raise utils.Error(err_msg)
+        _CONTAINERS.add(container)
 
     def create_object(self, object, data, container=CONF.swift.container,
                       headers=None):
         """Uploads a given string to Swift.
 
+        The container is created if it is not known to exist yet.
+
         :param object: The name of the object in Swift
         :param data: string data to put in the object
         :param container: The name of the container for the object.
@@ -92,53 +195,183 @@ class SwiftAPI(object):
         :returns: The Swift UUID of the object
         :raises: utils.Error, if any operation with Swift fails.
         """
+        if CONF.swift.delete_after > 0:
+            headers = headers or {}
+            headers['X-Delete-After'] = CONF.swift.delete_after
+
+        with _connection() as connection:
+            self._ensure_container(connection, container)
+            try:
+                return connection.put_object(container, object, data,
+                                             headers=headers)
+            except swift_exceptions.ClientException as e:
+                if e.http_status != 404:
+                    raise utils.Error(_put_error(object, container, e))
+
+            # NOTE(dtantsur): the container was deleted behind our back
+            LOG.debug('Container %s not found, creating it again', container)
+            _CONTAINERS.discard(container)
+            self._ensure_container(connection, container)
+            try:
+                return connection.put_object(container, object, data,
+                                             headers=headers)
+            except swift_exceptions.ClientException as e:
+                raise utils.Error(_put_error(object, container, e))
+
+    def get_object(self, object, container=CONF.swift.container,
+                   with_headers=False):
+        """Downloads a given object from Swift.
+
+        :param object: The name of the object in Swift
+        :param container: The name of the container for the object.
+        :param with_headers: whether to also return the object headers
+        :returns: Swift object, or tuple (headers, object) if with_headers
+                  is True; header names are lower case
+        :raises: utils.Error, if the Swift operation fails.
+        """
         try:
-            self.connection.put_container(container)
+            with _connection() as connection:
+                headers, obj = connection.get_object(container, object)
         except swift_exceptions.ClientException as e:
-            err_msg = (_('Swift failed to create container %(container)s. '
-                         'Error was: %(error)s') %
-                       {'container': container, 'error': e})
+            err_msg = (_('Swift failed to get object %(object)s in '
+                         'container %(container)s. Error was: %(error)s') %
+                       {'object': object, 'container': container, 'error': e})
             raise utils.Error(err_msg)
 
-        if CONF.swift.delete_after > 0:
-            headers = headers or {}
-            headers['X-Delete-After'] = CONF.swift.delete_after
+        if with_headers:
+            return headers, obj
+        return obj
 
+    def head_object(self, object, container=CONF.swift.container):
+        """Gets the headers of a given object from Swift.
+
+        :param object: The name of the object in Swift
+        :param container: The name of the container for the object.
+        :returns: object headers, header names are lower case
+        :raises: utils.Error, if the Swift operation fails.
+        """
         try:
-            obj_uuid = self.connection.put_object(container,
-                                                  object,
-                                                  data,
-                                                  headers=headers)
+            with _connection() as connection:
+                return connection.head_object(container, object)
         except swift_exceptions.ClientException as e:
-            err_msg = (_('Swift failed to create object %(object)s in '
+            err_msg = (_('Swift failed to get object %(object)s in '
                          'container %(container)s. Error was: %(error)s') %
                        {'object': object, 'container': container, 'error': e})
             raise utils.Error(err_msg)
 
-        return obj_uuid
+    def get_object_stream(self, object, container=CONF.swift.container,
+                          chunk_size=CHUNK_SIZE):
+        """Starts downloading a given object from Swift.
 
-    def get_object(self, object, container=CONF.swift.container):
-        """Downloads a given object from Swift.
+        The caller must either read the whole body or close it.
 
         :param object: The name of the object in Swift
         :param container: The name of the container for the object.
-        :returns: Swift object
+        :param chunk_size: size of the body chunks in bytes
+        :returns: tuple (headers, body), where body is an iterable over
+                  chunks of the object with a close() method; header names
+                  are lower case
         :raises: utils.Error, if the Swift operation fails.
         """
+        pool = _get_pool()
+        connection = pool.get()
         try:
-            headers, obj = self.connection.get_object(container, object)
+            headers, body = connection.get_object(container, object,
+                                                  resp_chunk_size=chunk_size)
         except swift_exceptions.ClientException as e:
+            pool.put(connection)
             err_msg = (_('Swift failed to get object %(object)s in '
                          'container %(container)s. Error was: %(error)s') %
                        {'object': object, 'container': container, 'error': e})
             raise utils.Error(err_msg)
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                pool.put(connection)
 
-        return obj
+        return headers, _ObjectStream(pool, connection, body)
+
+
+def compress(data):
+    """Compress data according to the [swift]data_compression option.
+
+    :param data: string to compress
+    :returns: tuple (payload, headers), where headers are the object headers
+              to record the compression with, or None if it is disabled
+    """
+    encoding = CONF.swift.data_compression
+    if encoding == 'none':
+        return data, None
+
+    if not isinstance(data, bytes):
+        data = data.encode('utf-8')
+    compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED,
+                                  _WBITS[encoding])
+    payload = compressor.compress(data) + compressor.flush()
+    return payload, {ENCODING_HEADER: encoding}
+
+
+def decompress(payload, encoding):
+    """Decompress data stored with the given compression.
+
+    :param payload: object contents
+    :param encoding: compression algorithm, None if not compressed
+    :returns: decompressed data
+    :raises: utils.Error on unknown algorithm or corrupted payload
+    """
+    if not encoding:
+        return payload
+
+    try:
+        return zlib.decompress(payload, _WBITS[encoding]).decode('utf-8')
+    except KeyError:
+        raise utils.Error(_('Unsupported compression of introspection '
+                            'data: %s') % encoding)
+    except zlib.error as exc:
+        raise utils.Error(_('Failed to decompress introspection data: %s')
+                          % exc)
+
+
+def decompress_stream(chunks, encoding):
+    """Decompress data stored with the given compression chunk by chunk.
+
+    :param chunks: iterable over chunks of the object contents
+    :param encoding: compression algorithm
+    :returns: iterator over decompressed chunks
+    :raises: utils.Error on unknown algorithm or corrupted payload
+    """
+    try:
+        decompressor = zlib.decompressobj(_WBITS[encoding])
+    except KeyError:
+        raise utils.Error(_('Unsupported compression of introspection '
+                            'data: %s') % encoding)
+
+    # NOTE(dtantsur): the algorithm is checked above before the first chunk
+    # is requested, so that the error can still be returned to the client.
+    return _decompress_chunks(chunks, decompressor)
+
+
+def _decompress_chunks(chunks, decompressor):
+    try:
+        for chunk in chunks:
+            yield decompressor.decompress(chunk)
+        yield decompressor.flush()
+    except zlib.error as exc:
+        raise utils.Error(_('Failed to decompress introspection data: %s')
+                          % exc)
+
+
+def _object_name(uuid, suffix):
+    swift_object_name = '%s-%s' % (OBJECT_NAME_PREFIX, uuid)
+    if suffix is not None:
+        swift_object_name = '%s-%s' % (swift_object_name, suffix)
+    return swift_object_name
 
 
 def store_introspection_data(data, uuid, suffix=None):
     """Uploads introspection data to Swift.
 
+    The data is compressed according to the [swift]data_compression option.
+
     :param data: data to store in Swift
     :param uuid: UUID of the Ironic node that the data came from
     :param suffix: optional suffix to add to the underlying swift
@@ -146,26 +379,50 @@ def store_introspection_data(data, uuid, suffix=None):
     :returns: name of the Swift object that the data is stored in
     """
     swift_api = SwiftAPI()
-    swift_object_name = '%s-%s' % (OBJECT_NAME_PREFIX, uuid)
-    if suffix is not None:
-        swift_object_name = '%s-%s' % (swift_object_name, suffix)
-    swift_api.create_object(swift_object_name, json.dumps(data))
+    swift_object_name = _object_name(uuid, suffix)
+    payload, headers = compress(json.dumps(data))
+    swift_api.create_object(swift_object_name, payload, headers=headers)
     return swift_object_name
 
 
+def get_introspection_data_stream(uuid, suffix=None):
+    """Starts downloading introspection data from Swift.
+
+    The data is not decompressed, see decompress_stream.
+
+    :param uuid: UUID of the Ironic node that the data came from
+    :param suffix: optional suffix to add to the underlying swift
+                   object name
+    :returns: tuple (headers, body), see SwiftAPI.get_object_stream
+    """
+    swift_api = SwiftAPI()
+    return swift_api.get_object_stream(_object_name(uuid, suffix))
+
+
+def get_introspection_data_headers(uuid, suffix=None):
+    """Gets the headers of introspection data from Swift.
+
+    :param uuid: UUID of the Ironic node that the data came from
+    :param suffix: optional suffix to add to the underlying swift
+                   object name
+    :returns: object headers, see SwiftAPI.head_object
+    """
+    swift_api = SwiftAPI()
+    return swift_api.head_object(_object_name(uuid, suffix))
+
+
 def get_introspection_data(uuid, suffix=None):
     """Downloads introspection data from Swift.
 
     :param uuid: UUID of the Ironic node that the data came from
     :param suffix: optional suffix to add to the underlying swift
                    object name
-    :returns: Swift object with the introspection data
+    :returns: Swift object with the introspection data, decompressed
     """
     swift_api = SwiftAPI()
-    swift_object_name = '%s-%s' % (OBJECT_NAME_PREFIX, uuid)
-    if suffix is not None:
-        swift_object_name = '%s-%s' % (swift_object_name, suffix)
-    return swift_api.get_object(swift_object_name)
+    headers, payload = swift_api.get_object(_object_name(uuid, suffix),
+                                            with_headers=True)
+    return decompress(payload, headers.get(ENCODING_HEADER.lower()))
 
 
 def list_opts():
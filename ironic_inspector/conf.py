@@ -23,13 +23,19 @@ VERSION_HEADER = 'X-OpenStack-Ironic-Inspector-API-Version'
 
 VALID_ADD_PORTS_VALUES = ('all', 'active', 'pxe')
 VALID_KEEP_PORTS_VALUES = ('all', 'present', 'added')
-VALID_STORE_DATA_VALUES = ('none', 'swift')
 
 
 FIREWALL_OPTS = [
     cfg.BoolOpt('manage_firewall',
                 default=True,
                 help=_('Whether to manage firewall rules for PXE port.')),
+    cfg.StrOpt('driver',
+               default='iptables',
+               help=_('PXE filter driver to use. Possible values: iptables '
+                      '(filter DHCP requests with iptables on '
+                      'dnsmasq_interface), dnsmasq (write host files for '
+                      'the dnsmasq --dhcp-hostsdir option, see the '
+                      '[dnsmasq_pxe_filter] section).')),
     cfg.StrOpt('dnsmasq_interface',
                default='br-ctlplane',
                help=_('Interface on which dnsmasq listens, the default is for '
@@ -37,10 +43,74 @@ FIREWALL_OPTS = [
     cfg.IntOpt('firewall_update_period',
                default=15,
                help=_('Amount of time in seconds, after which repeat periodic '
-                      'update of firewall.')),
+                      'update of firewall. Changes of nodes on introspection '
+                      'trigger updates on their own, the periodic update '
+                      'picks up changes of ports in Ironic and retries '
+                      'failed updates.')),
+    cfg.FloatOpt('firewall_update_delay',
+                 default=1.0,
+                 help=_('Delay in seconds between a change of nodes on '
+                        'introspection and the firewall update it triggers. '
+                        'All changes during this delay are applied in one '
+                        'update.')),
+    cfg.IntOpt('port_cache_refresh_period',
+               default=600,
+               help=_('Amount of time in seconds, after which the cached '
+                      'list of Ironic ports used by the firewall is loaded '
+                      'again completely. In between only created and '
+                      'updated ports are fetched. Set to 0 to load all '
+                      'ports on every firewall update.')),
+    cfg.IntOpt('port_cache_sweep_period',
+               default=60,
+               help=_('Amount of time in seconds, after which only UUIDs of '
+                      'all Ironic ports are fetched to drop ports deleted '
+                      'not by ironic-inspector from the cache. Until then '
+                      'such ports stay blacklisted, unless their nodes are '
+                      'found deleted. Set to 0 to only drop them on a full '
+                      'refresh (see port_cache_refresh_period).')),
+    cfg.BoolOpt('use_rootwrap_daemon',
+                default=False,
+                help=_('Whether to run iptables and ipset through a '
+                       'long-running rootwrap daemon instead of starting '
+                       'ironic-inspector-rootwrap for every command. '
+                       'Requires ironic-inspector-rootwrap-daemon to be '
+                       'allowed in sudoers.')),
+    cfg.StrOpt('state_file',
+               help=_('File to save the applied firewall rules to. If set, '
+                      'the firewall chain is kept on shutdown, and used as '
+                      'it is on the next start, if it matches the saved '
+                      'state. Otherwise the chain is removed on shutdown '
+                      'and created from scratch on start.')),
     cfg.StrOpt('firewall_chain',
                default='ironic-inspector',
                help=_('iptables chain name to use.')),
+    cfg.StrOpt('firewall_backend',
+               default='iptables',
+               choices=('iptables', 'iptables-restore', 'ipset'),
+               help=_('How to update the iptables chain. "iptables" runs '
+                      'iptables once for every rule, "iptables-restore" '
+                      'replaces the whole chain atomically with a single '
+                      'call to "iptables-restore --noflush". "ipset" keeps '
+                      'blacklisted MAC addresses in an ipset of type '
+                      'hash:mac referenced by a single rule, and only adds '
+                      'or removes changed MAC addresses. The last two '
+                      'require iptables-restore or ipset to be allowed in '
+                      'the rootwrap filters.')),
+    cfg.StrOpt('filter_mode',
+               default='blacklist',
+               choices=('blacklist', 'whitelist'),
+               help=_('Which MAC addresses to filter. "blacklist" drops '
+                      'DHCP requests from MAC addresses of all ports '
+                      'registered in Ironic, except for nodes on '
+                      'introspection. "whitelist" only accepts DHCP '
+                      'requests from MAC addresses of nodes on '
+                      'introspection, and does not require listing ports '
+                      'in Ironic. "blacklist" is always used when '
+                      '[processing]node_not_found_hook is set.')),
+    cfg.StrOpt('ipset_name',
+               default='ironic-inspector',
+               help=_('Name of the ipset to use with the "ipset" firewall '
+                      'backend.')),
     cfg.ListOpt('ethoib_interfaces',
                 default=[],
                 help=_('List of Etherent Over InfiniBand interfaces '
@@ -113,9 +183,12 @@ PROCESSING_OPTS = [
                       'aware of. This hook is ignored by default.')),
     cfg.StrOpt('store_data',
                default='none',
-               choices=VALID_STORE_DATA_VALUES,
-               help=_('Method for storing introspection data. If set to \'none'
-                      '\', introspection data will not be stored.')),
+               help=_('Method for storing introspection data: the name of '
+                      'a driver from the '
+                      'ironic_inspector.introspection_data.store entry '
+                      'point. Built-in drivers are "swift", "filesystem" '
+                      'and "database". If set to \'none\', introspection '
+                      'data will not be stored.')),
     cfg.StrOpt('store_data_location',
                help=_('Name of the key to store the location of stored data '
                       'in the extra column of the Ironic database.')),
@@ -169,6 +242,23 @@ SERVICE_OPTS = [
                default=60,
                help=_('Amount of time in seconds, after which repeat clean up '
                       'of timed out nodes and old nodes status information.')),
+    cfg.IntOpt('ironic_sync_period',
+               default=600,
+               help=_('Amount of time in seconds, after which repeat the '
+                      'full synchronization with Ironic, dropping nodes '
+                      'deleted from Ironic from the cache. Set to 0 to '
+                      'disable.')),
+    cfg.IntOpt('ironic_sync_batch_size',
+               default=10,
+               help=_('How many cached nodes to check for removal from '
+                      'Ironic on every clean up, between the full '
+                      'synchronizations. Set to 0 to disable.')),
+    cfg.IntOpt('statistics_log_period',
+               default=600,
+               help=_('Amount of time in seconds, after which repeat '
+                      'logging of the Ironic client, Ironic request and BMC '
+                      'address resolution statistics on the debug level. '
+                      'Set to 0 to disable.')),
     cfg.BoolOpt('use_ssl',
                 default=False,
                 help=_('SSL Enabled/Disabled')),
@@ -195,6 +285,16 @@ SERVICE_OPTS = [
                          'cimc_address'],
                 help=_('Ironic driver_info fields that are equivalent '
                        'to ipmi_address.')),
+    cfg.IntOpt('bmc_address_cache_ttl',
+               default=300,
+               help=_('For how much time (in seconds) to cache the result of '
+                      'resolving a BMC host name. Set to 0 to disable '
+                      'caching.')),
+    cfg.IntOpt('bmc_address_negative_cache_ttl',
+               default=30,
+               help=_('For how much time (in seconds) to cache a failure to '
+                      'resolve a BMC host name. Set to 0 to disable caching '
+                      'of failures.')),
     cfg.StrOpt('rootwrap_config',
                default="/etc/ironic-inspector/rootwrap.conf",
                help=_('Path to the rootwrap configuration file to use for '
@@ -23,7 +23,8 @@ from oslo_db.sqlalchemy import models
 from oslo_db.sqlalchemy import session as db_session
 from oslo_db.sqlalchemy import types as db_types
 from sqlalchemy import (Boolean, Column, DateTime, Enum, ForeignKey,
-                        Integer, String, Text)
+                        Integer, String, Text, text)
+from sqlalchemy.dialects import mysql
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy import orm
 
@@ -81,10 +82,20 @@ class Option(Base):
     value = Column(Text)
 
 
+class IntrospectionData(Base):
+    __tablename__ = 'introspection_data'
+    uuid = Column(String(36), ForeignKey('nodes.uuid'), primary_key=True)
+    processed = Column(Boolean, primary_key=True, default=False)
+    data = Column(Text().with_variant(mysql.LONGTEXT(), 'mysql'),
+                  nullable=False)
+
+
 class Rule(Base):
     __tablename__ = 'rules'
     uuid = Column(String(36), primary_key=True)
     created_at = Column(DateTime, nullable=False)
+    # NOTE(dtantsur): rules are applied in order of their positions
+    position = Column(Integer, nullable=False, server_default=text('0'))
     description = Column(Text)
     # NOTE(dtantsur): in the future we might need to temporary disable a rule
     disabled = Column(Boolean, default=False)
@@ -11,18 +11,27 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import collections
 import contextlib
+import errno
+import json
 import os
 import re
 import subprocess
 
+import eventlet
+from eventlet import event
 from eventlet import semaphore
 from oslo_config import cfg
 from oslo_log import log
+from oslo_rootwrap import client as rootwrap_client
+from oslo_utils import timeutils
 
-from ironic_inspector.common.i18n import _LE, _LW
+from ironic_inspector.common.i18n import _LE, _LI, _LW
 from ironic_inspector.common import ironic as ir_utils
 from ironic_inspector import node_cache
+from ironic_inspector.plugins import base as plugins_base
+from ironic_inspector import port_cache
 
 
 CONF = cfg.CONF
@@ -31,89 +40,483 @@ NEW_CHAIN = None
 CHAIN = None
 INTERFACE = None
 LOCK = semaphore.BoundedSemaphore()
+ROOTWRAP_COMMAND = None
+# Client of the rootwrap daemon, None if the daemon is not used
+ROOTWRAP_CLIENT = None
 BASE_COMMAND = None
+RESTORE_COMMAND = None
+IPSET_COMMAND = None
+IPSET = None
+# MAC addresses in the ipset, None if unknown
+IPSET_ENTRIES = None
+# Whether the INPUT rule jumping to CHAIN was added by iptables-restore
+JUMP_INSTALLED = False
 BLACKLIST_CACHE = None
+WHITELIST_CACHE = None
+# InfiniBand MAC to EoIB MAC mapping applied with one of the caches above
+IB_MAPPING_CACHE = None
 ENABLED = True
-EMAC_REGEX = 'EMAC=([0-9a-f]{2}(:[0-9a-f]{2}){5}) IMAC=.*'
+# Number of the last filter set saved to [firewall]state_file
+GENERATION = 0
+# Event for the scheduled update, None if no update is scheduled
+_PENDING_UPDATE = None
+NEIGH_REGEX = re.compile(r'EMAC=([0-9a-f]{2}(?::[0-9a-f]{2}){5}) IMAC=(\S+)')
+# Path to an EoIB neighs file -> (its content, GUID -> EMAC mapping)
+_NEIGHS_CACHE = {}
+# Command name -> [number of calls, total time]
+_COMMAND_STATISTICS = collections.defaultdict(lambda: [0, 0.0])
+
+
+def _run(cmd, stdin=None):
+    """Run a privileged command.
+
+    The command goes through the rootwrap daemon, if it is used and the
+    command starts with ROOTWRAP_COMMAND.
+
+    :param cmd: command as a tuple
+    :param stdin: string to pass to the standard input, optional
+    :returns: tuple (exit code, combined standard output and error)
+    """
+    use_daemon = (ROOTWRAP_CLIENT is not None and
+                  cmd[:len(ROOTWRAP_COMMAND)] == ROOTWRAP_COMMAND)
+    if use_daemon:
+        cmd = cmd[len(ROOTWRAP_COMMAND):]
+    name = os.path.basename(cmd[0])
+
+    with timeutils.StopWatch() as timer:
+        if use_daemon:
+            returncode, out, err = ROOTWRAP_CLIENT.execute(list(cmd), stdin)
+            output = out + err
+        elif stdin is None:
+            try:
+                output = subprocess.check_output(
+                    cmd, stderr=subprocess.STDOUT, universal_newlines=True)
+            except subprocess.CalledProcessError as exc:
+                returncode, output = exc.returncode, exc.output
+            else:
+                returncode = 0
+        else:
+            proc = subprocess.Popen(cmd, stdin=subprocess.PIPE,
+                                    stdout=subprocess.PIPE,
+                                    stderr=subprocess.STDOUT,
+                                    universal_newlines=True)
+            output = proc.communicate(stdin)[0]
+            returncode = proc.returncode
+
+    elapsed = timer.elapsed()
+    stats = _COMMAND_STATISTICS[name]
+    stats[0] += 1
+    stats[1] += elapsed
+    LOG.debug('%(name)s finished with code %(code)s in %(time).3f seconds',
+              {'name': name, 'code': returncode, 'time': elapsed})
+    return returncode, output
+
+
+def command_statistics():
+    """Get statistics of the privileged commands run so far.
+
+    :returns: dict command name -> dict with keys ``count``, ``total_time``
+              and ``average_time`` (in seconds)
+    """
+    return {name: {'count': count, 'total_time': total,
+                   'average_time': total / count}
+            for name, (count, total) in _COMMAND_STATISTICS.items()}
 
 
-def _iptables(*args, **kwargs):
-    # NOTE(dtantsur): -w flag makes it wait for xtables lock
-    cmd = BASE_COMMAND + args
-    ignore = kwargs.pop('ignore', False)
-    LOG.debug('Running iptables %s', args)
-    kwargs['stderr'] = subprocess.STDOUT
-    try:
-        subprocess.check_output(cmd, **kwargs)
-    except subprocess.CalledProcessError as exc:
-        output = exc.output.replace('\n', '. ')
+def _execute(base_command, name, args, ignore=False):
+    cmd = base_command + args
+    LOG.debug('Running %(name)s %(args)s', {'name': name, 'args': args})
+    returncode, output = _run(cmd)
+    if returncode:
+        message = output.replace('\n', '. ')
         if ignore:
-            LOG.debug('Ignoring failed iptables %(args)s: %(output)s',
-                      {'args': args, 'output': output})
+            LOG.debug('Ignoring failed %(name)s %(args)s: %(output)s',
+                      {'name': name, 'args': args, 'output': message})
         else:
-            LOG.error(_LE('iptables %(iptables)s failed: %(exc)s'),
-                      {'iptables': args, 'exc': output})
-            raise
+            LOG.error(_LE('%(name)s %(args)s failed: %(exc)s'),
+                      {'name': name, 'args': args, 'exc': message})
+            raise subprocess.CalledProcessError(returncode, cmd, output)
+
+
+def _iptables(*args, **kwargs):
+    # NOTE(dtantsur): -w flag makes it wait for xtables lock
+    _execute(BASE_COMMAND, 'iptables', args, **kwargs)
+
+
+def _ipset(*args, **kwargs):
+    _execute(IPSET_COMMAND, 'ipset', args, **kwargs)
+
+
+def _restore(command, lines):
+    """Run a restore command passing lines to its standard input."""
+    LOG.debug('Running %(cmd)s with %(count)d lines',
+              {'cmd': command, 'count': len(lines)})
+    returncode, output = _run(command, stdin='\n'.join(lines))
+    if returncode:
+        LOG.error(_LE('%(cmd)s failed: %(exc)s'),
+                  {'cmd': command, 'exc': output.replace('\n', '. ')})
+        raise subprocess.CalledProcessError(returncode, command, output)
+
+
+def iptables_restore(lines):
+    """Apply rules to the filter table in one atomic iptables-restore call.
+
+    Existing chains and rules are kept, except for chains declared in
+    ``lines``, which are flushed. Can be used by any PXE filter driver
+    after init(), the call goes through rootwrap like all other commands.
+
+    :param lines: list of iptables-restore lines without the table header
+                  and the COMMIT line
+    :raises: subprocess.CalledProcessError on failure
+    """
+    _restore(RESTORE_COMMAND, ['*filter'] + list(lines) + ['COMMIT', ''])
+
+
+def ipset_restore(lines):
+    """Run several ipset commands in one ipset call.
+
+    Existing entries are not an error for the add commands. Can be used by
+    any PXE filter driver after init().
+
+    :param lines: list of ipset commands without the "ipset" prefix
+    :raises: subprocess.CalledProcessError on failure
+    """
+    _restore(IPSET_COMMAND + ('restore', '-exist'), list(lines) + [''])
+
+
+def _dhcp_jump(chain):
+    return ('INPUT', '-i', INTERFACE, '-p', 'udp', '--dport', '67',
+            '-j', chain)
 
 
 def init():
     """Initialize firewall management.
 
-    Must be called one on start-up.
+    Must be called one on start-up. Initializes the PXE filter driver set in
+    the configuration.
     """
     if not CONF.firewall.manage_firewall:
         return
 
+    if filter_mode() != CONF.firewall.filter_mode:
+        LOG.warning(_LW('Whitelist filter mode cannot be used together with '
+                        'node_not_found_hook, falling back to blacklist '
+                        'mode'))
+
+    plugins_base.pxe_filter_driver().init()
+    node_cache.add_state_listener(request_update)
+
+
+def clean_up():
+    """Clean up everything before exiting."""
+    if not CONF.firewall.manage_firewall:
+        return
+
+    plugins_base.pxe_filter_driver().clean_up()
+
+
+def update_filters(ironic=None):
+    """Update PXE filters for introspection.
+
+    Gives access to PXE boot port for any machine, except for those,
+    whose MAC is registered in Ironic and is not on introspection right now.
+    In whitelist mode only machines, whose MAC is on introspection right now,
+    get access.
+
+    This function is called from both introspection initialization code and
+    from periodic task. ``init()`` function must be called once before any
+    call to this function.
+
+    Does nothing, if firewall management is disabled in configuration.
+
+    :param ironic: Ironic client instance, optional.
+    """
+    if not CONF.firewall.manage_firewall:
+        return
+
+    plugins_base.pxe_filter_driver().update_filters(ironic)
+
+
+def request_update(wait=False):
+    """Schedule an update of PXE filters in the background.
+
+    The update runs ``[firewall]firewall_update_delay`` seconds after the
+    first request, all requests made in the meantime are served by it.
+
+    Does nothing, if firewall management is disabled in configuration.
+
+    :param wait: whether to wait for the scheduled update to finish. Its
+                 exception, if any, is re-raised.
+    """
+    global _PENDING_UPDATE
+
+    if not CONF.firewall.manage_firewall:
+        return
+
+    pending = _PENDING_UPDATE
+    if pending is None:
+        pending = _PENDING_UPDATE = event.Event()
+        eventlet.spawn_after(CONF.firewall.firewall_update_delay,
+                             _scheduled_update)
+
+    if wait:
+        pending.wait()
+
+
+def _scheduled_update():
+    global _PENDING_UPDATE
+
+    # NOTE(dtantsur): requests coming during the update schedule a new one,
+    # as the update may have already read the state they change.
+    pending, _PENDING_UPDATE = _PENDING_UPDATE, None
+    try:
+        update_filters()
+    except Exception as exc:
+        LOG.exception(_LE('Scheduled update of firewall rules failed'))
+        pending.send_exception(exc)
+    else:
+        pending.send()
+
+
+def should_enable_dhcp():
+    """Check whether we should enable DHCP at all.
+
+    We won't even open our DHCP if no nodes are on introspection and
+    node_not_found_hook is not set.
+    """
+    return (node_cache.introspection_active() or
+            CONF.processing.node_not_found_hook)
+
+
+def filter_mode():
+    """Get the filter mode to use.
+
+    Whitelist mode is not possible with node_not_found_hook, because MAC's
+    of unknown nodes must be allowed.
+    """
+    if CONF.processing.node_not_found_hook:
+        return 'blacklist'
+    return CONF.firewall.filter_mode
+
+
+class IptablesFilter(plugins_base.PXEFilterDriver):
+    """PXE filter driver using iptables rules on dnsmasq_interface."""
+
+    def init(self):
+        _init()
+
+    def update_filters(self, ironic=None):
+        _update_filters(ironic)
+
+    def clean_up(self):
+        _clean_up_all()
+
+
+def _init():
     global INTERFACE, CHAIN, NEW_CHAIN, BASE_COMMAND, BLACKLIST_CACHE
+    global RESTORE_COMMAND, JUMP_INSTALLED, IPSET_COMMAND, IPSET
+    global IPSET_ENTRIES, WHITELIST_CACHE, IB_MAPPING_CACHE
+    global ROOTWRAP_COMMAND, ROOTWRAP_CLIENT
     BLACKLIST_CACHE = None
+    WHITELIST_CACHE = None
+    IB_MAPPING_CACHE = None
+    JUMP_INSTALLED = False
+    IPSET_ENTRIES = None
+    IPSET = CONF.firewall.ipset_name
     INTERFACE = CONF.firewall.dnsmasq_interface
     CHAIN = CONF.firewall.firewall_chain
     NEW_CHAIN = CHAIN + '_temp'
-    BASE_COMMAND = ('sudo', 'ironic-inspector-rootwrap',
-                    CONF.rootwrap_config, 'iptables',)
+    ROOTWRAP_COMMAND = ('sudo', 'ironic-inspector-rootwrap',
+                        CONF.rootwrap_config)
+    BASE_COMMAND = ROOTWRAP_COMMAND + ('iptables',)
+    RESTORE_COMMAND = ROOTWRAP_COMMAND + ('iptables-restore', '--noflush')
+    IPSET_COMMAND = ROOTWRAP_COMMAND + ('ipset',)
+    if CONF.firewall.use_rootwrap_daemon:
+        ROOTWRAP_CLIENT = rootwrap_client.Client(
+            ['sudo', 'ironic-inspector-rootwrap-daemon',
+             CONF.rootwrap_config])
+    else:
+        ROOTWRAP_CLIENT = None
 
     # -w flag makes iptables wait for xtables lock, but it's not supported
-    # everywhere yet
-    try:
-        with open(os.devnull, 'wb') as null:
-            subprocess.check_call(BASE_COMMAND + ('-w', '-h'),
-                                  stderr=null, stdout=null)
-    except subprocess.CalledProcessError:
+    # everywhere yet. The first command also starts the rootwrap daemon.
+    if not _iptables_supports_wait():
         LOG.warning(_LW('iptables does not support -w flag, please update '
                         'it to at least version 1.4.21'))
     else:
         BASE_COMMAND += ('-w',)
 
-    _clean_up(CHAIN)
-    # Not really needed, but helps to validate that we have access to iptables
-    _iptables('-N', CHAIN)
+    state = _load_state()
+    if state is not None and _verify_state(state):
+        _adopt_state(state)
+    else:
+        _clean_up(CHAIN)
+        # Not really needed, but helps to validate that we have access to
+        # iptables
+        _iptables('-N', CHAIN)
+
+    if CONF.firewall.firewall_backend == 'ipset':
+        _ipset('create', IPSET, 'hash:mac', '-exist')
+
+
+def _iptables_supports_wait():
+    cmd = BASE_COMMAND + ('-w', '-h')
+    if ROOTWRAP_CLIENT is not None:
+        return _run(cmd)[0] == 0
+
+    try:
+        with open(os.devnull, 'wb') as null:
+            subprocess.check_call(cmd, stderr=null, stdout=null)
+    except subprocess.CalledProcessError:
+        return False
+    return True
 
 
 def _clean_up(chain):
-    _iptables('-D', 'INPUT', '-i', INTERFACE, '-p', 'udp',
-              '--dport', '67', '-j', chain,
-              ignore=True)
+    _iptables('-D', *_dhcp_jump(chain), ignore=True)
     _iptables('-F', chain, ignore=True)
     _iptables('-X', chain, ignore=True)
 
 
-def clean_up():
-    """Clean up everything before exiting."""
-    if not CONF.firewall.manage_firewall:
+def _clean_up_all():
+    if CONF.firewall.state_file:
+        LOG.info(_LI('Keeping the firewall chain %s for the next start'),
+                 CHAIN)
         return
 
     _clean_up(CHAIN)
     _clean_up(NEW_CHAIN)
+    if CONF.firewall.firewall_backend == 'ipset':
+        _ipset('destroy', IPSET, ignore=True)
 
 
-def _should_enable_dhcp():
-    """Check whether we should enable DHCP at all.
+def _save_state(mode, macs, ib_mac_mapping):
+    """Save the applied filter set to [firewall]state_file.
 
-    We won't even open our DHCP if no nodes are on introspection and
-    node_not_found_hook is not set.
+    :param mode: "blacklist", "whitelist" or "disabled"
+    :param macs: set of MAC addresses before applying the InfiniBand mapping
+    :param ib_mac_mapping: InfiniBand MAC to EoIB MAC mapping
     """
-    return (node_cache.introspection_active() or
-            CONF.processing.node_not_found_hook)
+    global GENERATION
+
+    path = CONF.firewall.state_file
+    if not path:
+        return
+
+    GENERATION += 1
+    state = {'generation': GENERATION,
+             'backend': CONF.firewall.firewall_backend,
+             'chain': CHAIN,
+             'interface': INTERFACE,
+             'ipset': IPSET,
+             'mode': mode,
+             'macs': sorted(macs),
+             'ib_mapping': ib_mac_mapping}
+    tmp_path = path + '.tmp'
+    try:
+        with open(tmp_path, 'w') as fp:
+            json.dump(state, fp)
+        os.rename(tmp_path, path)
+    except (IOError, OSError) as exc:
+        LOG.warning(_LW('Failed to save firewall state to %(path)s: '
+                        '%(exc)s'), {'path': path, 'exc': exc})
+
+
+def _load_state():
+    """Load the filter set saved by a previous run.
+
+    :returns: the state as a dict or None if it is missing or was saved
+              with a different configuration
+    """
+    path = CONF.firewall.state_file
+    if not path:
+        return None
+
+    try:
+        with open(path) as fp:
+            state = json.load(fp)
+    except (IOError, OSError, ValueError) as exc:
+        if getattr(exc, 'errno', None) != errno.ENOENT:
+            LOG.warning(_LW('Failed to load firewall state from %(path)s: '
+                            '%(exc)s'), {'path': path, 'exc': exc})
+        return None
+
+    expected = {'backend': CONF.firewall.firewall_backend,
+                'chain': CHAIN,
+                'interface': INTERFACE,
+                'ipset': IPSET}
+    if (any(state.get(key) != value for key, value in expected.items()) or
+            state.get('mode') not in ('disabled', filter_mode())):
+        LOG.info(_LI('Firewall state in %s was saved with a different '
+                     'configuration, not using it'), path)
+        return None
+
+    return state
+
+
+def _applied_macs(state):
+    return {(state['ib_mapping'].get(mac) or mac).lower()
+            for mac in state['macs']}
+
+
+def _verify_state(state):
+    """Check that the chain and the ipset match the saved state."""
+    if _run(BASE_COMMAND + ('-C',) + _dhcp_jump(CHAIN))[0]:
+        LOG.info(_LI('The rule jumping to chain %s is missing, rebuilding '
+                     'the firewall'), CHAIN)
+        return False
+
+    code, output = _run(BASE_COMMAND + ('-S', CHAIN))
+    if code:
+        LOG.info(_LI('Chain %s is missing, rebuilding the firewall'), CHAIN)
+        return False
+    rules = [line for line in output.splitlines() if line.startswith('-A ')]
+
+    macs = _applied_macs(state)
+    if state['mode'] == 'disabled':
+        expected_rules, found = 1, set()
+    elif CONF.firewall.firewall_backend == 'ipset':
+        expected_rules = 2
+        code, output = _run(IPSET_COMMAND + ('list', IPSET))
+        if code:
+            LOG.info(_LI('ipset %s is missing, rebuilding the firewall'),
+                     IPSET)
+            return False
+        members = output.split('Members:', 1)[-1].split()
+        found = {mac.lower() for mac in members}
+    else:
+        expected_rules = len(macs) + 1
+        found = {mac.lower() for mac in
+                 re.findall(r'--mac-source (\S+)', '\n'.join(rules))}
+
+    if len(rules) != expected_rules or found != macs:
+        LOG.info(_LI('Chain %s does not match the saved state, rebuilding '
+                     'the firewall'), CHAIN)
+        return False
+
+    return True
+
+
+def _adopt_state(state):
+    """Use the existing chain and ipset created by a previous run."""
+    global ENABLED, BLACKLIST_CACHE, WHITELIST_CACHE, IB_MAPPING_CACHE
+    global IPSET_ENTRIES, JUMP_INSTALLED, GENERATION
+
+    GENERATION = state['generation']
+    JUMP_INSTALLED = True
+    ENABLED = state['mode'] != 'disabled'
+    if ENABLED:
+        macs = set(state['macs'])
+        if state['mode'] == 'whitelist':
+            WHITELIST_CACHE = macs
+        else:
+            BLACKLIST_CACHE = macs
+        IB_MAPPING_CACHE = state['ib_mapping']
+        IPSET_ENTRIES = {state['ib_mapping'].get(mac) or mac
+                         for mac in macs}
+    LOG.info(_LI('Using the existing firewall chain %(chain)s with '
+                 '%(mode)s of generation %(gen)d'),
+             {'chain': CHAIN, 'mode': state['mode'], 'gen': GENERATION})
 
 
 @contextlib.contextmanager
@@ -126,11 +529,8 @@ def _temporary_chain(chain, main_chain):
     yield
 
     # Swap chains
-    _iptables('-I', 'INPUT', '-i', INTERFACE, '-p', 'udp',
-              '--dport', '67', '-j', chain)
-    _iptables('-D', 'INPUT', '-i', INTERFACE, '-p', 'udp',
-              '--dport', '67', '-j', main_chain,
-              ignore=True)
+    _iptables('-I', *_dhcp_jump(chain))
+    _iptables('-D', *_dhcp_jump(main_chain), ignore=True)
     _iptables('-F', main_chain, ignore=True)
     _iptables('-X', main_chain, ignore=True)
     _iptables('-E', chain, main_chain)
@@ -138,7 +538,7 @@ def _temporary_chain(chain, main_chain):
 
 def _disable_dhcp():
     """Disable DHCP completely."""
-    global ENABLED, BLACKLIST_CACHE
+    global ENABLED, BLACKLIST_CACHE, WHITELIST_CACHE, IB_MAPPING_CACHE
 
     if not ENABLED:
         LOG.debug('DHCP is already disabled, not updating')
@@ -147,71 +547,173 @@ def _disable_dhcp():
     LOG.debug('No nodes on introspection and node_not_found_hook is '
               'not set - disabling DHCP')
     BLACKLIST_CACHE = None
-    with _temporary_chain(NEW_CHAIN, CHAIN):
-        # Blacklist everything
-        _iptables('-A', NEW_CHAIN, '-j', 'REJECT')
+    WHITELIST_CACHE = None
+    IB_MAPPING_CACHE = None
+    # Blacklist everything
+    _replace_chain([('-j', 'REJECT')])
 
     ENABLED = False
+    _save_state('disabled', set(), {})
 
 
-def update_filters(ironic=None):
-    """Update firewall filter rules for introspection.
-
-    Gives access to PXE boot port for any machine, except for those,
-    whose MAC is registered in Ironic and is not on introspection right now.
+def _replace_chain(rules):
+    """Replace all rules in the chain with the given ones.
 
-    This function is called from both introspection initialization code and
-    from periodic task. This function is supposed to be resistant to unexpected
-    iptables state.
+    :param rules: list of tuples with iptables arguments for each rule
+    """
+    global JUMP_INSTALLED
+
+    if CONF.firewall.firewall_backend == 'iptables-restore':
+        # NOTE(dtantsur): declaring an existing chain flushes it
+        lines = [':%s - [0:0]' % CHAIN]
+        lines.extend(' '.join(('-A', CHAIN) + rule) for rule in rules)
+        if not JUMP_INSTALLED:
+            lines.append(' '.join(('-I',) + _dhcp_jump(CHAIN)))
+        iptables_restore(lines)
+        JUMP_INSTALLED = True
+    else:
+        with _temporary_chain(NEW_CHAIN, CHAIN):
+            for rule in rules:
+                _iptables('-A', NEW_CHAIN, *rule)
 
-    ``init()`` function must be called once before any call to this function.
-    This function is using ``eventlet`` semaphore to serialize access from
-    different green threads.
 
-    Does nothing, if firewall management is disabled in configuration.
+def _update_filters(ironic=None):
+    """Update iptables rules.
 
-    :param ironic: Ironic client instance, optional.
+    This function is supposed to be resistant to unexpected iptables state.
+    It is using ``eventlet`` semaphore to serialize access from different
+    green threads.
     """
-    global BLACKLIST_CACHE, ENABLED
-
-    if not CONF.firewall.manage_firewall:
-        return
-
     assert INTERFACE is not None
     ironic = ir_utils.get_client() if ironic is None else ironic
     with LOCK:
-        if not _should_enable_dhcp():
+        if not should_enable_dhcp():
             _disable_dhcp()
             return
 
-        ports_active = ironic.port.list(limit=0, fields=['address', 'extra'])
-        macs_active = set(p.address for p in ports_active)
-        to_blacklist = macs_active - node_cache.active_macs()
-        ib_mac_mapping = (
-            _ib_mac_to_rmac_mapping(to_blacklist, ports_active))
+        if filter_mode() == 'whitelist':
+            _update_whitelist(ironic)
+        else:
+            _update_blacklist(ironic)
 
-        if (BLACKLIST_CACHE is not None and
-                to_blacklist == BLACKLIST_CACHE and not ib_mac_mapping):
-            LOG.debug('Not updating iptables - no changes in MAC list %s',
-                      to_blacklist)
-            return
 
-        LOG.debug('Blacklisting active MAC\'s %s', to_blacklist)
-        # Force update on the next iteration if this attempt fails
-        BLACKLIST_CACHE = None
+def _update_blacklist(ironic):
+    global BLACKLIST_CACHE, ENABLED, IB_MAPPING_CACHE
 
-        with _temporary_chain(NEW_CHAIN, CHAIN):
-            # - Blacklist active macs, so that nova can boot them
-            for mac in to_blacklist:
-                mac = ib_mac_mapping.get(mac) or mac
-                _iptables('-A', NEW_CHAIN, '-m', 'mac',
-                          '--mac-source', mac, '-j', 'DROP')
-            # - Whitelist everything else
-            _iptables('-A', NEW_CHAIN, '-j', 'ACCEPT')
+    ports_active = port_cache.ports(ironic)
+    macs_active = set(p.address for p in ports_active)
+    to_blacklist = macs_active - node_cache.active_macs()
+    ib_mac_mapping = (
+        _ib_mac_to_rmac_mapping(to_blacklist, ports_active))
+
+    if (BLACKLIST_CACHE is not None and to_blacklist == BLACKLIST_CACHE and
+            ib_mac_mapping == IB_MAPPING_CACHE):
+        LOG.debug('Not updating iptables - no changes in MAC list %s',
+                  to_blacklist)
+        return
+
+    LOG.debug('Blacklisting active MAC\'s %s', to_blacklist)
+    # Force update on the next iteration if this attempt fails
+    BLACKLIST_CACHE = None
+
+    # - Blacklist active macs, so that nova can boot them
+    # - Whitelist everything else
+    _apply_filter({ib_mac_mapping.get(mac) or mac for mac in to_blacklist},
+                  whitelist=False)
+
+    # Cache result of successful iptables update
+    ENABLED = True
+    BLACKLIST_CACHE = to_blacklist
+    IB_MAPPING_CACHE = ib_mac_mapping
+    _save_state('blacklist', to_blacklist, ib_mac_mapping)
+
+
+def _update_whitelist(ironic):
+    global WHITELIST_CACHE, ENABLED, IB_MAPPING_CACHE
+
+    to_whitelist = node_cache.active_macs()
+    ib_mac_mapping = {}
+    if CONF.firewall.ethoib_interfaces and to_whitelist:
+        # NOTE(dtantsur): only fetch ports that are needed for the mapping
+        ports = [port for mac in to_whitelist
+                 for port in ironic.port.list(address=mac,
+                                              fields=['address', 'extra'])]
+        ib_mac_mapping = _ib_mac_to_rmac_mapping(to_whitelist, ports)
+
+    if (WHITELIST_CACHE is not None and to_whitelist == WHITELIST_CACHE and
+            ib_mac_mapping == IB_MAPPING_CACHE):
+        LOG.debug('Not updating iptables - no changes in MAC list %s',
+                  to_whitelist)
+        return
+
+    LOG.debug('Whitelisting MAC\'s on introspection %s', to_whitelist)
+    # Force update on the next iteration if this attempt fails
+    WHITELIST_CACHE = None
+
+    _apply_filter({ib_mac_mapping.get(mac) or mac for mac in to_whitelist},
+                  whitelist=True)
 
-        # Cache result of successful iptables update
-        ENABLED = True
-        BLACKLIST_CACHE = to_blacklist
+    ENABLED = True
+    WHITELIST_CACHE = to_whitelist
+    IB_MAPPING_CACHE = ib_mac_mapping
+    _save_state('whitelist', to_whitelist, ib_mac_mapping)
+
+
+def _apply_filter(macs, whitelist):
+    """Fill the chain with rules for the given MAC's.
+
+    :param macs: set of MAC addresses
+    :param whitelist: if True, only the given MAC's are accepted, otherwise
+                      only they are dropped
+    """
+    target, default = ('ACCEPT', 'DROP') if whitelist else ('DROP', 'ACCEPT')
+    if CONF.firewall.firewall_backend == 'ipset':
+        _update_ipset(macs, target, default)
+    else:
+        rules = [('-m', 'mac', '--mac-source', mac, '-j', target)
+                 for mac in macs]
+        rules.append(('-j', default))
+        _replace_chain(rules)
+
+
+def _update_ipset(macs, target, default):
+    """Update the ipset with MAC addresses.
+
+    Only changed MAC addresses are added or removed. The whole ipset and the
+    chain referencing it are rebuilt if the previous state is unknown or
+    DHCP was disabled.
+
+    :param macs: set of MAC addresses
+    :param target: iptables target for packets from the given MAC's
+    :param default: iptables target for other packets
+    """
+    global IPSET_ENTRIES
+
+    if IPSET_ENTRIES is None or not ENABLED:
+        LOG.debug('Rebuilding ipset %(ipset)s with MAC\'s %(macs)s',
+                  {'ipset': IPSET, 'macs': macs})
+        IPSET_ENTRIES = None
+        ipset_restore(['flush %s' % IPSET] +
+                      ['add %s %s' % (IPSET, mac) for mac in macs])
+        _replace_chain([('-m', 'set', '--match-set', IPSET, 'src',
+                         '-j', target),
+                        ('-j', default)])
+        IPSET_ENTRIES = macs
+        return
+
+    to_remove = IPSET_ENTRIES - macs
+    to_add = macs - IPSET_ENTRIES
+    if not to_remove and not to_add:
+        return
+
+    LOG.debug('Updating ipset %(ipset)s, adding %(add)s, removing '
+              '%(remove)s', {'ipset': IPSET, 'add': to_add,
+                             'remove': to_remove})
+    # Force a rebuild on the next iteration if this attempt fails
+    IPSET_ENTRIES = None
+    ipset_restore(['del %s %s' % (IPSET, mac) for mac in to_remove] +
+                  ['add %s %s' % (IPSET, mac) for mac in to_add])
+    IPSET_ENTRIES = macs
 
 
 def _ib_mac_to_rmac_mapping(blacklist_macs, ports_active):
@@ -235,15 +737,8 @@ def _ib_mac_to_rmac_mapping(blacklist_macs, ports_active):
     ethoib_interfaces = CONF.firewall.ethoib_interfaces
     ib_mac_to_remote_mac = {}
     for interface in ethoib_interfaces:
-        neighs_file = (
-            os.path.join('/sys/class/net', interface, 'eth/neighs'))
-        try:
-            with open(neighs_file, 'r') as fd:
-                data = fd.read()
-        except IOError:
-            LOG.error(
-                _LE('Interface %s is not Ethernet Over InfiniBand; '
-                    'Skipping ...'), interface)
+        neighs = _eoib_neighs(interface)
+        if neighs is None:
             continue
         for port in ports_active:
             if port.address in blacklist_macs:
@@ -251,9 +746,41 @@ def _ib_mac_to_rmac_mapping(blacklist_macs, ports_active):
                 if client_id:
                     # Note(moshele): The last 8 bytes in the client-id is
                     # the baremetal node InfiniBand GUID
-                    guid = client_id[-23:]
-                    p = re.compile(EMAC_REGEX + guid)
-                    match = p.search(data)
-                    if match:
-                        ib_mac_to_remote_mac[port.address] = match.group(1)
+                    remote_mac = neighs.get(client_id[-23:])
+                    if remote_mac:
+                        ib_mac_to_remote_mac[port.address] = remote_mac
     return ib_mac_to_remote_mac
+
+
+def _eoib_neighs(interface):
+    """Get the GUID to EoIB MAC mapping of an interface.
+
+    The neighs file is parsed again only when its content changes. Its
+    modification time and size cannot be used for that, as sysfs does not
+    update them.
+
+    :param interface: EoIB interface name
+    :return: dict GUID -> EoIB MAC, None if the interface is not EoIB
+    """
+    neighs_file = (
+        os.path.join('/sys/class/net', interface, 'eth/neighs'))
+    try:
+        with open(neighs_file, 'r') as fd:
+            data = fd.read()
+    except IOError:
+        LOG.error(
+            _LE('Interface %s is not Ethernet Over InfiniBand; '
+                'Skipping ...'), interface)
+        return None
+
+    cached = _NEIGHS_CACHE.get(neighs_file)
+    if cached is not None and cached[0] == data:
+        return cached[1]
+
+    neighs = {}
+    for match in NEIGH_REGEX.finditer(data):
+        # NOTE(dtantsur): the GUID is the last 8 bytes of the IMAC, the first
+        # line with it is used, if there are several.
+        neighs.setdefault(match.group(2)[-23:], match.group(1))
+    _NEIGHS_CACHE[neighs_file] = (data, neighs)
+    return neighs
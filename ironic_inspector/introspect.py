@@ -35,6 +35,8 @@ PASSWORD_ACCEPTED_CHARS = set(string.ascii_letters + string.digits)
 PASSWORD_MAX_LENGTH = 20  # IPMI v2.0
 
 _LAST_INTROSPECTION_TIME = 0
+# Node fields used when starting introspection
+_NODE_FIELDS = ['uuid', 'provision_state', 'driver_info']
 _LAST_INTROSPECTION_LOCK = semaphore.BoundedSemaphore()
 
 
@@ -73,7 +75,7 @@ def introspect(node_id, new_ipmi_credentials=None, token=None):
     :raises: Error
     """
     ironic = ir_utils.get_client(token)
-    node = ir_utils.get_node(node_id, ironic=ironic)
+    node = ir_utils.get_node(node_id, ironic=ironic, fields=_NODE_FIELDS)
 
     ir_utils.check_provision_state(node, with_credentials=new_ipmi_credentials)
 
@@ -112,7 +114,8 @@ def _background_introspect(ironic, node_info):
     global _LAST_INTROSPECTION_TIME
 
     if not node_info.options.get('new_ipmi_credentials'):
-        if re.match(CONF.introspection_delay_drivers, node_info.node().driver):
+        driver = node_info.node(fields=['driver']).driver
+        if re.match(CONF.introspection_delay_drivers, driver):
             LOG.debug('Attempting to acquire lock on last introspection time')
             with _LAST_INTROSPECTION_LOCK:
                 delay = (_LAST_INTROSPECTION_TIME - time.time()
@@ -138,7 +141,8 @@ def _background_introspect_locked(node_info, ironic):
         node_info.add_attribute(node_cache.MACS_ATTRIBUTE, macs)
         LOG.info(_LI('Whitelisting MAC\'s %s on the firewall'), macs,
                  node_info=node_info)
-        firewall.update_filters(ironic)
+        # NOTE(dtantsur): the node must not be blocked when it boots
+        firewall.request_update(wait=True)
 
     attrs = node_info.attributes
     if CONF.processing.node_not_found_hook is None and not attrs:
@@ -213,14 +217,7 @@ def _abort(node_info, ironic):
         LOG.warning(_LW('Failed to power off node: %s'), exc,
                     node_info=node_info)
 
+    # NOTE(dtantsur): this also schedules blocking the node from PXE booting
+    # the introspection image
     node_info.finished(error=_('Canceled by operator'))
-
-    # block this node from PXE Booting the introspection image
-    try:
-        firewall.update_filters(ironic)
-    except Exception as exc:
-        # Note(mkovacik): this will be retried in firewall update
-        # periodic task; we continue aborting
-        LOG.warning(_LW('Failed to update firewall filters: %s'), exc,
-                    node_info=node_info)
     LOG.info(_LI('Introspection aborted'), node_info=node_info)
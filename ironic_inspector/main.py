@@ -14,7 +14,10 @@
 import eventlet  # noqa
 eventlet.monkey_patch()
 
+import collections
 import functools
+import hashlib
+import json
 import os
 import re
 import ssl
@@ -25,6 +28,7 @@ from futurist import periodics
 from oslo_config import cfg
 from oslo_log import log
 from oslo_utils import uuidutils
+import six
 import werkzeug
 
 from ironic_inspector import api_tools
@@ -51,8 +55,14 @@ MINIMUM_API_VERSION = (1, 0)
 # TODO(dtantsur): set to the current version as soon we move setting IPMI
 # credentials support completely.
 DEFAULT_API_VERSION = (1, 8)
-CURRENT_API_VERSION = (1, 9)
+CURRENT_API_VERSION = (1, 13)
 _LOGGING_EXCLUDED_KEYS = ('logs',)
+# Compression of stored data -> HTTP content coding
+_HTTP_ENCODINGS = {'gzip': 'gzip', 'zlib': 'deflate'}
+# (node UUID, ETag) -> parsed introspection data, the least recently used
+# first
+_PARSED_DATA = collections.OrderedDict()
+_MAX_PARSED_DATA = 16
 
 
 def _get_version():
@@ -266,12 +276,42 @@ def api_introspection_abort(node_id):
 def api_introspection_data(node_id):
     utils.check_auth(flask.request)
 
-    if CONF.processing.store_data == 'swift':
-        if not uuidutils.is_uuid_like(node_id):
-            node = ir_utils.get_node(node_id, fields=['uuid'])
-            node_id = node.uuid
-        res = swift.get_introspection_data(node_id)
-        return res, 200, {'Content-Type': 'application/json'}
+    if CONF.processing.store_data != 'none':
+        fields = flask.request.args.getlist('fields')
+        # NOTE(dtantsur): validate paths before fetching anything
+        expressions = [rules.parse_data_path(field) for field in fields]
+        node_id = ir_utils.get_node_uuid(node_id)
+        store = plugins_base.introspection_data_store()
+        if fields:
+            return _project_data(node_id, store, fields, expressions)
+
+        stored = store.get_stream(node_id)
+
+        body, length, etag = stored.body, stored.length, stored.etag
+        headers = {'Content-Type': 'application/json',
+                   'Vary': 'Accept-Encoding'}
+        if stored.encoding:
+            http_encoding = _HTTP_ENCODINGS.get(stored.encoding)
+            if (http_encoding and
+                    flask.request.accept_encodings.quality(http_encoding)):
+                headers['Content-Encoding'] = http_encoding
+            else:
+                body = swift.decompress_stream(body, stored.encoding)
+                length = None
+                etag = '%s-decoded' % etag
+
+        response = flask.Response(body, 200, headers)
+        # NOTE(dtantsur): do not read the whole body into memory to
+        # calculate its length
+        response.implicit_sequence_conversion = False
+        # NOTE(dtantsur): the body is not read for 304 responses or when the
+        # client disconnects, close the stream to release its resources.
+        if hasattr(stored.body, 'close'):
+            response.call_on_close(stored.body.close)
+        if length is not None:
+            response.content_length = length
+        response.set_etag(etag)
+        return response.make_conditional(flask.request)
     else:
         return error_response(_('Inspector is not configured to store data. '
                                 'Set the [processing] store_data '
@@ -279,6 +319,51 @@ def api_introspection_data(node_id):
                               code=404)
 
 
+def _parsed_data(node_uuid, store):
+    """Get parsed introspection data, reusing it while its ETag is the same.
+
+    The stored data is only read on cache misses.
+
+    :returns: tuple (data, etag)
+    """
+    etag = store.get_etag(node_uuid)
+    data = _PARSED_DATA.pop((node_uuid, etag), None) if etag else None
+
+    if data is None:
+        stored = store.get_stream(node_uuid)
+        etag = stored.etag
+        try:
+            # NOTE(dtantsur): stores that cannot provide the tag in advance
+            # still benefit from the cache by the tag of the stream.
+            data = _PARSED_DATA.pop((node_uuid, etag), None)
+            if data is None:
+                body = stored.body
+                if stored.encoding:
+                    body = swift.decompress_stream(body, stored.encoding)
+                data = json.loads(b''.join(body).decode('utf-8'))
+        finally:
+            if hasattr(stored.body, 'close'):
+                stored.body.close()
+
+    while len(_PARSED_DATA) >= _MAX_PARSED_DATA:
+        _PARSED_DATA.popitem(last=False)
+    _PARSED_DATA[(node_uuid, etag)] = data
+    return data, etag
+
+
+def _project_data(node_uuid, store, fields, expressions):
+    """Build a response with only the requested fields of the data."""
+    data, etag = _parsed_data(node_uuid, store)
+    result = {field: [match.value for match in expr.find(data)]
+              for field, expr in zip(fields, expressions)}
+
+    response = flask.json.jsonify(result)
+    fields_hash = hashlib.md5(
+        '\n'.join(fields).encode('utf-8')).hexdigest()
+    response.set_etag('%s-%s' % (etag, fields_hash))
+    return response.make_conditional(flask.request)
+
+
 @app.route('/v1/introspection/<node_id>/data/unprocessed', methods=['POST'])
 @convert_exceptions
 def api_introspection_reapply(node_id):
@@ -288,7 +373,7 @@ def api_introspection_reapply(node_id):
         return error_response(_('User data processing is not '
                                 'supported yet'), code=400)
 
-    if CONF.processing.store_data == 'swift':
+    if CONF.processing.store_data != 'none':
         process.reapply(node_id)
         return '', 202
     else:
@@ -333,6 +418,55 @@ def api_rules():
             flask.jsonify(rule_repr(rule, short=False)), response_code)
 
 
+@app.route('/v1/rules/import', methods=['POST'])
+@convert_exceptions
+def api_rules_import():
+    utils.check_auth(flask.request)
+
+    body = flask.request.get_json(force=True)
+    if not isinstance(body, dict):
+        raise utils.Error(_('Request body must be a JSON object'), code=400)
+
+    imported = rules.import_rules(body.get('rules'),
+                                  replace=bool(body.get('replace')))
+    res = [rule_repr(rule, short=True) for rule in imported]
+    return flask.jsonify(rules=res)
+
+
+@app.route('/v1/rules/export', methods=['GET'])
+@convert_exceptions
+def api_rules_export():
+    utils.check_auth(flask.request)
+
+    def _generate():
+        yield '{"rules": ['
+        for idx, rule in enumerate(rules.export_rules()):
+            yield (', ' if idx else '') + json.dumps(rule.as_dict())
+        yield ']}'
+
+    return flask.Response(flask.stream_with_context(_generate()),
+                          mimetype='application/json')
+
+
+@app.route('/v1/rules/dry-run', methods=['POST'])
+@convert_exceptions
+def api_rules_dry_run():
+    utils.check_auth(flask.request)
+
+    body = flask.request.get_json(force=True)
+    if not isinstance(body, dict):
+        raise utils.Error(_('Request body must be a JSON object'), code=400)
+
+    nodes = body.get('nodes')
+    if (not isinstance(nodes, list) or not nodes or
+            not all(isinstance(node, six.string_types) for node in nodes)):
+        raise utils.Error(_('A non-empty list of node UUIDs or names is '
+                            'required in the "nodes" field'), code=400)
+
+    uuids = [ir_utils.get_node_uuid(node) for node in nodes]
+    return flask.jsonify(rules.dry_run(body.get('conditions', []), uuids))
+
+
 @app.route('/v1/rules/<uuid>', methods=['GET', 'DELETE'])
 @convert_exceptions
 def api_rule(uuid):
@@ -346,6 +480,15 @@ def api_rule(uuid):
         return '', 204
 
 
+@app.route('/v1/rules/<uuid>/statistics', methods=['GET'])
+@convert_exceptions
+def api_rule_statistics(uuid):
+    utils.check_auth(flask.request)
+
+    rule = rules.get(uuid)
+    return flask.jsonify(rule.statistics())
+
+
 @app.errorhandler(404)
 def handle_404(error):
     return error_response(error, code=404)
@@ -360,19 +503,24 @@ def periodic_update():  # pragma: no cover
 
 def periodic_clean_up():  # pragma: no cover
     try:
-        if node_cache.clean_up():
-            firewall.update_filters()
-        sync_with_ironic()
+        node_cache.clean_up()
+        node_cache.check_deleted_nodes()
     except Exception:
         LOG.exception(_LE('Periodic clean up of node cache failed'))
 
 
-def sync_with_ironic():
-    ironic = ir_utils.get_client()
-    # TODO(yuikotakada): pagination
-    ironic_nodes = ironic.node.list(limit=0)
-    ironic_node_uuids = {node.uuid for node in ironic_nodes}
-    node_cache.delete_nodes_not_in_list(ironic_node_uuids)
+def periodic_sync():  # pragma: no cover
+    try:
+        node_cache.sync_with_ironic()
+    except Exception:
+        LOG.exception(_LE('Periodic synchronization with Ironic failed'))
+
+
+def periodic_statistics():  # pragma: no cover
+    try:
+        ir_utils.log_statistics()
+    except Exception:
+        LOG.exception(_LE('Periodic logging of statistics failed'))
 
 
 def create_ssl_context():
@@ -442,6 +590,9 @@ class Service(object):
         elif CONF.processing.store_data == 'swift':
             LOG.info(_LI('Introspection data will be stored in Swift in the '
                          'container %s'), CONF.swift.container)
+        else:
+            LOG.info(_LI('Introspection data will be stored by the %s '
+                         'driver'), CONF.processing.store_data)
 
         utils.add_cors_middleware(app)
 
@@ -459,6 +610,15 @@ class Service(object):
 
         LOG.info(_LI('Enabled processing hooks: %s'), hooks)
 
+        try:
+            plugins_base.introspection_data_store()
+        except Exception as exc:
+            LOG.critical(_LC('Introspection data store "%(store)s" failed to '
+                             'load or was not found, check the '
+                             '[processing]store_data option: %(exc)s'),
+                         {'store': CONF.processing.store_data, 'exc': exc})
+            sys.exit(1)
+
         if CONF.firewall.manage_firewall:
             firewall.init()
 
@@ -469,10 +629,20 @@ class Service(object):
         periodic_clean_up_ = periodics.periodic(
             spacing=CONF.clean_up_period
         )(periodic_clean_up)
+        periodic_sync_ = periodics.periodic(
+            spacing=CONF.ironic_sync_period,
+            enabled=CONF.ironic_sync_period > 0
+        )(periodic_sync)
+        periodic_statistics_ = periodics.periodic(
+            spacing=CONF.statistics_log_period,
+            enabled=CONF.statistics_log_period > 0
+        )(periodic_statistics)
 
         self._periodics_worker = periodics.PeriodicWorker(
             callables=[(periodic_update_, None, None),
-                       (periodic_clean_up_, None, None)],
+                       (periodic_clean_up_, None, None),
+                       (periodic_sync_, None, None),
+                       (periodic_statistics_, None, None)],
             executor_factory=periodics.ExistingExecutor(utils.executor()))
         utils.executor().submit(self._periodics_worker.start)
 
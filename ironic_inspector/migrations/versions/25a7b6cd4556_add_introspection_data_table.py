@@ -0,0 +1,42 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Add introspection data table
+
+Revision ID: 25a7b6cd4556
+Revises: 882b2d84cb1b
+Create Date: 2017-03-20 14:05:41.118620
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '25a7b6cd4556'
+down_revision = '882b2d84cb1b'
+branch_labels = None
+depends_on = None
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import mysql
+
+
+def upgrade():
+    op.create_table(
+        'introspection_data',
+        sa.Column('uuid', sa.String(36), sa.ForeignKey('nodes.uuid'),
+                  primary_key=True),
+        sa.Column('processed', sa.Boolean, primary_key=True, default=False),
+        sa.Column('data', sa.Text().with_variant(mysql.LONGTEXT(), 'mysql'),
+                  nullable=False),
+        mysql_ENGINE='InnoDB',
+        mysql_DEFAULT_CHARSET='UTF8'
+    )
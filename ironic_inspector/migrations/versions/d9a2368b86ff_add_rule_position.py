@@ -0,0 +1,47 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Add position to rules
+
+Revision ID: d9a2368b86ff
+Revises: 25a7b6cd4556
+Create Date: 2017-03-27 11:20:14.503361
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'd9a2368b86ff'
+down_revision = '25a7b6cd4556'
+branch_labels = None
+depends_on = None
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import sql
+
+
+Rule = sql.table('rules',
+                 sql.column('uuid', sa.String),
+                 sql.column('created_at', sa.DateTime),
+                 sql.column('position', sa.Integer))
+
+
+def upgrade():
+    op.add_column('rules', sa.Column('position', sa.Integer, nullable=False,
+                                     server_default=sa.text('0')))
+    # keep the existing order of application, which was the creation order
+    connection = op.get_bind()
+    uuids = [row[0] for row in connection.execute(
+        sql.select([Rule.c.uuid]).order_by(Rule.c.created_at, Rule.c.uuid))]
+    for position, uuid in enumerate(uuids):
+        op.execute(Rule.update().where(Rule.c.uuid == uuid).values(
+            {'position': op.inline_literal(position)}))
@@ -36,6 +36,7 @@ from ironic_inspector import db
 from ironic_inspector.common.i18n import _, _LE, _LW, _LI
 from ironic_inspector.common import ironic as ir_utils
 from ironic_inspector import introspection_state as istate
+from ironic_inspector import port_cache
 from ironic_inspector import utils
 
 
@@ -48,6 +49,30 @@ LOG = utils.getProcessingLogger(__name__)
 MACS_ATTRIBUTE = 'mac'
 _LOCK_TEMPLATE = 'node-%s'
 _SEMAPHORES = lockutils.Semaphores()
+_STATE_LISTENERS = []
+_SYNC_PAGE_SIZE = 1000
+# UUIDs of cached nodes still to be checked for removal from Ironic
+_REMOVAL_CHECK_QUEUE = collections.deque()
+
+
+def add_state_listener(callback):
+    """Register a callback for changes of nodes on introspection.
+
+    The callback is called without arguments when a node starts or finishes
+    introspection, gets MAC addresses or is deleted. It must not block.
+
+    :param callback: callable to register, registered only once
+    """
+    if callback not in _STATE_LISTENERS:
+        _STATE_LISTENERS.append(callback)
+
+
+def _notify_state_listeners():
+    for callback in _STATE_LISTENERS:
+        try:
+            callback()
+        except Exception:
+            LOG.exception(_LE('State change listener %s failed'), callback)
 
 
 def _get_lock(uuid):
@@ -80,6 +105,8 @@ class NodeInfo(object):
         self._version_id = version_id
         self._state = state
         self._node = node
+        # Fields of the cached node, None if all of them
+        self._node_fields = None
         if ports is not None and not isinstance(ports, dict):
             ports = {p.address: p for p in ports}
         self._ports = ports
@@ -90,6 +117,8 @@ class NodeInfo(object):
         # Whether lock was acquired using this NodeInfo object
         self._locked = lock is not None
         self._fsm = None
+        # Patches collected inside batch_patches(), None outside of it
+        self._pending_patches = None
 
     def __del__(self):
         if self._locked:
@@ -292,6 +321,8 @@ class NodeInfo(object):
             db.model_query(db.Option, session=session).filter_by(
                 uuid=self.uuid).delete()
 
+        _notify_state_listeners()
+
     def add_attribute(self, name, value, session=None):
         """Store look up attribute for a node in the database.
 
@@ -309,6 +340,9 @@ class NodeInfo(object):
             # Invalidate attributes so they're loaded on next usage
             self._attributes = None
 
+        if name == MACS_ATTRIBUTE:
+            _notify_state_listeners()
+
     @classmethod
     def from_row(cls, row, ironic=None, lock=None, node=None):
         """Construct NodeInfo from a database row."""
@@ -321,6 +355,7 @@ class NodeInfo(object):
         """Clear all cached info, so that it's reloaded next time."""
         self._options = None
         self._node = None
+        self._node_fields = None
         self._ports = None
         self._attributes = None
         self._ironic = None
@@ -328,11 +363,38 @@ class NodeInfo(object):
         self._state = None
         self._version_id = None
 
-    def node(self, ironic=None):
-        """Get Ironic node object associated with the cached node record."""
-        if self._node is None:
-            ironic = ironic or self.ironic
-            self._node = ir_utils.get_node(self.uuid, ironic=ironic)
+    def node(self, ironic=None, fields=None):
+        """Get Ironic node object associated with the cached node record.
+
+        :param ironic: Ironic client to use instead of self.ironic
+        :param fields: list of node fields the caller needs, None for all.
+                       If the cached node misses some of them, the node is
+                       fetched again with these fields and all fields
+                       requested before. Without fields the whole node is
+                       fetched, unless it is already cached as a whole.
+        :returns: node object, with only the requested fields loaded if
+                  fields are provided. Inside batch_patches() the patches
+                  collected so far are applied to it.
+        """
+        if self._node is not None:
+            if self._node_fields is None:
+                return self._node
+            if fields is not None and self._node_fields.issuperset(fields):
+                return self._node
+
+        if fields is not None:
+            fields = set(fields) | {'uuid'} | (self._node_fields or set())
+            kwargs = {'fields': sorted(fields)}
+        else:
+            kwargs = {}
+
+        ironic = ironic or self.ironic
+        self._node = ir_utils.get_node(self.uuid, ironic=ironic, **kwargs)
+        self._node_fields = fields
+        if self._pending_patches:
+            # NOTE(dtantsur): the patches were applied to the previous node
+            # instance, all fields they touch are fetched again.
+            self._patch_cached_node(self._pending_patches)
         return self._node
 
     def create_ports(self, ports, ironic=None):
@@ -390,25 +452,116 @@ class NodeInfo(object):
             self._ports = None
         else:
             self._ports[mac] = port
+            port_cache.add(port)
 
     def patch(self, patches, ironic=None):
         """Apply JSON patches to a node.
 
-        Refreshes cached node instance.
+        Refreshes cached node instance. Inside batch_patches() the cached
+        node instance is updated in place instead, and the patches are sent
+        to Ironic later, unless an explicit Ironic client is provided.
 
         :param patches: JSON patches to apply
         :param ironic: Ironic client to use instead of self.ironic
         :raises: ironicclient exceptions
         """
-        ironic = ironic or self.ironic
         # NOTE(aarefiev): support path w/o ahead forward slash
         # as Ironic cli does
         for patch in patches:
             if patch.get('path') and not patch['path'].startswith('/'):
                 patch['path'] = '/' + patch['path']
 
+        if self._pending_patches is not None:
+            if ironic is None and self._patch_cached_node(patches):
+                LOG.debug('Deferring node update with patches %s', patches,
+                          node_info=self)
+                self._pending_patches.extend(patches)
+                return
+
+            patches = self._pending_patches + list(patches)
+            self._pending_patches = []
+            self._send_patches(patches, ironic or self.ironic, deferred=True)
+        else:
+            self._send_patches(patches, ironic or self.ironic)
+
+    @contextlib.contextmanager
+    def batch_patches(self, ironic=None):
+        """Collect node patches to send them to Ironic in one request.
+
+        Patches that cannot be applied to the cached node instance are sent
+        immediately, together with the ones collected before them. Nested
+        calls do nothing.
+
+        :param ironic: Ironic client to use instead of self.ironic
+        """
+        if self._pending_patches is not None:
+            yield
+            return
+
+        self._pending_patches = []
+        try:
+            yield
+        finally:
+            patches, self._pending_patches = self._pending_patches, None
+            if patches:
+                self._send_patches(patches, ironic or self.ironic,
+                                   deferred=True)
+
+    def _send_patches(self, patches, ironic, deferred=False):
         LOG.debug('Updating node with patches %s', patches, node_info=self)
-        self._node = ironic.node.update(self.uuid, patches)
+        try:
+            self._node = ironic.node.update(self.uuid, patches)
+            self._node_fields = None
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                if deferred:
+                    # NOTE(dtantsur): the cached node contains changes that
+                    # were not applied.
+                    self._node = None
+                    self._node_fields = None
+
+    def _patch_cached_node(self, patches):
+        """Apply simple patches to the cached node instance.
+
+        Only replacing top-level fields and changing keys of top-level
+        dictionary fields (e.g. /extra/foo) is supported.
+
+        :param patches: JSON patches to apply
+        :returns: True if patches were applied, False if they are not
+                  supported, in which case nothing is changed
+        """
+        parsed = []
+        for patch in patches:
+            path = patch.get('path') or ''
+            parts = path.strip('/').split('/')
+            if '~' in path or not all(parts):
+                return False
+
+            op = patch.get('op')
+            if op != 'remove' and 'value' not in patch:
+                return False
+            parsed.append((patch, parts, op))
+
+        node = self.node(fields={parts[0] for _p, parts, _o in parsed})
+        changes = []
+        for patch, parts, op in parsed:
+            if len(parts) == 1 and op in ('add', 'replace'):
+                changes.append((node, parts[0], patch))
+            elif (len(parts) == 2 and op in ('add', 'replace', 'remove') and
+                    isinstance(getattr(node, parts[0], None), dict)):
+                changes.append((getattr(node, parts[0]), parts[1], patch))
+            else:
+                return False
+
+        for target, key, patch in changes:
+            if target is node:
+                setattr(node, key, copy.deepcopy(patch['value']))
+            elif patch['op'] == 'remove':
+                target.pop(key, None)
+            else:
+                target[key] = copy.deepcopy(patch['value'])
+
+        return True
 
     def patch_port(self, port, patches, ironic=None):
         """Apply JSON patches to a port.
@@ -427,6 +580,7 @@ class NodeInfo(object):
                   node_info=self)
         new_port = ironic.port.update(port.uuid, patches)
         ports[port.address] = new_port
+        port_cache.add(new_port)
 
     def update_properties(self, ironic=None, **props):
         """Update properties on a node.
@@ -434,7 +588,6 @@ class NodeInfo(object):
         :param props: properties to update
         :param ironic: Ironic client to use instead of self.ironic
         """
-        ironic = ironic or self.ironic
         patches = [{'op': 'add', 'path': '/properties/%s' % k, 'value': v}
                    for k, v in props.items()]
         self.patch(patches, ironic)
@@ -446,7 +599,7 @@ class NodeInfo(object):
         :param ironic: Ironic client to use instead of self.ironic
         """
         existing = ir_utils.capabilities_to_dict(
-            self.node().properties.get('capabilities'))
+            self.node(fields=['properties']).properties.get('capabilities'))
         existing.update(caps)
         self.update_properties(
             ironic=ironic,
@@ -465,6 +618,7 @@ class NodeInfo(object):
 
         ironic.port.delete(port.uuid)
         del ports[port.address]
+        port_cache.remove(port.uuid)
 
     def get_by_path(self, path):
         """Get field value by ironic-style path (e.g. /extra/foo).
@@ -493,7 +647,7 @@ class NodeInfo(object):
         :raises: KeyError if value is not found and default is not set
         :raises: everything that patch() may raise
         """
-        ironic = kwargs.pop("ironic", None) or self.ironic
+        ironic = kwargs.pop("ironic", None)
         try:
             value = self.get_by_path(path)
             op = 'replace'
@@ -665,7 +819,8 @@ def start_introspection(uuid, **kwargs):
 def add_node(uuid, state, **attributes):
     """Store information about a node under introspection.
 
-    All existing information about this node is dropped.
+    All existing information about this node is dropped, except for the
+    stored introspection data, which is kept until new data replaces it.
     Empty values are skipped.
 
     :param uuid: Ironic node UUID
@@ -676,8 +831,19 @@ def add_node(uuid, state, **attributes):
     """
     started_at = timeutils.utcnow()
     with db.ensure_transaction() as session:
-        _delete_node(uuid)
-        db.Node(uuid=uuid, state=state, started_at=started_at).save(session)
+        _delete_node(uuid, session=session, keep_data=True)
+        # NOTE(dtantsur): the node record is updated in place, since stored
+        # introspection data may reference it.
+        updated = db.model_query(db.Node, session=session).filter_by(
+            uuid=uuid).update({'state': state,
+                               'started_at': started_at,
+                               'finished_at': None,
+                               'error': None,
+                               'version_id': uuidutils.generate_uuid()},
+                              synchronize_session=False)
+        if not updated:
+            db.Node(uuid=uuid, state=state,
+                    started_at=started_at).save(session)
 
         node_info = NodeInfo(uuid=uuid, state=state, started_at=started_at,
                              ironic=attributes.pop('ironic', None))
@@ -686,33 +852,99 @@ def add_node(uuid, state, **attributes):
                 continue
             node_info.add_attribute(name, value, session=session)
 
+    _notify_state_listeners()
     return node_info
 
 
-def delete_nodes_not_in_list(uuids):
-    """Delete nodes which don't exist in Ironic node UUIDs.
+def sync_with_ironic(ironic=None):
+    """Delete nodes which were deleted from Ironic.
+
+    Only node UUIDs are fetched from Ironic, page by page, and only the ones
+    present in the cache are kept in memory. Listing stops as soon as all
+    cached nodes are found.
 
-    :param uuids: Ironic node UUIDs
+    :param ironic: Ironic client instance, optional
     """
-    inspector_uuids = _list_node_uuids()
-    for uuid in inspector_uuids - uuids:
+    cached = _list_node_uuids()
+    if not cached:
+        return
+
+    ironic = ir_utils.get_client() if ironic is None else ironic
+    found = set()
+    marker = None
+    while True:
+        page = ironic.node.list(limit=_SYNC_PAGE_SIZE, marker=marker,
+                                fields=['uuid'])
+        found.update(node.uuid for node in page if node.uuid in cached)
+        if len(page) < _SYNC_PAGE_SIZE or found == cached:
+            break
+        marker = page[-1].uuid
+
+    _delete_nodes_removed_from_ironic(cached - found)
+
+
+def check_deleted_nodes(ironic=None):
+    """Check a batch of cached nodes for removal from Ironic.
+
+    Every call checks up to ``[DEFAULT]ironic_sync_batch_size`` cached nodes
+    one by one, the next call continues with the next batch, until all
+    cached nodes are checked and the round starts again. This way a deleted
+    node is noticed without listing all nodes in Ironic.
+
+    :param ironic: Ironic client instance, optional
+    """
+    batch_size = CONF.ironic_sync_batch_size
+    if batch_size <= 0:
+        return
+
+    if not _REMOVAL_CHECK_QUEUE:
+        _REMOVAL_CHECK_QUEUE.extend(_list_node_uuids())
+    batch = [_REMOVAL_CHECK_QUEUE.popleft()
+             for _i in range(min(batch_size, len(_REMOVAL_CHECK_QUEUE)))]
+    if not batch:
+        return
+
+    ironic = ir_utils.get_client() if ironic is None else ironic
+    missing = set()
+    for uuid in batch:
+        try:
+            ir_utils.get_node(uuid, ironic=ironic, fields=['uuid'])
+        except ir_utils.NotFound:
+            missing.add(uuid)
+
+    # NOTE(dtantsur): the node could have been deleted from the cache while
+    # waiting in the queue.
+    _delete_nodes_removed_from_ironic(missing & _list_node_uuids())
+
+
+def _delete_nodes_removed_from_ironic(uuids):
+    ir_utils.invalidate_node_names(uuids)
+    port_cache.remove_nodes(uuids)
+    for uuid in uuids:
         LOG.warning(
             _LW('Node %s was deleted from Ironic, dropping from Ironic '
                 'Inspector database'), uuid)
         with _get_lock_ctx(uuid):
             _delete_node(uuid)
 
+    if uuids:
+        _notify_state_listeners()
 
-def _delete_node(uuid, session=None):
+
+def _delete_node(uuid, session=None, keep_data=False):
     """Delete information about a node.
 
     :param uuid: Ironic node UUID
     :param session: optional existing database session
+    :param keep_data: whether to keep the stored introspection data and
+                      the node record it references
     """
+    models = (db.Option,) if keep_data else (db.Option, db.IntrospectionData,
+                                             db.Node)
     with db.ensure_transaction(session) as session:
         db.model_query(db.Attribute, session=session).filter_by(
             node_uuid=uuid).delete()
-        for model in (db.Option, db.Node):
+        for model in models:
             db.model_query(model,
                            session=session).filter_by(uuid=uuid).delete()
 
@@ -746,12 +978,7 @@ def get_node(node_id, ironic=None, locked=False):
     :param locked: if True, get a lock on node before fetching its data
     :returns: structure NodeInfo.
     """
-    if uuidutils.is_uuid_like(node_id):
-        node = None
-        uuid = node_id
-    else:
-        node = ir_utils.get_node(node_id, ironic=ironic)
-        uuid = node.uuid
+    uuid = ir_utils.get_node_uuid(node_id, ironic=ironic)
 
     if locked:
         lock = _get_lock(uuid)
@@ -764,7 +991,7 @@ def get_node(node_id, ironic=None, locked=False):
         if row is None:
             raise utils.Error(_('Could not find node %s in cache') % uuid,
                               code=404)
-        return NodeInfo.from_row(row, ironic=ironic, lock=lock, node=node)
+        return NodeInfo.from_row(row, ironic=ironic, lock=lock)
     except Exception:
         with excutils.save_and_reraise_exception():
             if lock is not None:
@@ -861,6 +1088,13 @@ def clean_up():
                              seconds=CONF.node_status_keep_time))
 
     with db.ensure_transaction() as session:
+        expired = db.model_query(db.Node.uuid, session=session).filter(
+            db.Node.finished_at.isnot(None),
+            db.Node.finished_at < status_keep_threshold)
+        # NOTE(dtantsur): stored introspection data references the nodes
+        db.model_query(db.IntrospectionData, session=session).filter(
+            db.IntrospectionData.uuid.in_(expired.subquery())).delete(
+                synchronize_session=False)
         db.model_query(db.Node, session=session).filter(
             db.Node.finished_at.isnot(None),
             db.Node.finished_at < status_keep_threshold).delete()
@@ -14,7 +14,10 @@
 """Base code for plugins support."""
 
 import abc
+import collections
+import hashlib
 
+import eventlet
 from oslo_config import cfg
 from oslo_log import log
 import six
@@ -25,12 +28,22 @@ from ironic_inspector.common.i18n import _, _LW
 
 CONF = cfg.CONF
 LOG = log.getLogger(__name__)
+# Number of nodes IntrospectionDataStore.get_many fetches data for at once
+_GET_MANY_CONCURRENCY = 16
 
 
 @six.add_metaclass(abc.ABCMeta)
 class ProcessingHook(object):  # pragma: no cover
     """Abstract base class for introspection data processing hooks."""
 
+    NODE_FIELDS = ()
+    """Ironic node fields this hook reads or patches.
+
+    These fields are fetched together for all enabled hooks before running
+    them. A hook calling NodeInfo.node() without listing the fields causes
+    the whole node to be fetched.
+    """
+
     def before_processing(self, introspection_data, **kwargs):
         """Hook to run before any other data processing.
 
@@ -100,6 +113,13 @@ class RuleConditionPlugin(WithValidation):  # pragma: no cover
     ALLOW_NONE = False
     """Whether this condition accepts None when field is not found."""
 
+    SIDE_EFFECTS = False
+    """Whether checking this condition has side effects.
+
+    Conditions of a rule may be checked in a different order than they were
+    defined, unless at least one of them has side effects.
+    """
+
     @abc.abstractmethod
     def check(self, node_info, field, params, **kwargs):
         """Check if condition holds for a given field.
@@ -113,6 +133,23 @@ class RuleConditionPlugin(WithValidation):  # pragma: no cover
         :returns: True if check succeeded, otherwise False
         """
 
+    def check_many(self, fields, params, **kwargs):
+        """Check if condition holds for many field values at once.
+
+        Used when checking rules against a lot of nodes, e.g. on a dry run.
+        Node information is not available here. Default implementation
+        calls check() for every field value.
+
+        :param fields: list of field values
+        :param params: parameters as a dictionary
+        :param kwargs: used for extensibility without breaking existing plugins
+        :raises: any exception if at least one field value is unacceptable,
+                 in this case the values are checked using check()
+        :returns: list with True or False for every field value
+        """
+        return [self.check(None, field, params, **kwargs)
+                for field in fields]
+
 
 @six.add_metaclass(abc.ABCMeta)
 class RuleActionPlugin(WithValidation):  # pragma: no cover
@@ -143,10 +180,150 @@ class RuleActionPlugin(WithValidation):  # pragma: no cover
         """
 
 
+@six.add_metaclass(abc.ABCMeta)
+class PXEFilterDriver(object):  # pragma: no cover
+    """Abstract base class for PXE filter drivers.
+
+    A PXE filter decides which machines may get an answer from the DHCP
+    server used for introspection. Drivers running privileged commands
+    should batch them with ``firewall.iptables_restore`` and
+    ``firewall.ipset_restore`` instead of running one command per change.
+    """
+
+    @abc.abstractmethod
+    def init(self):
+        """Initialize the filter.
+
+        Called once on start-up, before any other call.
+
+        :raises: any exception on failure to initialize
+        """
+
+    @abc.abstractmethod
+    def update_filters(self, ironic=None):
+        """Update the filter according to the nodes on introspection.
+
+        Called both on changes of the introspection status and periodically,
+        possibly from different green threads.
+
+        :param ironic: Ironic client instance, optional
+        """
+
+    def clean_up(self):
+        """Clean up the filter before exiting.
+
+        Default implementation does nothing.
+        """
+
+
+@six.add_metaclass(abc.ABCMeta)
+class IntrospectionDataStore(object):  # pragma: no cover
+    """Abstract base class for introspection data storage drivers."""
+
+    @abc.abstractmethod
+    def save(self, node_uuid, data, processed=True):
+        """Store introspection data.
+
+        Data stored for the same node and kind before is overwritten.
+
+        :param node_uuid: node UUID
+        :param data: introspection data as a dictionary
+        :param processed: whether the data is processed or unprocessed
+        :returns: location of the data to record in the node's extra field
+                  (see ``[processing]store_data_location``), or None
+        :raises: utils.Error on failure
+        """
+
+    @abc.abstractmethod
+    def get(self, node_uuid, processed=True):
+        """Get stored introspection data.
+
+        :param node_uuid: node UUID
+        :param processed: whether to get the processed or unprocessed data
+        :returns: introspection data as a JSON string
+        :raises: utils.Error on failure, with code 404 if nothing is stored
+        """
+
+    def get_many(self, node_uuids, processed=True):
+        """Get stored introspection data of many nodes.
+
+        Default implementation calls get() for several nodes concurrently.
+
+        :param node_uuids: list of node UUIDs
+        :param processed: whether to get the processed or unprocessed data
+        :returns: tuple (dictionary mapping node UUIDs to introspection data
+                  as JSON strings, dictionary mapping node UUIDs to errors
+                  for nodes without data)
+        """
+        def _get(node_uuid):
+            try:
+                data = self.get(node_uuid, processed=processed)
+            except Exception as exc:
+                return node_uuid, None, exc
+            return node_uuid, data, None
+
+        found = {}
+        errors = {}
+        pool = eventlet.GreenPool(_GET_MANY_CONCURRENCY)
+        for node_uuid, data, error in pool.imap(_get, node_uuids):
+            if error is None:
+                found[node_uuid] = data
+            else:
+                errors[node_uuid] = error
+        return found, errors
+
+    def get_stream(self, node_uuid, processed=True):
+        """Start reading stored introspection data.
+
+        Default implementation calls get() and returns the whole data as
+        one chunk, with the MD5 hash of it as the entity tag.
+
+        :param node_uuid: node UUID
+        :param processed: whether to get the processed or unprocessed data
+        :returns: StoredData tuple
+        :raises: utils.Error on failure, with code 404 if nothing is stored
+        """
+        data = self.get(node_uuid, processed=processed)
+        if not isinstance(data, bytes):
+            data = data.encode('utf-8')
+        return StoredData(body=[data], length=len(data),
+                          etag=hashlib.md5(data).hexdigest(), encoding=None)
+
+    def get_etag(self, node_uuid, processed=True):
+        """Get the entity tag of stored introspection data.
+
+        The entity tag must be the same as the one get_stream() returns for
+        the same data. Default implementation returns None, meaning that
+        the tag cannot be found without reading the data.
+
+        :param node_uuid: node UUID
+        :param processed: whether to get the processed or unprocessed data
+        :returns: entity tag as a string or None
+        :raises: utils.Error on failure, with code 404 if nothing is stored
+        """
+        return None
+
+StoredData = collections.namedtuple('StoredData',
+                                    ['body', 'length', 'etag', 'encoding'])
+"""Stored introspection data as returned by IntrospectionDataStore.
+
+Fields:
+
+* ``body`` - iterable over chunks of the data as bytes; if it has a
+  ``close`` method, it must be called when the body is not read till the end
+* ``length`` - length of the body in bytes or None if unknown
+* ``etag`` - entity tag (without quotes), changing when the data changes
+* ``encoding`` - compression algorithm of the body or None, see
+  ``swift.decompress_stream``
+"""
+
+
 _HOOKS_MGR = None
 _NOT_FOUND_HOOK_MGR = None
 _CONDITIONS_MGR = None
 _ACTIONS_MGR = None
+_PXE_FILTER_MGR = None
+_INTROSPECTION_DATA_MGR = None
 
 
 def missing_entrypoints_callback(names):
@@ -213,5 +390,27 @@ def rule_actions_manager():
     return _ACTIONS_MGR
 
 
+def pxe_filter_driver():
+    """Get the PXE filter driver set in [firewall]driver."""
+    global _PXE_FILTER_MGR
+    if _PXE_FILTER_MGR is None:
+        _PXE_FILTER_MGR = stevedore.DriverManager(
+            'ironic_inspector.pxe_filter',
+            name=CONF.firewall.driver,
+            invoke_on_load=True)
+    return _PXE_FILTER_MGR.driver
+
+
+def introspection_data_store():
+    """Get the introspection data store set in [processing]store_data."""
+    global _INTROSPECTION_DATA_MGR
+    if _INTROSPECTION_DATA_MGR is None:
+        _INTROSPECTION_DATA_MGR = stevedore.DriverManager(
+            'ironic_inspector.introspection_data.store',
+            name=CONF.processing.store_data,
+            invoke_on_load=True)
+    return _INTROSPECTION_DATA_MGR.driver
+
+
 class MissingHookError(KeyError):
     """Exception when hook is not found when processing it."""
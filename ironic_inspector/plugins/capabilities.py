@@ -53,6 +53,8 @@ LOG = utils.getProcessingLogger(__name__)
 class CapabilitiesHook(base.ProcessingHook):
     """Processing hook for detecting capabilities."""
 
+    NODE_FIELDS = ('properties',)
+
     def _detect_boot_mode(self, inventory, node_info, data=None):
         boot_mode = inventory.get('boot', {}).get('current_boot_mode')
         if boot_mode is not None:
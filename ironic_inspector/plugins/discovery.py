@@ -13,11 +13,15 @@
 
 """Enroll node not found hook hook."""
 
+import time
+
+from eventlet import semaphore
 from oslo_config import cfg
 
 from ironic_inspector.common.i18n import _, _LW
 from ironic_inspector.common import ironic as ir_utils
 from ironic_inspector import node_cache
+from ironic_inspector import port_cache
 from ironic_inspector import utils
 
 
@@ -26,6 +30,14 @@ DISCOVERY_OPTS = [
                default='fake',
                help=_('The name of the Ironic driver used by the enroll '
                       'hook when creating a new node in Ironic.')),
+    cfg.IntOpt('node_index_refresh_period',
+               default=600,
+               help=_('Period (in seconds) between full reloads of the index '
+                      'of Ironic nodes by their BMC addresses, used by the '
+                      'enroll hook to check for existing nodes. In between '
+                      'only nodes created or updated since the previous '
+                      'check are fetched. Set to 0 to disable the index and '
+                      'fetch all nodes on every check.')),
 ]
 
 
@@ -39,6 +51,18 @@ CONF.register_opts(DISCOVERY_OPTS, group='discovery')
 
 LOG = utils.getProcessingLogger(__name__)
 
+_NODE_FIELDS = ['uuid', 'driver_info', 'created_at', 'updated_at']
+_TIMESTAMPS = ('created_at', 'updated_at')
+_INDEX_LOCK = semaphore.BoundedSemaphore()
+# Node UUID -> BMC address, None if not loaded
+_BMC_ADDRESSES = None
+# BMC address -> set of node UUIDs
+_BMC_INDEX = {}
+# Time of the last full reload of the index
+_INDEX_LOADED_AT = None
+# Timestamp field -> its latest value seen
+_INDEX_WATERMARKS = {}
+
 
 def _extract_node_driver_info(introspection_data):
     node_driver_info = {}
@@ -51,17 +75,107 @@ def _extract_node_driver_info(introspection_data):
     return node_driver_info
 
 
+def _bmc_address(node):
+    try:
+        return ir_utils.get_ipmi_address(node)
+    except utils.Error as exc:
+        LOG.debug('Not indexing node %(uuid)s: %(exc)s',
+                  {'uuid': node.uuid, 'exc': exc})
+
+
+def _unindex_node(uuid):
+    old = _BMC_ADDRESSES.pop(uuid, None)
+    if old is not None:
+        _BMC_INDEX[old].discard(uuid)
+        if not _BMC_INDEX[old]:
+            del _BMC_INDEX[old]
+
+
+def _index_node(node):
+    _unindex_node(node.uuid)
+    address = _bmc_address(node)
+    _BMC_ADDRESSES[node.uuid] = address
+    if address is not None:
+        _BMC_INDEX.setdefault(address, set()).add(node.uuid)
+
+
+def _refresh_node_index(ironic):
+    global _BMC_ADDRESSES, _INDEX_LOADED_AT, _INDEX_WATERMARKS
+
+    if (_BMC_ADDRESSES is None or time.time() - _INDEX_LOADED_AT >=
+            CONF.discovery.node_index_refresh_period):
+        _BMC_ADDRESSES = None
+        _BMC_INDEX.clear()
+        loaded_at = time.time()
+        nodes = ironic.node.list(fields=_NODE_FIELDS, limit=0)
+        LOG.debug('Loaded %d nodes into the BMC address index', len(nodes))
+        _INDEX_WATERMARKS = {}
+        _BMC_ADDRESSES = {}
+        _INDEX_LOADED_AT = loaded_at
+    else:
+        nodes = {}
+        for key in _TIMESTAMPS:
+            for node in ir_utils.list_newer(ironic.node, key,
+                                            _INDEX_WATERMARKS.get(key),
+                                            _NODE_FIELDS):
+                nodes[node.uuid] = node
+        nodes = list(nodes.values())
+
+    ir_utils.resolve_ipmi_addresses(nodes)
+    for node in nodes:
+        _index_node(node)
+    for key in _TIMESTAMPS:
+        values = [getattr(node, key) for node in nodes]
+        values = [value for value in values if value is not None]
+        if _INDEX_WATERMARKS.get(key) is not None:
+            values.append(_INDEX_WATERMARKS[key])
+        if values:
+            _INDEX_WATERMARKS[key] = max(values)
+
+
+def _find_node_by_bmc_address(ipmi_address, ironic):
+    """Find a node in Ironic by its BMC address.
+
+    :returns: UUID of the node or None
+    """
+    if CONF.discovery.node_index_refresh_period <= 0:
+        nodes = ironic.node.list(fields=('uuid', 'driver_info'), limit=0)
+        for node in nodes:
+            if ipmi_address == _bmc_address(node):
+                return node.uuid
+        return
+
+    with _INDEX_LOCK:
+        _refresh_node_index(ironic)
+        candidates = list(_BMC_INDEX.get(ipmi_address, ()))
+
+    # NOTE(dtantsur): nodes deleted since the last full reload are still in
+    # the index, so the candidates are checked in Ironic.
+    for uuid in candidates:
+        try:
+            node = ir_utils.get_node(uuid, ironic=ironic,
+                                     fields=['uuid', 'driver_info'])
+        except ir_utils.NotFound:
+            with _INDEX_LOCK:
+                if _BMC_ADDRESSES is not None:
+                    _unindex_node(uuid)
+            continue
+
+        if ipmi_address == _bmc_address(node):
+            return node.uuid
+
+
 def _check_existing_nodes(introspection_data, node_driver_info, ironic):
     macs = utils.get_valid_macs(introspection_data)
     if macs:
         # verify existing ports
         for mac in macs:
-            ports = ironic.port.list(address=mac)
-            if not ports:
+            port = port_cache.find(mac, ironic=ironic)
+            if port is None:
                 continue
             raise utils.Error(
                 _('Port %(mac)s already exists, uuid: %(uuid)s') %
-                {'mac': mac, 'uuid': ports[0].uuid}, data=introspection_data)
+                {'mac': mac, 'uuid': port.uuid}, data=introspection_data)
     else:
         LOG.warning(_LW('No suitable interfaces found for discovered node. '
                         'Check that validate_interfaces hook is listed in '
@@ -70,16 +184,13 @@ def _check_existing_nodes(introspection_data, node_driver_info, ironic):
     # verify existing node with discovered ipmi address
     ipmi_address = node_driver_info.get('ipmi_address')
     if ipmi_address:
-        # FIXME(aarefiev): it's not effective to fetch all nodes, and may
-        #                  impact on performance on big clusters
-        nodes = ironic.node.list(fields=('uuid', 'driver_info'), limit=0)
-        for node in nodes:
-            if ipmi_address == ir_utils.get_ipmi_address(node):
-                raise utils.Error(
-                    _('Node %(uuid)s already has BMC address '
-                      '%(ipmi_address)s, not enrolling') %
-                    {'ipmi_address': ipmi_address, 'uuid': node.uuid},
-                    data=introspection_data)
+        uuid = _find_node_by_bmc_address(ipmi_address, ironic)
+        if uuid is not None:
+            raise utils.Error(
+                _('Node %(uuid)s already has BMC address '
+                  '%(ipmi_address)s, not enrolling') %
+                {'ipmi_address': ipmi_address, 'uuid': uuid},
+                data=introspection_data)
 
 
 def enroll_node_not_found_hook(introspection_data, **kwargs):
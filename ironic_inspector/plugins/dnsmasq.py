@@ -0,0 +1,203 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""PXE filter driver managing dnsmasq host files.
+
+The driver writes one file per MAC address into the directory passed to
+dnsmasq with the ``--dhcp-hostsdir`` option. A file contains either
+``<MAC>,ignore`` for a machine that must not get an answer, or ``<MAC>`` for
+a machine that is allowed. dnsmasq picks up new and changed files on its
+own, no restart or signal is needed.
+
+dnsmasq answers unknown machines by default. For the whitelist filter mode
+and for disabling DHCP when nothing is on introspection, dnsmasq must be
+configured with ``dhcp-ignore=tag:!known``. This makes node discovery
+impossible, so in the blacklist mode machines not registered in Ironic are
+always answered instead. If ``[dnsmasq_pxe_filter]dnsmasq_config_file`` is
+set, the driver checks the dnsmasq configuration on start-up and warns about
+this.
+"""
+
+import errno
+import os
+
+from eventlet import semaphore
+from oslo_config import cfg
+from oslo_log import log
+
+from ironic_inspector.common.i18n import _, _LI, _LW
+from ironic_inspector import firewall
+from ironic_inspector import node_cache
+from ironic_inspector.plugins import base
+from ironic_inspector import port_cache
+
+
+DNSMASQ_OPTS = [
+    cfg.StrOpt('dhcp_hostsdir',
+               default='/var/lib/ironic-inspector/dhcp-hostsdir',
+               help=_('The directory dnsmasq reads host files from, must '
+                      'match its --dhcp-hostsdir option.')),
+    cfg.StrOpt('dnsmasq_config_file',
+               help=_('Path to the dnsmasq configuration file. If set, it is '
+                      'checked on start-up for the dhcp-hostsdir option and '
+                      'for the dhcp-ignore=tag:!known option. The latter is '
+                      'required for the whitelist filter mode and for not '
+                      'answering unknown machines when no nodes are on '
+                      'introspection, but it makes node discovery '
+                      '(see [processing]node_not_found_hook) impossible.')),
+]
+
+
+def list_opts():
+    return [
+        ('dnsmasq_pxe_filter', DNSMASQ_OPTS)
+    ]
+
+CONF = cfg.CONF
+CONF.register_opts(DNSMASQ_OPTS, group='dnsmasq_pxe_filter')
+
+LOG = log.getLogger(__name__)
+_IGNORE = 'ignore'
+_IGNORE_UNKNOWN = 'tag:!known'
+
+
+class DnsmasqFilter(base.PXEFilterDriver):
+    """PXE filter driver writing dnsmasq host files."""
+
+    def __init__(self):
+        self._lock = semaphore.BoundedSemaphore()
+        # MAC address -> whether it is allowed, as written to the files
+        self._entries = {}
+
+    @property
+    def _hostsdir(self):
+        return CONF.dnsmasq_pxe_filter.dhcp_hostsdir
+
+    def init(self):
+        try:
+            os.makedirs(self._hostsdir)
+        except OSError as exc:
+            if exc.errno != errno.EEXIST:
+                raise
+
+        self._entries = {}
+        for name in os.listdir(self._hostsdir):
+            if name.startswith('.'):
+                continue
+            with open(os.path.join(self._hostsdir, name)) as fp:
+                fields = fp.read().strip().split(',')
+            self._entries[fields[0]] = _IGNORE not in fields[1:]
+        LOG.debug('Found %(count)d existing host files in %(dir)s',
+                  {'count': len(self._entries), 'dir': self._hostsdir})
+        self._check_dnsmasq_config()
+
+    def _check_dnsmasq_config(self):
+        path = CONF.dnsmasq_pxe_filter.dnsmasq_config_file
+        if not path:
+            return
+
+        options = _read_dnsmasq_config(path)
+        if options is None:
+            return
+
+        hostsdir = options.get('dhcp-hostsdir', [])
+        if os.path.abspath(self._hostsdir) not in {os.path.abspath(item)
+                                                   for item in hostsdir}:
+            LOG.warning(_LW('dnsmasq configuration file %(path)s does not '
+                            'have dhcp-hostsdir=%(dir)s, dnsmasq will not see '
+                            'the host files'),
+                        {'path': path, 'dir': self._hostsdir})
+
+        ignore_unknown = _IGNORE_UNKNOWN in options.get('dhcp-ignore', [])
+        if ignore_unknown and CONF.processing.node_not_found_hook:
+            LOG.warning(_LW('dnsmasq configuration file %s has '
+                            'dhcp-ignore=tag:!known, machines not registered '
+                            'in Ironic will not get an answer, so node '
+                            'discovery will not work'), path)
+        elif not ignore_unknown and firewall.filter_mode() == 'whitelist':
+            LOG.warning(_LW('dnsmasq configuration file %s does not have '
+                            'dhcp-ignore=tag:!known, machines not registered '
+                            'in Ironic will get an answer despite the '
+                            'whitelist filter mode'), path)
+        elif not ignore_unknown:
+            LOG.info(_LI('dnsmasq configuration file %s does not have '
+                         'dhcp-ignore=tag:!known, machines not registered in '
+                         'Ironic will get an answer even when no nodes are '
+                         'on introspection'), path)
+
+    def update_filters(self, ironic=None):
+        with self._lock:
+            wanted = self._wanted(ironic)
+            changed = {mac: allowed for mac, allowed in wanted.items()
+                       if self._entries.get(mac) != allowed}
+            if not changed:
+                LOG.debug('Not updating host files - no changes')
+                return
+
+            for mac, allowed in changed.items():
+                self._write(mac, allowed)
+                self._entries[mac] = allowed
+            LOG.info(_LI('Updated %(count)d host files in %(dir)s'),
+                     {'count': len(changed), 'dir': self._hostsdir})
+
+    def _wanted(self, ironic):
+        """Get the MAC's to write with whether they should be allowed."""
+        # NOTE(dtantsur): dnsmasq does not notice removed files, so MAC's that
+        # were known once are never dropped, only allowed or ignored.
+        if not firewall.should_enable_dhcp():
+            return dict.fromkeys(self._entries, False)
+
+        active = node_cache.active_macs()
+        if firewall.filter_mode() == 'whitelist':
+            wanted = dict.fromkeys(self._entries, False)
+            wanted.update(dict.fromkeys(active, True))
+            return wanted
+
+        ports = port_cache.ports(ironic)
+        wanted = dict.fromkeys(self._entries, True)
+        wanted.update((port.address, port.address in active)
+                      for port in ports)
+        return wanted
+
+    def _write(self, mac, allowed):
+        # NOTE(dtantsur): dnsmasq ignores dot files, so the file only becomes
+        # visible to it after the rename.
+        tmp_path = os.path.join(self._hostsdir, '.%s.tmp' % mac)
+        with open(tmp_path, 'w') as fp:
+            fp.write('%s\n' % mac if allowed else '%s,%s\n' % (mac, _IGNORE))
+        os.rename(tmp_path, os.path.join(self._hostsdir, mac))
+
+
+def _read_dnsmasq_config(path):
+    """Read options from a dnsmasq configuration file.
+
+    Included files and directories are not read.
+
+    :param path: path to the file
+    :returns: dictionary mapping option names to lists of values, None if
+              the file cannot be read
+    """
+    options = {}
+    try:
+        with open(path) as fp:
+            for line in fp:
+                line = line.split('#', 1)[0].strip()
+                if not line:
+                    continue
+                name, _sep, value = line.partition('=')
+                options.setdefault(name.strip(), []).append(value.strip())
+    except EnvironmentError as exc:
+        LOG.warning(_LW('Cannot read dnsmasq configuration file %(path)s: '
+                        '%(error)s'), {'path': path, 'error': exc})
+        return
+    return options
@@ -15,7 +15,8 @@
 
 Stores the value of the 'data' key returned by the ramdisk as a JSON encoded
 string in a Swift object. The object is named 'extra_hardware-<node uuid>' and
-is stored in the 'inspector' container.
+is stored in the 'inspector' container. The string is compressed according to
+the [swift]data_compression option.
 """
 
 import json
@@ -32,10 +33,13 @@ EDEPLOY_ITEM_SIZE = 4
 class ExtraHardwareHook(base.ProcessingHook):
     """Processing hook for saving extra hardware information in Swift."""
 
+    NODE_FIELDS = ('extra',)
+
     def _store_extra_hardware(self, name, data):
         """Handles storing the extra hardware data from the ramdisk"""
         swift_api = swift.SwiftAPI()
-        swift_api.create_object(name, data)
+        payload, headers = swift.compress(data)
+        swift_api.create_object(name, payload, headers=headers)
 
     def before_update(self, introspection_data, node_info, **kwargs):
         """Stores the 'data' key from introspection_data in Swift.
@@ -0,0 +1,260 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Introspection data storage drivers.
+
+The driver is chosen with the ``[processing]store_data`` option. Processed
+and unprocessed data of a node are stored separately, both as JSON.
+"""
+
+import errno
+import json
+import mmap
+import os
+import tempfile
+
+from oslo_config import cfg
+
+from ironic_inspector.common.i18n import _
+from ironic_inspector.common import swift
+from ironic_inspector import db
+from ironic_inspector.plugins import base
+from ironic_inspector import utils
+
+
+FILESYSTEM_OPTS = [
+    cfg.StrOpt('directory',
+               default='/var/lib/ironic-inspector/introspection-data',
+               help=_('The directory to store introspection data in. Files '
+                      'are spread over sub-directories named after the first '
+                      'two characters of node UUIDs.')),
+    cfg.BoolOpt('use_mmap',
+                default=False,
+                help=_('Whether to read stored introspection data by mapping '
+                       'files into memory instead of reading them.')),
+]
+
+
+def list_opts():
+    return [
+        ('filesystem_store', FILESYSTEM_OPTS)
+    ]
+
+CONF = cfg.CONF
+CONF.register_opts(FILESYSTEM_OPTS, group='filesystem_store')
+
+LOG = utils.getProcessingLogger(__name__)
+UNPROCESSED_SUFFIX = 'UNPROCESSED'
+# Size of chunks to read files in
+_CHUNK_SIZE = 65536
+
+
+def _not_found(node_uuid, processed):
+    if processed:
+        msg = _('No processed introspection data stored for node %s')
+    else:
+        msg = _('No unprocessed introspection data stored for node %s')
+    return utils.Error(msg % node_uuid, code=404)
+
+
+class NoStore(base.IntrospectionDataStore):
+    """Driver not storing anything."""
+
+    def save(self, node_uuid, data, processed=True):
+        LOG.debug('Introspection data storage is disabled, data for node %s '
+                  'is not stored', node_uuid)
+
+    def get(self, node_uuid, processed=True):
+        raise utils.Error(_('Inspector is not configured to store data. '
+                            'Set the [processing] store_data configuration '
+                            'option to change this.'), code=404)
+
+
+class SwiftStore(base.IntrospectionDataStore):
+    """Driver storing introspection data in Swift.
+
+    See the ``[swift]`` configuration section for the options.
+    """
+
+    def _suffix(self, processed):
+        return None if processed else UNPROCESSED_SUFFIX
+
+    def save(self, node_uuid, data, processed=True):
+        return swift.store_introspection_data(
+            data, node_uuid, suffix=self._suffix(processed))
+
+    def get(self, node_uuid, processed=True):
+        return swift.get_introspection_data(
+            node_uuid, suffix=self._suffix(processed))
+
+    def get_stream(self, node_uuid, processed=True):
+        headers, body = swift.get_introspection_data_stream(
+            node_uuid, suffix=self._suffix(processed))
+        length = headers.get('content-length')
+        return base.StoredData(
+            body=body,
+            length=int(length) if length is not None else None,
+            etag=headers.get('etag', '').strip('"'),
+            encoding=headers.get(swift.ENCODING_HEADER.lower()))
+
+    def get_etag(self, node_uuid, processed=True):
+        headers = swift.get_introspection_data_headers(
+            node_uuid, suffix=self._suffix(processed))
+        return headers.get('etag', '').strip('"')
+
+
+class FilesystemStore(base.IntrospectionDataStore):
+    """Driver storing introspection data in local files.
+
+    Files are written to a temporary file first and renamed, so readers
+    never see partially written data.
+    """
+
+    def _path(self, node_uuid, processed):
+        name = node_uuid if processed else '%s-%s' % (node_uuid,
+                                                      UNPROCESSED_SUFFIX)
+        return os.path.join(CONF.filesystem_store.directory, node_uuid[:2],
+                            name)
+
+    def save(self, node_uuid, data, processed=True):
+        path = self._path(node_uuid, processed)
+        directory = os.path.dirname(path)
+        tmp_path = None
+        try:
+            try:
+                os.makedirs(directory)
+            except OSError as exc:
+                if exc.errno != errno.EEXIST:
+                    raise
+
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.',
+                                            suffix='.tmp')
+            with os.fdopen(fd, 'w') as fp:
+                fp.write(json.dumps(data))
+            os.rename(tmp_path, path)
+        except EnvironmentError as exc:
+            if tmp_path is not None and os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise utils.Error(_('Failed to store introspection data in '
+                                '%(path)s: %(error)s') %
+                              {'path': path, 'error': exc})
+
+        return path
+
+    def get(self, node_uuid, processed=True):
+        stored = self.get_stream(node_uuid, processed=processed)
+        return b''.join(stored.body).decode('utf-8')
+
+    def get_stream(self, node_uuid, processed=True):
+        path = self._path(node_uuid, processed)
+        try:
+            fp = open(path, 'rb')
+        except EnvironmentError as exc:
+            if exc.errno == errno.ENOENT:
+                raise _not_found(node_uuid, processed)
+            raise utils.Error(_('Failed to read introspection data from '
+                                '%(path)s: %(error)s') %
+                              {'path': path, 'error': exc})
+
+        try:
+            stat = os.fstat(fp.fileno())
+            body = _FileStream(fp, stat.st_size)
+        except EnvironmentError as exc:
+            fp.close()
+            raise utils.Error(_('Failed to read introspection data from '
+                                '%(path)s: %(error)s') %
+                              {'path': path, 'error': exc})
+
+        return base.StoredData(body=body, length=stat.st_size,
+                               etag=_etag(stat), encoding=None)
+
+    def get_etag(self, node_uuid, processed=True):
+        path = self._path(node_uuid, processed)
+        try:
+            stat = os.stat(path)
+        except EnvironmentError as exc:
+            if exc.errno == errno.ENOENT:
+                raise _not_found(node_uuid, processed)
+            raise utils.Error(_('Failed to read introspection data from '
+                                '%(path)s: %(error)s') %
+                              {'path': path, 'error': exc})
+        return _etag(stat)
+
+
+def _etag(stat):
+    # NOTE(dtantsur): files are replaced, not modified, so the inode
+    # changes together with the contents.
+    return '%x-%x-%x' % (stat.st_ino, int(stat.st_mtime * 1000000),
+                         stat.st_size)
+
+
+class _FileStream(object):
+    """Iterable over chunks of a file, closing it when done."""
+
+    def __init__(self, fp, size):
+        self._fp = fp
+        self._mapped = None
+        # NOTE(dtantsur): empty files cannot be mapped
+        if CONF.filesystem_store.use_mmap and size:
+            self._mapped = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __iter__(self):
+        try:
+            if self._mapped is not None:
+                for offset in range(0, len(self._mapped), _CHUNK_SIZE):
+                    yield self._mapped[offset:offset + _CHUNK_SIZE]
+            else:
+                for chunk in iter(lambda: self._fp.read(_CHUNK_SIZE),
+                                  b''):
+                    yield chunk
+        finally:
+            self.close()
+
+    def close(self):
+        if self._mapped is not None:
+            self._mapped.close()
+            self._mapped = None
+        self._fp.close()
+
+
+class DatabaseStore(base.IntrospectionDataStore):
+    """Driver storing introspection data in the inspector database.
+
+    The data is kept when introspection is started again, until new data
+    replaces it. It is removed together with the node status information
+    (see ``[DEFAULT]node_status_keep_time``) or when the node is deleted
+    from Ironic.
+    """
+
+    def save(self, node_uuid, data, processed=True):
+        with db.ensure_transaction() as session:
+            session.merge(db.IntrospectionData(uuid=node_uuid,
+                                               processed=processed,
+                                               data=json.dumps(data)))
+
+    def get(self, node_uuid, processed=True):
+        record = db.model_query(db.IntrospectionData.data).filter_by(
+            uuid=node_uuid, processed=processed).first()
+        if record is None:
+            raise _not_found(node_uuid, processed)
+        return record.data
+
+    def get_many(self, node_uuids, processed=True):
+        records = db.model_query(db.IntrospectionData.uuid,
+                                 db.IntrospectionData.data).filter(
+            db.IntrospectionData.uuid.in_(node_uuids),
+            db.IntrospectionData.processed == processed)
+        found = {record.uuid: record.data for record in records}
+        errors = {node_uuid: _not_found(node_uuid, processed)
+                  for node_uuid in node_uuids if node_uuid not in found}
+        return found, errors
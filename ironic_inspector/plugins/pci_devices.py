@@ -64,6 +64,7 @@ class PciDevicesHook(base.ProcessingHook):
 
         That information can be later used by nova for node scheduling.
     """
+    NODE_FIELDS = ('properties',)
     aliases = _parse_pci_alias_entry()
 
     def _found_pci_devices_count(self, found_pci_devices):
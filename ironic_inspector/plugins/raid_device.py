@@ -43,6 +43,8 @@ class RaidDeviceDetection(base.ProcessingHook):
     the plugin needs to take precedence over the standard plugin.
     """
 
+    NODE_FIELDS = ('properties', 'extra')
+
     def _get_serials(self, data):
         if 'inventory' in data:
             return [x['serial'] for x in data['inventory'].get('disks', ())
@@ -65,7 +67,7 @@ class RaidDeviceDetection(base.ProcessingHook):
                         node_info=node_info, data=introspection_data)
             return
 
-        node = node_info.node()
+        node = node_info.node(fields=self.NODE_FIELDS)
 
         if 'root_device' in node.properties:
             LOG.info(_LI('Root device is already known for the node'),
@@ -17,12 +17,22 @@ import operator
 import re
 
 import netaddr
+import six
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 from ironic_inspector.common.i18n import _
 from ironic_inspector.plugins import base
 from ironic_inspector import utils
 
 
+# Integers above this can not be compared as floats without precision loss
+_MAX_EXACT_FLOAT = 2 ** 53
+
+
 def coerce(value, expected):
     if isinstance(expected, float):
         return float(value)
@@ -32,6 +42,44 @@ def coerce(value, expected):
         return value
 
 
+def _is_number(value):
+    return isinstance(value, (float,) + six.integer_types)
+
+
+def coerce_array(values, expected):
+    """Convert a list of values to a numpy array the same way coerce() does.
+
+    :param values: list of field values
+    :param expected: value to compare against
+    :raises TypeError: if conversion may result in a different outcome of
+                       comparison than using coerce() on every value
+    :returns: numpy array
+    """
+    if _is_number(expected):
+        if abs(expected) > _MAX_EXACT_FLOAT:
+            raise TypeError('value %s is too large' % expected)
+        if not all(_is_number(v) for v in values):
+            raise TypeError('non-numeric values')
+
+        result = numpy.array(values, dtype=float)
+        if not numpy.isfinite(result).all():
+            raise TypeError('non-finite values')
+        if result.size and numpy.abs(result).max() > _MAX_EXACT_FLOAT:
+            raise TypeError('values are too large')
+        if not isinstance(expected, float):
+            # int() truncates floating point numbers
+            result = numpy.trunc(result)
+        return result
+    elif expected is None or isinstance(expected, six.string_types):
+        # NOTE(dtantsur): filling an empty array prevents numpy from
+        # trying to convert lists and dicts into nested arrays
+        result = numpy.empty(len(values), dtype=object)
+        result[:] = values
+        return result
+    else:
+        raise TypeError('unsupported value %r' % expected)
+
+
 class SimpleCondition(base.RuleConditionPlugin):
     op = None
 
@@ -39,6 +87,14 @@ class SimpleCondition(base.RuleConditionPlugin):
         value = params['value']
         return self.op(coerce(field, value), value)
 
+    def check_many(self, fields, params, **kwargs):
+        if numpy is None or not fields:
+            return super(SimpleCondition, self).check_many(fields, params,
+                                                           **kwargs)
+
+        value = params['value']
+        return self.op(coerce_array(fields, value), value).tolist()
+
 
 class EqCondition(SimpleCondition):
     op = operator.eq
@@ -85,6 +141,10 @@ class NetCondition(base.RuleConditionPlugin):
         network = netaddr.IPNetwork(params['value'])
         return netaddr.IPAddress(field) in network
 
+    def check_many(self, fields, params, **kwargs):
+        network = netaddr.IPNetwork(params['value'])
+        return [netaddr.IPAddress(field) in network for field in fields]
+
 
 class ReCondition(base.RuleConditionPlugin):
     def validate(self, params, **kwargs):
@@ -95,17 +155,28 @@ class ReCondition(base.RuleConditionPlugin):
 
 
 class MatchesCondition(ReCondition):
-    def check(self, node_info, field, params, **kwargs):
+    def _regexp(self, params):
         regexp = params['value']
         if regexp[-1] != '$':
             regexp += '$'
-        return re.match(regexp, str(field)) is not None
+        return regexp
+
+    def check(self, node_info, field, params, **kwargs):
+        return re.match(self._regexp(params), str(field)) is not None
+
+    def check_many(self, fields, params, **kwargs):
+        regexp = re.compile(self._regexp(params))
+        return [regexp.match(str(field)) is not None for field in fields]
 
 
 class ContainsCondition(ReCondition):
     def check(self, node_info, field, params, **kwargs):
         return re.search(params['value'], str(field)) is not None
 
+    def check_many(self, fields, params, **kwargs):
+        regexp = re.compile(params['value'])
+        return [regexp.search(str(field)) is not None for field in fields]
+
 
 class FailAction(base.RuleActionPlugin):
     REQUIRED_PARAMS = {'message'}
@@ -40,9 +40,12 @@ class RootDiskSelectionHook(base.ProcessingHook):
     might not be updated.
     """
 
+    NODE_FIELDS = ('properties',)
+
     def before_update(self, introspection_data, node_info, **kwargs):
         """Detect root disk from root device hints and IPA inventory."""
-        hints = node_info.node().properties.get('root_device')
+        hints = node_info.node(
+            fields=self.NODE_FIELDS).properties.get('root_device')
         if not hints:
             LOG.debug('Root device hints are not provided',
                       node_info=node_info, data=introspection_data)
@@ -75,6 +78,7 @@ class SchedulerHook(base.ProcessingHook):
     """Nova scheduler required properties."""
 
     KEYS = ('cpus', 'cpu_arch', 'memory_mb', 'local_gb')
+    NODE_FIELDS = ('properties',)
 
     def before_update(self, introspection_data, node_info, **kwargs):
         """Update node with scheduler properties."""
@@ -119,7 +123,8 @@ class SchedulerHook(base.ProcessingHook):
         overwrite = CONF.processing.overwrite_existing
         properties = {key: str(introspection_data[key])
                       for key in self.KEYS if overwrite or
-                      not node_info.node().properties.get(key)}
+                      not node_info.node(
+                          fields=self.NODE_FIELDS).properties.get(key)}
         node_info.update_properties(**properties)
 
 
@@ -0,0 +1,213 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Cache of all Ironic ports, used for PXE filtering."""
+
+import time
+
+from eventlet import semaphore
+from ironicclient import exceptions as ironic_exc
+from oslo_config import cfg
+from oslo_log import log
+
+from ironic_inspector.common import ironic as ir_utils
+
+
+CONF = cfg.CONF
+LOG = log.getLogger(__name__)
+
+FIELDS = ['uuid', 'address', 'extra', 'node_uuid', 'created_at',
+          'updated_at']
+_PAGE_SIZE = 100
+_TIMESTAMPS = ('created_at', 'updated_at')
+_LOCK = semaphore.BoundedSemaphore()
+# Port UUID -> port object, None if not loaded
+_PORTS = None
+# MAC address -> port object
+_BY_ADDRESS = {}
+# Time of the last full refresh
+_REFRESHED_AT = None
+# Time of the last check for deleted ports
+_SWEPT_AT = None
+# Timestamp field -> its latest value seen
+_WATERMARKS = {}
+
+
+def ports(ironic=None):
+    """Get all Ironic ports.
+
+    The whole list is fetched every ``[firewall]port_cache_refresh_period``
+    seconds. In between only ports created or updated since the previous
+    call are fetched, newest first, page by page. Ports deleted not by
+    ironic-inspector are dropped when their nodes are found deleted by
+    ironic-inspector, or by the check running every
+    ``[firewall]port_cache_sweep_period`` seconds.
+
+    :param ironic: Ironic client instance, optional
+    :returns: list of ports with fields from ``FIELDS``
+    """
+    ironic = ir_utils.get_client() if ironic is None else ironic
+    if CONF.firewall.port_cache_refresh_period <= 0:
+        return ironic.port.list(limit=0, fields=FIELDS)
+
+    with _LOCK:
+        _refresh(ironic)
+        return list(_PORTS.values())
+
+
+def find(address, ironic=None):
+    """Find a port by its MAC address.
+
+    The lookup is done in the cache, refreshed the same way as in ``ports``.
+    A port found there is fetched from Ironic again, so that ports deleted
+    since the last full refresh are not returned.
+
+    :param address: MAC address
+    :param ironic: Ironic client instance, optional
+    :returns: port object or None
+    """
+    ironic = ir_utils.get_client() if ironic is None else ironic
+    if CONF.firewall.port_cache_refresh_period <= 0:
+        result = ironic.port.list(address=address)
+        return result[0] if result else None
+
+    with _LOCK:
+        _refresh(ironic)
+        port = _BY_ADDRESS.get(address.lower())
+    if port is None:
+        return
+
+    try:
+        return ironic.port.get(port.uuid, fields=FIELDS)
+    except ironic_exc.NotFound:
+        LOG.debug('Port %s was deleted from Ironic, dropping it from the '
+                  'cache', port.uuid)
+        remove(port.uuid)
+
+
+def invalidate():
+    """Drop the cache, so that all ports are fetched on the next call."""
+    global _PORTS
+    _PORTS = None
+    _BY_ADDRESS.clear()
+
+
+def add(port):
+    """Add or update a port in the cache.
+
+    :param port: port object as returned by Ironic
+    """
+    if _PORTS is not None:
+        _put(port)
+
+
+def remove(uuid):
+    """Remove a port from the cache.
+
+    :param uuid: port UUID
+    """
+    if _PORTS is not None:
+        old = _PORTS.pop(uuid, None)
+        if old is not None and old.address:
+            if _BY_ADDRESS.get(old.address.lower()) is old:
+                del _BY_ADDRESS[old.address.lower()]
+
+
+def remove_nodes(node_uuids):
+    """Remove all ports of the given nodes from the cache.
+
+    Used when nodes are found deleted from Ironic, which deletes their ports.
+
+    :param node_uuids: collection of node UUIDs
+    """
+    if _PORTS is None or not node_uuids:
+        return
+
+    node_uuids = set(node_uuids)
+    for port in list(_PORTS.values()):
+        if port.node_uuid in node_uuids:
+            remove(port.uuid)
+
+
+def _put(port):
+    remove(port.uuid)
+    _PORTS[port.uuid] = port
+    if port.address:
+        _BY_ADDRESS[port.address.lower()] = port
+
+
+def _refresh(ironic):
+    if (_PORTS is None or time.time() - _REFRESHED_AT >=
+            CONF.firewall.port_cache_refresh_period):
+        _full_refresh(ironic)
+    else:
+        _incremental_refresh(ironic)
+        if (CONF.firewall.port_cache_sweep_period > 0 and
+                time.time() - _SWEPT_AT >=
+                CONF.firewall.port_cache_sweep_period):
+            _sweep(ironic)
+
+
+def _full_refresh(ironic):
+    global _PORTS, _REFRESHED_AT, _SWEPT_AT, _WATERMARKS
+
+    _PORTS = None
+    refreshed_at = time.time()
+    result = ironic.port.list(limit=0, fields=FIELDS)
+    LOG.debug('Loaded %d ports into the cache', len(result))
+    _WATERMARKS = {}
+    _update_watermarks(result)
+    _PORTS = {}
+    _BY_ADDRESS.clear()
+    for port in result:
+        _put(port)
+    _REFRESHED_AT = _SWEPT_AT = refreshed_at
+
+
+def _sweep(ironic):
+    global _SWEPT_AT
+
+    swept_at = time.time()
+    existing = {port.uuid for port in ironic.port.list(limit=0,
+                                                       fields=['uuid'])}
+    deleted = [uuid for uuid in _PORTS if uuid not in existing]
+    if deleted:
+        LOG.debug('Dropping %d deleted ports from the cache', len(deleted))
+        for uuid in deleted:
+            remove(uuid)
+    _SWEPT_AT = swept_at
+
+
+def _incremental_refresh(ironic):
+    changed = {}
+    for key in _TIMESTAMPS:
+        for port in ir_utils.list_newer(ironic.port, key,
+                                        _WATERMARKS.get(key), FIELDS,
+                                        page_size=_PAGE_SIZE):
+            changed[port.uuid] = port
+
+    if changed:
+        LOG.debug('Updating %d ports in the cache', len(changed))
+        _update_watermarks(changed.values())
+        for port in changed.values():
+            _put(port)
+
+
+def _update_watermarks(ports):
+    for key in _TIMESTAMPS:
+        values = [getattr(port, key) for port in ports]
+        values = [value for value in values if value is not None]
+        if _WATERMARKS.get(key) is not None:
+            values.append(_WATERMARKS[key])
+        if values:
+            _WATERMARKS[key] = max(values)
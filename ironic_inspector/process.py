@@ -25,8 +25,6 @@ from oslo_utils import excutils
 
 from ironic_inspector.common.i18n import _, _LE, _LI, _LW
 from ironic_inspector.common import ironic as ir_utils
-from ironic_inspector.common import swift
-from ironic_inspector import firewall
 from ironic_inspector import introspection_state as istate
 from ironic_inspector import node_cache
 from ironic_inspector.plugins import base as plugins_base
@@ -40,7 +38,8 @@ LOG = utils.getProcessingLogger(__name__)
 _CREDENTIALS_WAIT_RETRIES = 10
 _CREDENTIALS_WAIT_PERIOD = 3
 _STORAGE_EXCLUDED_KEYS = {'logs'}
-_UNPROCESSED_DATA_STORE_SUFFIX = 'UNPROCESSED'
+# Node fields used by the processing itself, hooks add their own ones
+_NODE_FIELDS = ('uuid', 'provision_state', 'driver_info')
 
 
 def _store_logs(introspection_data, node_info):
@@ -145,30 +144,31 @@ def _filter_data_excluded_keys(data):
             if k not in _STORAGE_EXCLUDED_KEYS}
 
 
-def _store_data(node_info, data, suffix=None):
-    if CONF.processing.store_data != 'swift':
-        LOG.debug("Swift support is disabled, introspection data "
-                  "won't be stored", node_info=node_info)
+def _store_data(node_info, data, processed=True):
+    if CONF.processing.store_data == 'none':
+        LOG.debug("Introspection data storage is disabled, introspection "
+                  "data won't be stored", node_info=node_info)
         return
 
-    swift_object_name = swift.store_introspection_data(
-        _filter_data_excluded_keys(data),
+    location = plugins_base.introspection_data_store().save(
         node_info.uuid,
-        suffix=suffix
+        _filter_data_excluded_keys(data),
+        processed=processed
     )
-    LOG.info(_LI('Introspection data was stored in Swift in object '
-                 '%s'), swift_object_name, node_info=node_info)
-    if CONF.processing.store_data_location:
+    LOG.info(_LI('Introspection data was stored by the %(driver)s driver '
+                 'in %(location)s'),
+             {'driver': CONF.processing.store_data, 'location': location},
+             node_info=node_info)
+    if location is not None and CONF.processing.store_data_location:
         node_info.patch([{'op': 'add', 'path': '/extra/%s' %
                           CONF.processing.store_data_location,
-                          'value': swift_object_name}])
+                          'value': location}])
 
 
 def _store_unprocessed_data(node_info, data):
     # runs in background
     try:
-        _store_data(node_info, data,
-                    suffix=_UNPROCESSED_DATA_STORE_SUFFIX)
+        _store_data(node_info, data, processed=False)
     except Exception:
         LOG.exception(_LE('Encountered exception saving unprocessed '
                           'introspection data'), node_info=node_info,
@@ -176,17 +176,13 @@ def _store_unprocessed_data(node_info, data):
 
 
 def _get_unprocessed_data(uuid):
-    if CONF.processing.store_data == 'swift':
-        LOG.debug('Fetching unprocessed introspection data from '
-                  'Swift for %s', uuid)
-        return json.loads(
-            swift.get_introspection_data(
-                uuid,
-                suffix=_UNPROCESSED_DATA_STORE_SUFFIX
-            )
-        )
-    else:
-        raise utils.Error(_('Swift support is disabled'), code=400)
+    if CONF.processing.store_data == 'none':
+        raise utils.Error(_('Introspection data storage is disabled'),
+                          code=400)
+
+    LOG.debug('Fetching unprocessed introspection data for %s', uuid)
+    return json.loads(
+        plugins_base.introspection_data_store().get(uuid, processed=False))
 
 
 def process(introspection_data):
@@ -227,7 +223,7 @@ def process(introspection_data):
                             unprocessed_data)
 
     try:
-        node = node_info.node()
+        node = node_info.node(fields=_node_fields())
     except ir_utils.NotFound as exc:
         with excutils.save_and_reraise_exception():
             node_info.finished(error=str(exc))
@@ -254,6 +250,14 @@ def process(introspection_data):
     return result
 
 
+def _node_fields():
+    """Get the node fields needed for processing, including hooks' ones."""
+    fields = set(_NODE_FIELDS)
+    for hook_ext in plugins_base.processing_hooks_manager():
+        fields.update(hook_ext.obj.NODE_FIELDS)
+    return fields
+
+
 def _run_post_hooks(node_info, introspection_data):
     hooks = plugins_base.processing_hooks_manager()
 
@@ -273,9 +277,8 @@ def _process_node(node_info, node, introspection_data):
     _store_data(node_info, introspection_data)
 
     ironic = ir_utils.get_client()
-    firewall.update_filters(ironic)
-
-    node_info.invalidate_cache()
+    # NOTE(dtantsur): the cached node is updated by hooks patching it, so
+    # rules can reuse it instead of fetching the node again.
     rules.apply(node_info, introspection_data)
 
     resp = {'uuid': node.uuid}
@@ -336,7 +339,8 @@ def _finish_common(node_info, ironic, introspection_data, power_off=True):
         try:
             ironic.node.set_power_state(node_info.uuid, 'off')
         except Exception as exc:
-            if node_info.node().provision_state == 'enroll':
+            if node_info.node(
+                    fields=['provision_state']).provision_state == 'enroll':
                 LOG.info(_LI("Failed to power off the node in"
                              "'enroll' state, ignoring; error was "
                              "%s"), exc, node_info=node_info,
@@ -394,7 +398,7 @@ def _reapply(node_info):
                           'stored introspection data'),
                       node_info=node_info)
         msg = (_('Unexpected exception %(exc_class)s while fetching '
-                 'unprocessed introspection data from Swift: %(error)s') %
+                 'unprocessed introspection data: %(error)s') %
                {'exc_class': exc.__class__.__name__, 'error': exc})
         node_info.finished(error=msg)
         return
@@ -436,5 +440,4 @@ def _reapply_with_data(node_info, introspection_data):
     node_info.create_ports(list(interfaces.values()))
     _run_post_hooks(node_info, introspection_data)
     _store_data(node_info, introspection_data)
-    node_info.invalidate_cache()
     rules.apply(node_info, introspection_data)
@@ -14,23 +14,42 @@
 
 """Support for introspection rules."""
 
+import json
+import string
+
+import eventlet
 import jsonpath_rw as jsonpath
 import jsonschema
+from oslo_config import cfg
 from oslo_db import exception as db_exc
 from oslo_utils import timeutils
 from oslo_utils import uuidutils
 import six
+import sqlalchemy
 from sqlalchemy import orm
 
 from ironic_inspector.common.i18n import _, _LE, _LI
+from ironic_inspector.common import ironic as ir_utils
 from ironic_inspector import db
 from ironic_inspector.plugins import base as plugins_base
 from ironic_inspector import utils
 
 
+CONF = cfg.CONF
 LOG = utils.getProcessingLogger(__name__)
 _CONDITIONS_SCHEMA = None
 _ACTIONS_SCHEMA = None
+_CONDITIONS_VALIDATOR = None
+_ACTIONS_VALIDATOR = None
+# rule UUID -> condition ID -> ConditionStatistics
+_STATISTICS = {}
+# How many times a condition must be checked before it can be reordered
+_MIN_CHECKED_FOR_ORDERING = 10
+# Prevents division by zero for conditions that never fail
+_MIN_FAILURE_RATE = 0.01
+_FORMATTER = string.Formatter()
+# Maximum number of nodes fetched from Ironic at the same time by dry_run
+_DRY_RUN_CONCURRENCY = 16
 
 
 def conditions_schema():
@@ -99,6 +118,125 @@ def actions_schema():
     return _ACTIONS_SCHEMA
 
 
+def conditions_validator():
+    """Get a validator for rule conditions, compiled once."""
+    global _CONDITIONS_VALIDATOR
+    if _CONDITIONS_VALIDATOR is None:
+        schema = conditions_schema()
+        jsonschema.Draft4Validator.check_schema(schema)
+        _CONDITIONS_VALIDATOR = jsonschema.Draft4Validator(schema)
+    return _CONDITIONS_VALIDATOR
+
+
+def actions_validator():
+    """Get a validator for rule actions, compiled once."""
+    global _ACTIONS_VALIDATOR
+    if _ACTIONS_VALIDATOR is None:
+        schema = actions_schema()
+        jsonschema.Draft4Validator.check_schema(schema)
+        _ACTIONS_VALIDATOR = jsonschema.Draft4Validator(schema)
+    return _ACTIONS_VALIDATOR
+
+
+class ConditionStatistics(object):
+    """Statistics of checking a rule condition."""
+
+    def __init__(self):
+        self.checked = 0
+        self.passed = 0
+        self.total_time = 0.0
+
+    def record(self, passed, elapsed):
+        """Record one check of the condition.
+
+        :param passed: whether the condition was true
+        :param elapsed: time spent on checking in seconds
+        """
+        self.checked += 1
+        if passed:
+            self.passed += 1
+        self.total_time += elapsed
+
+    @property
+    def pass_rate(self):
+        return float(self.passed) / self.checked if self.checked else 0.0
+
+    @property
+    def average_time(self):
+        return self.total_time / self.checked if self.checked else 0.0
+
+    def as_dict(self):
+        return {'checked': self.checked,
+                'passed': self.passed,
+                'average_time': self.average_time}
+
+
+class ParamTemplate(object):
+    """Action parameter template, parsed once to be formatted many times.
+
+    Formatting is equivalent to calling str.format(data=data) on the
+    original template.
+    """
+
+    __slots__ = ('_template', '_parts')
+
+    def __init__(self, template):
+        """Parse a template.
+
+        :param template: template string
+        :raises: ValueError on invalid template
+        """
+        self._template = template
+        self._parts = tuple(_FORMATTER.parse(template))
+
+    @property
+    def template(self):
+        return self._template
+
+    def format(self, data):
+        """Format the template with the given introspection data.
+
+        :param data: introspection data
+        :raises: KeyError, IndexError, AttributeError if the template
+                 references missing data
+        :returns: formatted string
+        """
+        kwargs = {'data': data}
+        result = []
+        for literal, field, spec, conversion in self._parts:
+            result.append(literal)
+            if field is None:
+                continue
+
+            value = _FORMATTER.get_field(field, (), kwargs)[0]
+            value = _FORMATTER.convert_field(value, conversion)
+            if '{' in spec:
+                spec = _FORMATTER.vformat(spec, (), kwargs)
+            result.append(_FORMATTER.format_field(value, spec))
+
+        return ''.join(result)
+
+
+def _parse_templates(plugin, params):
+    """Parse templates from formatted parameters of an action.
+
+    :returns: dictionary parameter name -> ParamTemplate
+    :raises: ValueError on invalid template
+    """
+    return {name: ParamTemplate(params[name])
+            for name in plugin.FORMATTED_PARAMS
+            if params.get(name) and
+            isinstance(params[name], six.string_types)}
+
+
+def _overrides_rollback(plugin):
+    rollback = getattr(type(plugin), 'rollback', None)
+    if rollback is None:
+        return True
+    return (six.get_unbound_function(rollback) is not
+            six.get_unbound_function(plugins_base.RuleActionPlugin.rollback))
+
+
 class IntrospectionRule(object):
     """High-level class representing an introspection rule."""
 
@@ -108,6 +246,8 @@ class IntrospectionRule(object):
         self._conditions = conditions
         self._actions = actions
         self._description = description
+        # List of dictionaries with parsed templates for every action
+        self._templates = None
 
     def as_dict(self, short=False):
         result = {
@@ -128,6 +268,8 @@ class IntrospectionRule(object):
     def check_conditions(self, node_info, data):
         """Check if conditions are true for a given node.
 
+        Conditions are checked in the order returned by conditions_order().
+
         :param node_info: a NodeInfo object
         :param data: introspection data
         :returns: True if conditions match, otherwise False
@@ -135,56 +277,212 @@ class IntrospectionRule(object):
         LOG.debug('Checking rule "%s"', self.description,
                   node_info=node_info, data=data)
         ext_mgr = plugins_base.rule_conditions_manager()
-        for cond in self._conditions:
-            scheme, path = _parse_path(cond.field)
+        conditions = self.conditions_order()
+        # IDs of conditions with statistics already recorded, so that
+        # retrying in the defined order does not count them twice
+        recorded = set()
+        try:
+            result = self._check_conditions(conditions, ext_mgr,
+                                            node_info, data, recorded)
+        except Exception as exc:
+            if conditions == list(self._conditions):
+                raise
+            # NOTE(dtantsur): a condition may fail on data that would be
+            # rejected by one of the conditions defined before it.
+            LOG.debug('Checking reordered conditions failed with %s, '
+                      'retrying in the defined order', exc,
+                      node_info=node_info, data=data)
+            result = self._check_conditions(self._conditions, ext_mgr,
+                                            node_info, data, recorded)
 
-            if scheme == 'node':
-                source_data = node_info.node().to_dict()
-            elif scheme == 'data':
-                source_data = data
+        if result:
+            LOG.info(_LI('Rule "%s" will be applied'), self.description,
+                     node_info=node_info, data=data)
+        return result
 
-            field_values = jsonpath.parse(path).find(source_data)
-            field_values = [x.value for x in field_values]
-            cond_ext = ext_mgr[cond.op].obj
+    def _check_conditions(self, conditions, ext_mgr, node_info, data,
+                          recorded):
+        for cond in conditions:
+            watch = timeutils.StopWatch().start()
+            result = self._check_condition(cond, ext_mgr[cond.op].obj,
+                                           node_info, data)
+            if cond.id not in recorded:
+                recorded.add(cond.id)
+                self._statistics(cond).record(result, watch.elapsed())
+            if not result:
+                return False
 
-            if not field_values:
-                if cond_ext.ALLOW_NONE:
-                    LOG.debug('Field with JSON path %s was not found in data',
-                              cond.field, node_info=node_info, data=data)
-                    field_values = [None]
-                else:
-                    LOG.info(_LI('Field with JSON path %(path)s was not found '
-                                 'in data, rule "%(rule)s" will not '
-                                 'be applied'),
-                             {'path': cond.field, 'rule': self.description},
-                             node_info=node_info, data=data)
-                    return False
-
-            for value in field_values:
-                result = cond_ext.check(node_info, value, cond.params)
-                if cond.invert:
-                    result = not result
-
-                if (cond.multiple == 'first'
-                        or (cond.multiple == 'all' and not result)
-                        or (cond.multiple == 'any' and result)):
-                    break
+        return True
 
-            if not result:
-                LOG.info(_LI('Rule "%(rule)s" will not be applied: condition '
-                             '%(field)s %(op)s %(params)s failed'),
-                         {'rule': self.description, 'field': cond.field,
-                          'op': cond.op, 'params': cond.params},
+    def _check_condition(self, cond, cond_ext, node_info, data):
+        scheme, path = _parse_path(cond.field)
+
+        if scheme == 'node':
+            source_data = node_info.node().to_dict()
+        elif scheme == 'data':
+            source_data = data
+
+        field_values = jsonpath.parse(path).find(source_data)
+        field_values = [x.value for x in field_values]
+
+        if not field_values:
+            if cond_ext.ALLOW_NONE:
+                LOG.debug('Field with JSON path %s was not found in data',
+                          cond.field, node_info=node_info, data=data)
+                field_values = [None]
+            else:
+                LOG.info(_LI('Field with JSON path %(path)s was not found '
+                             'in data, rule "%(rule)s" will not '
+                             'be applied'),
+                         {'path': cond.field, 'rule': self.description},
                          node_info=node_info, data=data)
                 return False
 
-        LOG.info(_LI('Rule "%s" will be applied'), self.description,
-                 node_info=node_info, data=data)
+        for value in field_values:
+            result = cond_ext.check(node_info, value, cond.params)
+            if cond.invert:
+                result = not result
+
+            if (cond.multiple == 'first'
+                    or (cond.multiple == 'all' and not result)
+                    or (cond.multiple == 'any' and result)):
+                break
+
+        if not result:
+            LOG.info(_LI('Rule "%(rule)s" will not be applied: condition '
+                         '%(field)s %(op)s %(params)s failed'),
+                     {'rule': self.description, 'field': cond.field,
+                      'op': cond.op, 'params': cond.params},
+                     node_info=node_info, data=data)
+            return False
+
         return True
 
+    def _statistics(self, cond):
+        return _STATISTICS.setdefault(self._uuid, {}).setdefault(
+            cond.id, ConditionStatistics())
+
+    def conditions_order(self):
+        """Get conditions in the order they should be checked.
+
+        Conditions that are cheap to check and often fail go first: they are
+        sorted by the average time of checking divided by the failure rate.
+        Conditions that were not checked enough times yet go before them in
+        the defined order. Nothing is reordered if at least one condition has
+        side effects.
+
+        :returns: list of conditions
+        """
+        conditions = list(self._conditions)
+        ext_mgr = plugins_base.rule_conditions_manager()
+        if any(ext_mgr[cond.op].obj.SIDE_EFFECTS for cond in conditions):
+            return conditions
+
+        def _key(item):
+            idx, cond = item
+            stats = self._statistics(cond)
+            if stats.checked < _MIN_CHECKED_FOR_ORDERING:
+                return (0, 0, idx)
+            failure_rate = max(1 - stats.pass_rate, _MIN_FAILURE_RATE)
+            return (1, stats.average_time / failure_rate, idx)
+
+        return [cond for _idx, cond in sorted(enumerate(conditions), key=_key)]
+
+    def statistics(self):
+        """Get statistics of checking conditions of this rule.
+
+        Statistics are collected in memory and are reset on restart.
+
+        :returns: dictionary with keys "uuid", "conditions" (list of
+                  conditions with their statistics under the "statistics"
+                  key) and "order" (indexes of conditions in the order they
+                  are checked)
+        """
+        conditions = list(self._conditions)
+        order = self.conditions_order()
+        result = []
+        for cond in conditions:
+            item = cond.as_dict()
+            item['statistics'] = self._statistics(cond).as_dict()
+            result.append(item)
+
+        return {'uuid': self._uuid,
+                'conditions': result,
+                'order': [conditions.index(cond) for cond in order]}
+
+    def check_conditions_bulk(self, data, nodes=None):
+        """Check if conditions are true for many nodes at once.
+
+        Values of the fields referenced by each condition are collected
+        across all nodes and checked in one call to the condition plugin,
+        see RuleConditionPlugin.check_many. Like in check_conditions(),
+        a condition is only checked for nodes that passed all previous
+        conditions, so the outcome for every node is the same.
+
+        :param data: list of introspection data, one item per node
+        :param nodes: list of Ironic nodes as dictionaries in the same order
+                      as data, required if any condition uses node:// field
+        :returns: tuple (mask, errors) where mask is a list of booleans for
+                  every item of data, and errors is a dictionary mapping
+                  indexes of nodes which failed to be checked to error
+                  messages; such nodes are considered not matching.
+        :raises: utils.Error if node information is required but missing
+        """
+        mask = [True] * len(data)
+        errors = {}
+        ext_mgr = plugins_base.rule_conditions_manager()
+        for cond in self._conditions:
+            indexes = [idx for idx, matches in enumerate(mask) if matches]
+            if not indexes:
+                break
+
+            scheme, path = _parse_path(cond.field)
+            if scheme == 'node':
+                if nodes is None:
+                    raise utils.Error(_('Node information is required for '
+                                        'checking field %s') % cond.field)
+                source_data = nodes
+            else:
+                source_data = data
+
+            expr = jsonpath.parse(path)
+            cond_ext = ext_mgr[cond.op].obj
+            column = []
+            slices = []
+            for idx in indexes:
+                field_values = [x.value for x in expr.find(source_data[idx])]
+                if not field_values:
+                    if cond_ext.ALLOW_NONE:
+                        field_values = [None]
+                    else:
+                        mask[idx] = False
+                        continue
+
+                slices.append((idx, len(column),
+                               len(column) + len(field_values)))
+                column.extend(field_values)
+
+            results = _check_many(cond_ext, column, cond.params)
+            for idx, start, end in slices:
+                try:
+                    mask[idx] = _reduce_results(results[start:end],
+                                                cond.multiple, cond.invert)
+                except Exception as exc:
+                    mask[idx] = False
+                    errors[idx] = str(exc)
+
+        LOG.debug('Rule "%(rule)s" matches %(count)d out of %(total)d nodes',
+                  {'rule': self.description, 'count': sum(mask),
+                   'total': len(mask)})
+        return mask, errors
+
     def apply_actions(self, node_info, rollback=False, data=None):
         """Run actions on a node.
 
+        Node patches from all actions are sent to Ironic in one request,
+        see NodeInfo.batch_patches. Rollback is only run for actions
+        overriding it.
+
         :param node_info: NodeInfo instance
         :param rollback: if True, rollback actions are executed
         :param data: introspection data
@@ -199,33 +497,94 @@ class IntrospectionRule(object):
                   node_info=node_info, data=data)
 
         ext_mgr = plugins_base.rule_actions_manager()
-        for act in self._actions:
-            ext = ext_mgr[act.action].obj
-            for formatted_param in ext.FORMATTED_PARAMS:
-                value = act.params.get(formatted_param)
-                if not value or not isinstance(value, six.string_types):
+        with node_info.batch_patches():
+            for act, templates in zip(self._actions,
+                                      self._action_templates(ext_mgr)):
+                ext = ext_mgr[act.action].obj
+                if rollback and not _overrides_rollback(ext):
                     continue
 
-                # NOTE(aarefiev): verify provided value with introspection
-                # data format specifications.
-                # TODO(aarefiev): simple verify on import rule time.
-                try:
-                    act.params[formatted_param] = value.format(data=data)
-                except KeyError as e:
-                    raise utils.Error(_('Invalid formatting variable key '
-                                        'provided: %s') % e,
-                                      node_info=node_info, data=data)
-
-            LOG.debug('Running %(what)s action `%(action)s %(params)s`',
-                      {'action': act.action, 'params': act.params,
-                       'what': method},
-                      node_info=node_info, data=data)
-            getattr(ext, method)(node_info, act.params)
+                params = dict(act.params)
+                for name, template in templates.items():
+                    try:
+                        params[name] = template.format(data)
+                    except KeyError as e:
+                        raise utils.Error(_('Invalid formatting variable key '
+                                            'provided: %s') % e,
+                                          node_info=node_info, data=data)
+
+                LOG.debug('Running %(what)s action `%(action)s %(params)s`',
+                          {'action': act.action, 'params': params,
+                           'what': method},
+                          node_info=node_info, data=data)
+                getattr(ext, method)(node_info, params)
 
         LOG.debug('Successfully applied %s',
                   'rollback actions' if rollback else 'actions',
                   node_info=node_info, data=data)
 
+    def _action_templates(self, ext_mgr):
+        """Get parsed templates of actions, parsing them on first use."""
+        if self._templates is None:
+            templates = []
+            for act in self._actions:
+                try:
+                    templates.append(_parse_templates(
+                        ext_mgr[act.action].obj, act.params))
+                except ValueError as exc:
+                    raise utils.Error(_('Invalid formatting template in '
+                                        'action %(act)s: %(error)s') %
+                                      {'act': act.action, 'error': exc})
+            self._templates = templates
+        return self._templates
+
+
+def _check_many(cond_ext, fields, params):
+    """Check a condition for a list of field values.
+
+    Falls back to checking every value separately if the plugin fails to
+    check all of them at once, so that only the failed values are reported.
+
+    :returns: list with a boolean or an exception for every field value
+    """
+    try:
+        return cond_ext.check_many(fields, params)
+    except Exception as exc:
+        LOG.debug('Checking condition %(cond)s for all values at once '
+                  'failed, checking them separately: %(exc)s',
+                  {'cond': cond_ext.__class__.__name__, 'exc': exc})
+
+    results = []
+    for field in fields:
+        try:
+            results.append(cond_ext.check(None, field, params))
+        except Exception as exc:
+            results.append(exc)
+    return results
+
+
+def _reduce_results(results, multiple, invert):
+    """Get condition outcome from results for all values of a field.
+
+    Mirrors the way IntrospectionRule.check_conditions treats multiple
+    values, including stopping on the first decisive value.
+
+    :raises: an exception from results if it is reached
+    """
+    for result in results:
+        if isinstance(result, Exception):
+            raise result
+
+        if invert:
+            result = not result
+
+        if (multiple == 'first'
+                or (multiple == 'all' and not result)
+                or (multiple == 'any' and result)):
+            break
+
+    return bool(result)
+
 
 def _parse_path(path):
     """Parse path, extract scheme and path.
@@ -248,40 +607,38 @@ def _parse_path(path):
     return scheme, path
 
 
-def create(conditions_json, actions_json, uuid=None,
-           description=None):
-    """Create a new rule in database.
+def parse_data_path(field):
+    """Parse a JSON path to introspection data, as used in conditions.
 
-    :param conditions_json: list of dicts with the following keys:
-                            * op - operator
-                            * field - JSON path to field to compare
-                            Other keys are stored as is.
-    :param actions_json: list of dicts with the following keys:
-                         * action - action type
-                         Other keys are stored as is.
-    :param uuid: rule UUID, will be generated if empty
-    :param description: human-readable rule description
-    :returns: new IntrospectionRule object
-    :raises: utils.Error on failure
+    :param field: JSON path, optionally prefixed with ``data://``
+    :returns: parsed JSON path expression
+    :raises: utils.Error with code 400 on unsupported scheme or invalid path
     """
-    uuid = uuid or uuidutils.generate_uuid()
-    LOG.debug('Creating rule %(uuid)s with description "%(descr)s", '
-              'conditions %(conditions)s and actions %(actions)s',
-              {'uuid': uuid, 'descr': description,
-               'conditions': conditions_json, 'actions': actions_json})
-
+    scheme, path = _parse_path(field)
+    if scheme != 'data':
+        raise utils.Error(_('Unsupported scheme for field: %s, only data:// '
+                            'is supported') % scheme, code=400)
     try:
-        jsonschema.validate(conditions_json, conditions_schema())
-    except jsonschema.ValidationError as exc:
-        raise utils.Error(_('Validation failed for conditions: %s') % exc)
+        return jsonpath.parse(path)
+    except Exception as exc:
+        raise utils.Error(_('Unable to parse field JSON path %(field)s: '
+                            '%(error)s') % {'field': field, 'error': exc},
+                          code=400)
 
+
+def _validate_conditions(conditions_json):
+    """Validate rule conditions.
+
+    :param conditions_json: list of dicts, see create()
+    :returns: list of tuples (field, op, multiple, invert, params)
+    :raises: utils.Error on validation failure
+    """
     try:
-        jsonschema.validate(actions_json, actions_schema())
+        conditions_validator().validate(conditions_json)
     except jsonschema.ValidationError as exc:
-        raise utils.Error(_('Validation failed for actions: %s') % exc)
+        raise utils.Error(_('Validation failed for conditions: %s') % exc)
 
     cond_mgr = plugins_base.rule_conditions_manager()
-    act_mgr = plugins_base.rule_actions_manager()
 
     conditions = []
     reserved_params = {'op', 'field', 'multiple', 'invert'}
@@ -316,6 +673,23 @@ def create(conditions_json, actions_json, uuid=None,
                            cond_json.get('invert', False),
                            params))
 
+    return conditions
+
+
+def _validate_actions(actions_json):
+    """Validate rule actions.
+
+    :param actions_json: list of dicts, see create()
+    :returns: list of tuples (action, params)
+    :raises: utils.Error on validation failure
+    """
+    try:
+        actions_validator().validate(actions_json)
+    except jsonschema.ValidationError as exc:
+        raise utils.Error(_('Validation failed for actions: %s') % exc)
+
+    act_mgr = plugins_base.rule_actions_manager()
+
     actions = []
     for action_json in actions_json:
         plugin = act_mgr[action_json['action']].obj
@@ -327,24 +701,80 @@ def create(conditions_json, actions_json, uuid=None,
                                 '%(error)s') %
                               {'act': action_json['action'], 'error': exc})
 
+        try:
+            _parse_templates(plugin, params)
+        except ValueError as exc:
+            raise utils.Error(_('Invalid formatting template in action '
+                                '%(act)s: %(error)s') %
+                              {'act': action_json['action'], 'error': exc})
+
         actions.append((action_json['action'], params))
 
-    try:
-        with db.ensure_transaction() as session:
-            rule = db.Rule(uuid=uuid, description=description,
-                           disabled=False, created_at=timeutils.utcnow())
+    return actions
+
+
+def _make_rule(uuid, description, conditions, actions, created_at,
+               position):
+    """Create a database rule object from validated data."""
+    rule = db.Rule(uuid=uuid, description=description,
+                   disabled=False, created_at=created_at, position=position)
+
+    for field, op, multiple, invert, params in conditions:
+        rule.conditions.append(db.RuleCondition(op=op,
+                                                field=field,
+                                                multiple=multiple,
+                                                invert=invert,
+                                                params=params))
+
+    for action, params in actions:
+        rule.actions.append(db.RuleAction(action=action,
+                                          params=params))
+
+    return rule
 
-            for field, op, multiple, invert, params in conditions:
-                rule.conditions.append(db.RuleCondition(op=op,
-                                                        field=field,
-                                                        multiple=multiple,
-                                                        invert=invert,
-                                                        params=params))
 
-            for action, params in actions:
-                rule.actions.append(db.RuleAction(action=action,
-                                                  params=params))
+def _next_position(session):
+    """Get the position of a rule added after all existing ones."""
+    last = db.model_query(sqlalchemy.func.max(db.Rule.position),
+                          session=session).scalar()
+    return 0 if last is None else last + 1
+
+
+def _rules_query(*args, **kwargs):
+    return db.model_query(*args, **kwargs).order_by(
+        db.Rule.position, db.Rule.created_at, db.Rule.uuid)
+
+
+def create(conditions_json, actions_json, uuid=None,
+           description=None):
+    """Create a new rule in database.
+
+    :param conditions_json: list of dicts with the following keys:
+                            * op - operator
+                            * field - JSON path to field to compare
+                            Other keys are stored as is.
+    :param actions_json: list of dicts with the following keys:
+                         * action - action type
+                         Other keys are stored as is.
+    :param uuid: rule UUID, will be generated if empty
+    :param description: human-readable rule description
+    :returns: new IntrospectionRule object
+    :raises: utils.Error on failure
+    """
+    uuid = uuid or uuidutils.generate_uuid()
+    LOG.debug('Creating rule %(uuid)s with description "%(descr)s", '
+              'conditions %(conditions)s and actions %(actions)s',
+              {'uuid': uuid, 'descr': description,
+               'conditions': conditions_json, 'actions': actions_json})
+
+    conditions = _validate_conditions(conditions_json)
+    actions = _validate_actions(actions_json)
 
+    try:
+        with db.ensure_transaction() as session:
+            rule = _make_rule(uuid, description, conditions, actions,
+                              created_at=timeutils.utcnow(),
+                              position=_next_position(session))
             rule.save(session)
     except db_exc.DBDuplicateEntry as exc:
         LOG.error(_LE('Database integrity error %s when '
@@ -360,6 +790,120 @@ def create(conditions_json, actions_json, uuid=None,
                              description=description)
 
 
+def _validate_rule(rule_json):
+    """Validate one rule for import_rules.
+
+    :returns: tuple (uuid, description, conditions, actions)
+    :raises: utils.Error on validation failure
+    """
+    if not isinstance(rule_json, dict):
+        raise utils.Error(_('Rule must be a JSON object'))
+
+    uuid = rule_json.get('uuid') or uuidutils.generate_uuid()
+    if not uuidutils.is_uuid_like(uuid):
+        raise utils.Error(_('Invalid UUID value'))
+
+    conditions = _validate_conditions(rule_json.get('conditions', []))
+    actions = _validate_actions(rule_json.get('actions', []))
+    return uuid, rule_json.get('description'), conditions, actions
+
+
+def import_rules(rules_json, replace=False):
+    """Create or replace many rules in one transaction.
+
+    Either all rules are stored or nothing is changed.
+
+    :param rules_json: list of dicts with keys "conditions", "actions" and
+                       optionally "uuid" and "description", see create().
+                       Other keys (e.g. "links") are ignored, so that the
+                       output of export_rules() can be used as is.
+    :param replace: if True, all existing rules are replaced with the given
+                    ones. Otherwise existing rules with the same UUIDs are
+                    replaced keeping their position, and the new rules are
+                    added after all existing ones.
+    :returns: list of IntrospectionRule objects
+    :raises: utils.Error on validation failure
+    """
+    if not isinstance(rules_json, list):
+        raise utils.Error(_('Rules must be a list'))
+
+    validated = []
+    for idx, rule_json in enumerate(rules_json):
+        try:
+            validated.append(_validate_rule(rule_json))
+        except utils.Error as exc:
+            raise utils.Error(_('Invalid rule #%(idx)d: %(error)s') %
+                              {'idx': idx, 'error': exc})
+
+    uuids = [item[0] for item in validated]
+    if len(set(uuids)) != len(uuids):
+        duplicates = {uuid for uuid in uuids if uuids.count(uuid) > 1}
+        raise utils.Error(_('Duplicate rule UUID(s): %s') %
+                          ', '.join(sorted(duplicates)))
+
+    result = []
+    with db.ensure_transaction() as session:
+        if replace:
+            existing = {row[0]: None for row in
+                        db.model_query(db.Rule.uuid, session=session)}
+            _delete_all(session)
+            next_position = 0
+        else:
+            next_position = _next_position(session)
+            if uuids:
+                existing = {
+                    row.uuid: (row.created_at, row.position) for row in
+                    db.model_query(db.Rule.uuid, db.Rule.created_at,
+                                   db.Rule.position, session=session)
+                    .filter(db.Rule.uuid.in_(uuids))}
+                if existing:
+                    _delete_rules(list(existing), session)
+            else:
+                existing = {}
+
+        now = timeutils.utcnow()
+        for uuid, description, conditions, actions in validated:
+            created_at, position = existing.get(uuid) or (None, None)
+            if position is None:
+                created_at, position = now, next_position
+                next_position += 1
+            rule = _make_rule(uuid, description, conditions, actions,
+                              created_at=created_at, position=position)
+            session.add(rule)
+            result.append(IntrospectionRule(uuid=uuid,
+                                            conditions=rule.conditions,
+                                            actions=rule.actions,
+                                            description=description))
+
+    if replace:
+        _STATISTICS.clear()
+    else:
+        for uuid in existing:
+            _STATISTICS.pop(uuid, None)
+
+    LOG.info(_LI('Imported %(count)d rules, %(existing)d existing rules '
+                 'were %(what)s'),
+             {'count': len(result), 'existing': len(existing),
+              'what': 'deleted' if replace else 'replaced'})
+    return result
+
+
+def export_rules(batch_size=100):
+    """Iterate over all rules loading them from database in batches.
+
+    :param batch_size: how many rules to load at once
+    :returns: generator of IntrospectionRule objects in order of application
+    """
+    uuids = [row[0] for row in _rules_query(db.Rule.uuid)]
+    for start in range(0, len(uuids), batch_size):
+        query = _rules_query(db.Rule).filter(
+            db.Rule.uuid.in_(uuids[start:start + batch_size]))
+        for rule in query:
+            yield IntrospectionRule(uuid=rule.uuid, actions=rule.actions,
+                                    conditions=rule.conditions,
+                                    description=rule.description)
+
+
 def get(uuid):
     """Get a rule by its UUID."""
     try:
@@ -374,7 +918,7 @@ def get(uuid):
 
 def get_all():
     """List all rules."""
-    query = db.model_query(db.Rule).order_by(db.Rule.created_at)
+    query = _rules_query(db.Rule)
     return [IntrospectionRule(uuid=rule.uuid, actions=rule.actions,
                               conditions=rule.conditions,
                               description=rule.description)
@@ -393,16 +937,32 @@ def delete(uuid):
         if not count:
             raise utils.Error(_('Rule %s was not found') % uuid, code=404)
 
+    _STATISTICS.pop(uuid, None)
+
     LOG.info(_LI('Introspection rule %s was deleted'), uuid)
 
 
+def _delete_rules(uuids, session):
+    db.model_query(db.RuleAction, session=session).filter(
+        db.RuleAction.rule.in_(uuids)).delete(synchronize_session=False)
+    db.model_query(db.RuleCondition, session=session).filter(
+        db.RuleCondition.rule.in_(uuids)).delete(synchronize_session=False)
+    db.model_query(db.Rule, session=session).filter(
+        db.Rule.uuid.in_(uuids)).delete(synchronize_session=False)
+
+
+def _delete_all(session):
+    db.model_query(db.RuleAction, session=session).delete()
+    db.model_query(db.RuleCondition, session=session).delete()
+    db.model_query(db.Rule, session=session).delete()
+
+
 def delete_all():
     """Delete all rules."""
     with db.ensure_transaction() as session:
-        db.model_query(db.RuleAction, session=session).delete()
-        db.model_query(db.RuleCondition, session=session).delete()
-        db.model_query(db.Rule, session=session).delete()
+        _delete_all(session)
 
+    _STATISTICS.clear()
     LOG.info(_LI('All introspection rules were deleted'))
 
 
@@ -442,3 +1002,126 @@ def apply(node_info, data):
 
     LOG.info(_LI('Successfully applied custom introspection rules'),
              node_info=node_info, data=data)
+
+
+def dry_run(conditions_json, uuids):
+    """Check which nodes match the given rule conditions.
+
+    The conditions are validated the same way as in create(), but nothing
+    is stored. Nodes are checked using the stored processed introspection
+    data, see IntrospectionRule.check_conditions_bulk. For conditions on
+    node:// fields only the requested nodes are fetched from Ironic, with
+    only the fields the conditions reference.
+
+    :param conditions_json: list of conditions, see create()
+    :param uuids: list of node UUIDs to check
+    :returns: dictionary with keys "matched" (list of UUIDs of matching
+              nodes) and "errors" (dictionary mapping UUIDs of nodes which
+              could not be checked, e.g. without stored data or not found
+              in Ironic, to error messages)
+    :raises: utils.Error on validation failure or if introspection data
+             is not stored
+    """
+    if CONF.processing.store_data == 'none':
+        raise utils.Error(_('Inspector is not configured to store data'),
+                          code=400)
+
+    conditions = [db.RuleCondition(field=field, op=op, multiple=multiple,
+                                   invert=invert, params=params)
+                  for field, op, multiple, invert, params
+                  in _validate_conditions(conditions_json)]
+    rule = IntrospectionRule(uuid=None, conditions=conditions, actions=[],
+                             description=_('dry run'))
+
+    store = plugins_base.introspection_data_store()
+    found, fetch_errors = store.get_many(uuids)
+    errors = {uuid: str(exc) for uuid, exc in fetch_errors.items()}
+    checked = []
+    data = []
+    for uuid in uuids:
+        if uuid not in found:
+            continue
+        try:
+            data.append(json.loads(found[uuid]))
+        except ValueError as exc:
+            errors[uuid] = str(exc)
+        else:
+            checked.append(uuid)
+
+    nodes = None
+    node_paths = [path for scheme, path in
+                  (_parse_path(cond.field) for cond in conditions)
+                  if scheme == 'node']
+    if node_paths:
+        fields = set()
+        for path in node_paths:
+            path_fields = _top_level_fields(path)
+            if path_fields is None:
+                fields = None
+                break
+            fields.update(path_fields)
+
+        found_nodes, node_errors = _get_nodes(checked, fields)
+        errors.update(node_errors)
+        data = [item for uuid, item in zip(checked, data)
+                if uuid in found_nodes]
+        checked = [uuid for uuid in checked if uuid in found_nodes]
+        nodes = [found_nodes[uuid] for uuid in checked]
+
+    mask, check_errors = rule.check_conditions_bulk(data, nodes)
+    for idx, error in check_errors.items():
+        errors[checked[idx]] = error
+
+    return {'matched': [uuid for uuid, matches in zip(checked, mask)
+                        if matches],
+            'errors': errors}
+
+
+def _top_level_fields(path):
+    """Get top-level fields referenced by a JSON path.
+
+    :param path: JSON path without a scheme
+    :returns: set of field names or None if they cannot be determined
+    """
+    expr = jsonpath.parse(path)
+    parts = []
+    while isinstance(expr, jsonpath.Child):
+        parts.append(expr.right)
+        expr = expr.left
+    parts.append(expr)
+
+    for part in reversed(parts):
+        if isinstance(part, jsonpath.Root):
+            continue
+        if isinstance(part, jsonpath.Fields) and '*' not in part.fields:
+            return set(part.fields)
+        return None
+
+
+def _get_nodes(uuids, fields=None):
+    """Fetch several nodes from Ironic concurrently.
+
+    :param uuids: list of node UUIDs
+    :param fields: node fields to fetch, None for all
+    :returns: tuple (found, errors) with dictionaries mapping node UUIDs to
+              nodes as dictionaries and to error messages respectively
+    """
+    ironic = ir_utils.get_client()
+    kwargs = {} if fields is None else {'fields': sorted(fields | {'uuid'})}
+
+    def _get(uuid):
+        try:
+            return uuid, ir_utils.get_node(uuid, ironic=ironic,
+                                           **kwargs).to_dict(), None
+        except utils.Error as exc:
+            return uuid, None, str(exc)
+
+    found = {}
+    errors = {}
+    pool = eventlet.GreenPool(_DRY_RUN_CONCURRENCY)
+    for uuid, node, error in pool.imap(_get, uuids):
+        if error is None:
+            found[uuid] = node
+        else:
+            errors[uuid] = error
+    return found, errors
@@ -26,12 +26,14 @@ from oslo_utils import uuidutils
 from oslotest import base as test_base
 
 from ironic_inspector.common import i18n
+from ironic_inspector.common import ironic as ir_utils
 # Import configuration options
 from ironic_inspector import conf  # noqa
 from ironic_inspector import db
 from ironic_inspector import introspection_state as istate
 from ironic_inspector import node_cache
 from ironic_inspector.plugins import base as plugins_base
+from ironic_inspector import port_cache
 from ironic_inspector import utils
 
 CONF = cfg.CONF
@@ -51,7 +53,18 @@ class BaseTest(test_base.BaseTestCase):
         engine.connect()
         self.addCleanup(db.get_engine().dispose)
         plugins_base._HOOKS_MGR = None
+        plugins_base._PXE_FILTER_MGR = None
+        plugins_base._INTROSPECTION_DATA_MGR = None
         node_cache._SEMAPHORES = lockutils.Semaphores()
+        node_cache._STATE_LISTENERS = []
+        node_cache._REMOVAL_CHECK_QUEUE.clear()
+        port_cache.invalidate()
+        ir_utils.reset_ironic_session()
+        ir_utils._RESOLVED.clear()
+        ir_utils._NODE_UUIDS.clear()
+        ir_utils._LIMITERS.clear()
+        ir_utils._CLIENT_STATISTICS.update(requested=0, created=0)
+        ir_utils._RESOLVE_STATISTICS.update(hits=0, misses=0)
         for name in ('_', '_LI', '_LW', '_LE', '_LC'):
             patch = mock.patch.object(i18n, name, lambda s: s)
             patch.start()
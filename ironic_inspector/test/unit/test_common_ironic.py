@@ -12,9 +12,12 @@
 # limitations under the License.
 
 import socket
+import time
 import unittest
 
 from ironicclient import client
+from ironicclient.common import base as ironic_base
+from ironicclient import exceptions as ironic_exc
 import mock
 from oslo_config import cfg
 
@@ -53,8 +56,7 @@ class TestGetClient(base.BaseTest):
         args = {'token': fake_token,
                 'endpoint': fake_ironic_url,
                 'os_ironic_api_version': ir_utils.DEFAULT_IRONIC_API_VERSION,
-                'max_retries': CONF.ironic.max_retries,
-                'retry_interval': CONF.ironic.retry_interval}
+                'max_retries': 0}
         mock_client.assert_called_once_with(1, **args)
 
     def test_get_client_without_auth_token(self, mock_client, mock_load,
@@ -65,10 +67,226 @@ class TestGetClient(base.BaseTest):
         args = {'session': mock_sess,
                 'region_name': 'somewhere',
                 'os_ironic_api_version': ir_utils.DEFAULT_IRONIC_API_VERSION,
-                'max_retries': CONF.ironic.max_retries,
-                'retry_interval': CONF.ironic.retry_interval}
+                'max_retries': 0}
         mock_client.assert_called_once_with(1, **args)
 
+    def test_managers_wrapped(self, mock_client, mock_load, mock_opts):
+        mock_client.return_value.node = mock.Mock(spec=ironic_base.Manager)
+        cli = ir_utils.get_client()
+
+        self.assertIsInstance(cli.node, ir_utils._LimitedManager)
+        self.assertIs(cli.node, cli.node)
+        self.assertIs(mock_client.return_value.http_client, cli.http_client)
+
+    def test_client_cached(self, mock_client, mock_load, mock_opts):
+        mock_client.side_effect = lambda *a, **kw: mock.Mock()
+
+        cli = ir_utils.get_client()
+        self.assertIs(cli, ir_utils.get_client())
+        self.assertIsNot(cli, ir_utils.get_client('token'))
+        self.assertIsNot(cli, ir_utils.get_client(api_version='1.19'))
+        self.assertIs(cli, ir_utils.get_client())
+
+        self.assertEqual(3, mock_client.call_count)
+        mock_load.assert_called_once_with(ir_utils.IRONIC_GROUP)
+        self.assertEqual({'requested': 5, 'created': 3, 'cached': 3},
+                         ir_utils.client_statistics())
+
+    @mock.patch.object(ir_utils, '_MAX_CLIENTS', 2)
+    def test_least_recently_used_evicted(self, mock_client, mock_load,
+                                         mock_opts):
+        mock_client.side_effect = lambda *a, **kw: mock.Mock()
+        cli = ir_utils.get_client()
+        ir_utils.get_client('token1')
+        self.assertIs(cli, ir_utils.get_client())
+
+        ir_utils.get_client('token2')
+
+        self.assertIs(cli, ir_utils.get_client())
+        self.assertEqual(3, mock_client.call_count)
+        ir_utils.get_client('token1')
+        self.assertEqual(4, mock_client.call_count)
+
+    def test_unauthorized_drops_client(self, mock_client, mock_load,
+                                       mock_opts):
+        mock_client.return_value.node = mock.Mock(spec=ironic_base.Manager)
+        mock_client.return_value.node.get = mock.Mock(
+            side_effect=ironic_exc.Unauthorized())
+        cli = ir_utils.get_client()
+
+        self.assertRaises(ironic_exc.Unauthorized, cli.node.get, 'uuid')
+
+        self.assertIsNot(cli, ir_utils.get_client())
+
+    @mock.patch.object(ir_utils.LOG, 'debug', autospec=True)
+    def test_log_statistics(self, mock_debug, mock_client, mock_load,
+                            mock_opts):
+        mock_client.return_value.node = mock.Mock(spec=ironic_base.Manager)
+        mock_client.return_value.node.get = mock.Mock(return_value='node')
+        ir_utils.get_client().node.get('uuid')
+
+        ir_utils.log_statistics()
+
+        self.assertEqual(3, mock_debug.call_count)
+        mock_debug.assert_has_calls([
+            mock.call(mock.ANY, {'requested': 1, 'created': 1, 'cached': 1}),
+            mock.call(mock.ANY, {'hits': 0, 'misses': 0, 'cached': 0})])
+        stats = mock_debug.call_args[0][1]
+        self.assertEqual('node.get', stats['op'])
+        self.assertEqual(1, stats['stats']['requests'])
+
+    def test_invalidate_client(self, mock_client, mock_load, mock_opts):
+        mock_client.side_effect = lambda *a, **kw: mock.Mock()
+        cli = ir_utils.get_client()
+        token_cli = ir_utils.get_client('token')
+
+        ir_utils.invalidate_client(token_cli)
+
+        self.assertIs(cli, ir_utils.get_client())
+        self.assertIsNot(token_cli, ir_utils.get_client('token'))
+
+        ir_utils.invalidate_client()
+
+        self.assertIsNot(cli, ir_utils.get_client())
+        self.assertEqual(4, mock_client.call_count)
+
+
+@mock.patch.object(time, 'sleep', autospec=True)
+class TestLimitedCalls(base.BaseTest):
+    def setUp(self):
+        super(TestLimitedCalls, self).setUp()
+        self.cfg.config(max_concurrent_requests=4, retry_interval=2,
+                        max_retry_interval=5, max_retries=3, group='ironic')
+        self.manager = ir_utils._LimitedManager('node', mock.Mock())
+        self.func = self.manager._manager.update
+
+    def test_success(self, mock_sleep):
+        self.func.return_value = 'node'
+
+        self.assertEqual('node', self.manager.update('uuid', [], force=True))
+
+        self.func.assert_called_once_with('uuid', [], force=True)
+        self.assertFalse(mock_sleep.called)
+        stats = ir_utils.request_statistics()['node.update']
+        self.assertEqual({'requests': 1, 'retries': 0, 'in_flight': 0,
+                          'waiting': 0, 'limit': 4},
+                         {k: v for k, v in stats.items()
+                          if k != 'average_time'})
+
+    @mock.patch.object(ir_utils.random, 'uniform', autospec=True)
+    def test_retry_with_backoff(self, mock_uniform, mock_sleep):
+        mock_uniform.side_effect = lambda low, high: high
+        self.func.side_effect = [ironic_exc.Conflict(),
+                                 ironic_exc.ConnectionRefused(),
+                                 ironic_exc.Conflict(),
+                                 'node']
+
+        self.assertEqual('node', self.manager.update('uuid', []))
+
+        self.assertEqual(4, self.func.call_count)
+        mock_sleep.assert_has_calls([mock.call(2.0), mock.call(4.0),
+                                     mock.call(5.0)])
+        stats = ir_utils.request_statistics()['node.update']
+        self.assertEqual(4, stats['requests'])
+        self.assertEqual(3, stats['retries'])
+        # halved three times, then increased by one
+        self.assertEqual(2, stats['limit'])
+
+    def test_retries_exhausted(self, mock_sleep):
+        self.func.side_effect = ironic_exc.Conflict()
+
+        self.assertRaises(ironic_exc.Conflict, self.manager.update, 'uuid', [])
+
+        self.assertEqual(4, self.func.call_count)
+        self.assertEqual(3, mock_sleep.call_count)
+        self.assertEqual(0, ir_utils.request_statistics()['node.update'][
+            'in_flight'])
+
+    @mock.patch.object(ir_utils.random, 'uniform', autospec=True)
+    def test_retry_time_limited(self, mock_uniform, mock_sleep):
+        mock_uniform.side_effect = lambda low, high: high
+        self.cfg.config(max_retries=10, max_retry_time=10, group='ironic')
+        self.func.side_effect = ironic_exc.Conflict()
+
+        self.assertRaises(ironic_exc.Conflict, self.manager.update, 'uuid', [])
+
+        mock_sleep.assert_has_calls([mock.call(2.0), mock.call(4.0),
+                                     mock.call(4.0)])
+        self.assertEqual(3, mock_sleep.call_count)
+        self.assertEqual(4, self.func.call_count)
+
+    def test_service_unavailable_not_retried_for_changes(self, mock_sleep):
+        self.func.side_effect = ironic_exc.ServiceUnavailable()
+
+        self.assertRaises(ironic_exc.ServiceUnavailable,
+                          self.manager.update, 'uuid', [])
+
+        self.func.assert_called_once_with('uuid', [])
+        self.assertFalse(mock_sleep.called)
+        self.assertEqual(2, ir_utils.request_statistics()['node.update'][
+            'limit'])
+
+    def test_service_unavailable_retried_for_reading(self, mock_sleep):
+        self.manager._manager.get_boot_device.side_effect = [
+            ironic_exc.ServiceUnavailable(), 'device']
+
+        self.assertEqual('device', self.manager.get_boot_device('uuid'))
+
+        self.assertEqual(1, mock_sleep.call_count)
+
+    def test_other_errors_not_retried(self, mock_sleep):
+        self.func.side_effect = ironic_exc.NotFound()
+
+        self.assertRaises(ironic_exc.NotFound, self.manager.update, 'uuid', [])
+
+        self.func.assert_called_once_with('uuid', [])
+        self.assertFalse(mock_sleep.called)
+
+    @mock.patch.object(ir_utils, 'invalidate_client', autospec=True)
+    def test_unauthorized_invalidates_client(self, mock_invalidate,
+                                             mock_sleep):
+        ironic = mock.Mock()
+        self.manager = ir_utils._LimitedManager('node', mock.Mock(), ironic)
+        self.manager._manager.get.side_effect = ironic_exc.Unauthorized()
+
+        self.assertRaises(ironic_exc.Unauthorized, self.manager.get, 'uuid')
+
+        mock_invalidate.assert_called_once_with(ironic)
+        self.assertFalse(mock_sleep.called)
+        self.assertEqual(0, ir_utils.request_statistics()['node.get'][
+            'in_flight'])
+
+    def test_limit_decreased_with_requests_in_flight(self, mock_sleep):
+        limiter = ir_utils._LIMITERS['node.update'] = ir_utils._Limiter()
+        for _i in range(3):
+            limiter.acquire()
+
+        limiter.decrease()
+
+        self.assertEqual(2, limiter.limit)
+        self.assertEqual(1, limiter._debt)
+        # the first released slot pays the debt, the next one is free again
+        limiter.release(0)
+        self.assertEqual(0, limiter._semaphore.balance)
+        limiter.release(0)
+        self.assertEqual(1, limiter._semaphore.balance)
+        limiter.increase()
+        self.assertEqual(3, limiter.limit)
+        self.assertEqual(2, limiter._semaphore.balance)
+
+    def test_disabled(self, mock_sleep):
+        self.cfg.config(max_concurrent_requests=0, group='ironic')
+        self.func.side_effect = [ironic_exc.Conflict(), 'node']
+
+        self.assertEqual('node', self.manager.update('uuid', []))
+
+        self.assertEqual(0, ir_utils.request_statistics()['node.update'][
+            'limit'])
+
+    def test_non_callable_not_wrapped(self, mock_sleep):
+        self.manager._manager.resource_class = 'Node'
+        self.assertEqual('Node', self.manager.resource_class)
+
 
 class TestGetIpmiAddress(base.BaseTest):
     def test_ipv4_in_resolves(self):
@@ -116,6 +334,150 @@ class TestGetIpmiAddress(base.BaseTest):
         self.assertIsNone(ip)
 
 
+@mock.patch.object(time, 'time', autospec=True, return_value=100)
+@mock.patch.object(socket, 'gethostbyname', autospec=True)
+class TestResolutionCache(base.BaseTest):
+    def setUp(self):
+        super(TestResolutionCache, self).setUp()
+        self.node = mock.Mock(spec=['driver_info', 'uuid'],
+                              driver_info={'ipmi_address': 'bmc.example.com'},
+                              uuid='uuid1')
+        self.stats = ir_utils.resolution_statistics()
+
+    def assertStatistics(self, hits, misses, cached):
+        self.assertEqual({'hits': self.stats['hits'] + hits,
+                          'misses': self.stats['misses'] + misses,
+                          'cached': cached},
+                         ir_utils.resolution_statistics())
+
+    def test_cached(self, mock_resolve, mock_time):
+        mock_resolve.return_value = '192.168.1.1'
+        for _i in range(3):
+            self.assertEqual('192.168.1.1',
+                             ir_utils.get_ipmi_address(self.node))
+        mock_resolve.assert_called_once_with('bmc.example.com')
+        self.assertStatistics(hits=2, misses=1, cached=1)
+
+    def test_expired(self, mock_resolve, mock_time):
+        mock_resolve.return_value = '192.168.1.1'
+        ir_utils.get_ipmi_address(self.node)
+        mock_time.return_value = 100 + CONF.bmc_address_cache_ttl
+        mock_resolve.return_value = '192.168.1.2'
+
+        self.assertEqual('192.168.1.2', ir_utils.get_ipmi_address(self.node))
+        self.assertEqual(2, mock_resolve.call_count)
+
+    def test_failure_cached(self, mock_resolve, mock_time):
+        mock_resolve.side_effect = socket.gaierror('boom')
+        for _i in range(2):
+            self.assertRaises(utils.Error, ir_utils.get_ipmi_address,
+                              self.node)
+        mock_resolve.assert_called_once_with('bmc.example.com')
+
+        mock_time.return_value = 100 + CONF.bmc_address_negative_cache_ttl
+        mock_resolve.side_effect = None
+        mock_resolve.return_value = '192.168.1.1'
+        self.assertEqual('192.168.1.1', ir_utils.get_ipmi_address(self.node))
+
+    def test_disabled(self, mock_resolve, mock_time):
+        self.cfg.config(bmc_address_cache_ttl=0)
+        mock_resolve.return_value = '192.168.1.1'
+        for _i in range(2):
+            ir_utils.get_ipmi_address(self.node)
+        self.assertEqual(2, mock_resolve.call_count)
+        self.assertStatistics(hits=0, misses=2, cached=0)
+
+    @mock.patch.object(ir_utils, '_MAX_RESOLVED', 2)
+    def test_bounded(self, mock_resolve, mock_time):
+        mock_resolve.return_value = '192.168.1.1'
+        for name in ('a', 'b', 'a', 'c'):
+            self.node.driver_info['ipmi_address'] = name
+            ir_utils.get_ipmi_address(self.node)
+        self.assertEqual(['a', 'c'], list(ir_utils._RESOLVED))
+
+    def test_ip_address_not_resolved(self, mock_resolve, mock_time):
+        self.node.driver_info['ipmi_address'] = '192.168.1.1'
+        self.assertEqual('192.168.1.1', ir_utils.get_ipmi_address(self.node))
+        self.assertFalse(mock_resolve.called)
+        self.assertStatistics(hits=0, misses=0, cached=0)
+
+    def test_bulk(self, mock_resolve, mock_time):
+        def _resolve(name):
+            try:
+                return {'bmc.example.com': '192.168.1.1',
+                        'bmc2.example.com': '192.168.1.2'}[name]
+            except KeyError:
+                raise socket.gaierror(name)
+        mock_resolve.side_effect = _resolve
+        nodes = [self.node,
+                 mock.Mock(driver_info={'ipmi_address': 'bmc2.example.com'}),
+                 mock.Mock(driver_info={'ipmi_address': 'bmc.example.com'}),
+                 mock.Mock(driver_info={'ipmi_address': '192.168.1.3'}),
+                 mock.Mock(driver_info={'ipmi_address': 'nope'}),
+                 mock.Mock(driver_info={})]
+
+        ir_utils.resolve_ipmi_addresses(nodes)
+
+        self.assertEqual(3, mock_resolve.call_count)
+        self.assertStatistics(hits=0, misses=3, cached=3)
+        self.assertEqual('192.168.1.2', ir_utils.get_ipmi_address(nodes[1]))
+        self.assertRaises(utils.Error, ir_utils.get_ipmi_address, nodes[4])
+        self.assertEqual(3, mock_resolve.call_count)
+
+
+@mock.patch.object(time, 'time', autospec=True, return_value=100)
+class TestGetNodeUuid(base.BaseTest):
+    def setUp(self):
+        super(TestGetNodeUuid, self).setUp()
+        self.ironic = mock.Mock()
+        self.uuid = '0b01956c-a97d-4f46-bb59-a8e9064bb088'
+        self.ironic.node.get.return_value = mock.Mock(uuid=self.uuid)
+
+    def test_uuid(self, mock_time):
+        self.assertEqual(self.uuid,
+                         ir_utils.get_node_uuid(self.uuid, self.ironic))
+        self.assertFalse(self.ironic.node.get.called)
+
+    def test_name_cached(self, mock_time):
+        for _i in range(2):
+            self.assertEqual(self.uuid,
+                             ir_utils.get_node_uuid('name', self.ironic))
+        self.ironic.node.get.assert_called_once_with('name', fields=['uuid'])
+
+        mock_time.return_value = 100 + CONF.ironic.node_name_cache_ttl
+        ir_utils.get_node_uuid('name', self.ironic)
+        self.assertEqual(2, self.ironic.node.get.call_count)
+
+    def test_not_found_not_cached(self, mock_time):
+        self.ironic.node.get.side_effect = ironic_exc.NotFound()
+        for _i in range(2):
+            self.assertRaises(ir_utils.NotFound, ir_utils.get_node_uuid,
+                              'name', self.ironic)
+        self.assertEqual(2, self.ironic.node.get.call_count)
+
+    def test_disabled(self, mock_time):
+        self.cfg.config(node_name_cache_ttl=0, group='ironic')
+        for _i in range(2):
+            ir_utils.get_node_uuid('name', self.ironic)
+        self.assertEqual(2, self.ironic.node.get.call_count)
+
+    @mock.patch.object(ir_utils, '_MAX_NODE_UUIDS', 2)
+    def test_bounded(self, mock_time):
+        for name in ('a', 'b', 'a', 'c'):
+            ir_utils.get_node_uuid(name, self.ironic)
+        self.assertEqual(['a', 'c'], list(ir_utils._NODE_UUIDS))
+
+    def test_invalidate(self, mock_time):
+        ir_utils.get_node_uuid('name', self.ironic)
+        ir_utils.invalidate_node_names(['other'])
+        ir_utils.get_node_uuid('name', self.ironic)
+        self.assertEqual(1, self.ironic.node.get.call_count)
+
+        ir_utils.invalidate_node_names([self.uuid])
+        ir_utils.get_node_uuid('name', self.ironic)
+        self.assertEqual(2, self.ironic.node.get.call_count)
+
+
 class TestCapabilities(unittest.TestCase):
 
     def test_capabilities_to_dict(self):
@@ -129,3 +491,17 @@ class TestCapabilities(unittest.TestCase):
         output = ir_utils.dict_to_capabilities(capabilities_dict)
         self.assertIn('cat:meow', output)
         self.assertIn('dog:wuff', output)
+
+
+class TestGetNode(base.BaseTest):
+    def test_ok(self):
+        ironic = mock.Mock()
+        node = ir_utils.get_node('uuid', ironic=ironic, fields=['uuid'])
+        self.assertIs(ironic.node.get.return_value, node)
+        ironic.node.get.assert_called_once_with('uuid', fields=['uuid'])
+
+    def test_not_found(self):
+        ironic = mock.Mock()
+        ironic.node.get.side_effect = ironic_exc.NotFound()
+        self.assertRaises(ir_utils.NotFound, ir_utils.get_node, 'uuid',
+                          ironic=ironic)
@@ -13,15 +13,22 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import json
+import os
 import subprocess
 
+import eventlet
+import fixtures
 import mock
 from oslo_config import cfg
+from oslo_rootwrap import client as rootwrap_client
 
 from ironic_inspector.common import ironic as ir_utils
 from ironic_inspector import firewall
 from ironic_inspector import introspection_state as istate
 from ironic_inspector import node_cache
+from ironic_inspector.plugins import base as plugins_base
+from ironic_inspector import port_cache
 from ironic_inspector.test import base as test_base
 
 
@@ -38,6 +45,10 @@ EMAC=02:00:00:61:00:02 IMAC=61:fe:80:00:00:00:00:00:00:7c:fe:90:03:00:29:24:4f
 class TestFirewall(test_base.NodeTest):
     CLIENT_ID = 'ff:00:00:00:00:00:02:00:00:02:c9:00:7c:fe:90:03:00:29:24:4f'
 
+    def setUp(self):
+        super(TestFirewall, self).setUp()
+        CONF.set_override('port_cache_refresh_period', 0, 'firewall')
+
     def test_update_filters_without_manage_firewall(self, mock_call,
                                                     mock_get_client,
                                                     mock_iptables):
@@ -443,3 +454,688 @@ class TestFirewall(test_base.NodeTest):
         for (args, call) in zip(update_filters_expected_args,
                                 call_args_list):
             self.assertEqual(args, call[0])
+
+
+@mock.patch.object(firewall, '_iptables')
+@mock.patch.object(subprocess, 'Popen')
+@mock.patch.object(subprocess, 'check_call')
+class TestFirewallRestore(test_base.NodeTest):
+    def setUp(self):
+        super(TestFirewallRestore, self).setUp()
+        CONF.set_override('port_cache_refresh_period', 0, 'firewall')
+        patcher = mock.patch.object(firewall, 'ENABLED', True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        CONF.set_override('firewall_backend', 'iptables-restore', 'firewall')
+        self.ironic = mock.Mock()
+        self.ironic.port.list.return_value = [
+            mock.Mock(address=mac)
+            for mac in ('11:22:33:44:55:66', 'aa:bb:cc:dd:ee:ff')]
+        node_cache.add_node(self.node.uuid, mac=['11:22:33:44:55:66'],
+                            state=istate.States.waiting,
+                            bmc_address='1.2.3.4')
+        self.chain = CONF.firewall.firewall_chain
+        self.jump = ('-I INPUT -i br-ctlplane -p udp --dport 67 -j %s'
+                     % self.chain)
+
+    def _restored(self, mock_popen):
+        return [call[0][0].split('\n')
+                for call in
+                mock_popen.return_value.communicate.call_args_list]
+
+    def test_update_filters(self, mock_call, mock_popen, mock_iptables):
+        mock_popen.return_value.communicate.return_value = ('', None)
+        mock_popen.return_value.returncode = 0
+        firewall.init()
+        mock_iptables.reset_mock()
+
+        firewall.update_filters(self.ironic)
+
+        self.assertFalse(mock_iptables.called)
+        mock_popen.assert_called_once_with(
+            ('sudo', 'ironic-inspector-rootwrap', CONF.rootwrap_config,
+             'iptables-restore', '--noflush'),
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT, universal_newlines=True)
+        self.assertEqual([['*filter',
+                           ':%s - [0:0]' % self.chain,
+                           '-A %s -m mac --mac-source aa:bb:cc:dd:ee:ff '
+                           '-j DROP' % self.chain,
+                           '-A %s -j ACCEPT' % self.chain,
+                           self.jump,
+                           'COMMIT',
+                           '']],
+                         self._restored(mock_popen))
+        self.assertEqual({'aa:bb:cc:dd:ee:ff'}, firewall.BLACKLIST_CACHE)
+
+        # The jump to the chain is only added once
+        self.ironic.port.list.return_value.append(
+            mock.Mock(address='aa:aa:aa:aa:aa:aa'))
+        firewall.update_filters(self.ironic)
+        self.assertEqual(2, mock_popen.call_count)
+        self.assertNotIn(self.jump, self._restored(mock_popen)[1])
+
+    def test_disable_dhcp(self, mock_call, mock_popen, mock_iptables):
+        mock_popen.return_value.communicate.return_value = ('', None)
+        mock_popen.return_value.returncode = 0
+        node_cache._delete_nodes_removed_from_ironic(
+            node_cache._list_node_uuids())
+        firewall.init()
+
+        firewall.update_filters(self.ironic)
+
+        self.assertEqual([['*filter',
+                           ':%s - [0:0]' % self.chain,
+                           '-A %s -j REJECT' % self.chain,
+                           self.jump,
+                           'COMMIT',
+                           '']],
+                         self._restored(mock_popen))
+        self.assertFalse(firewall.ENABLED)
+
+    def test_failure(self, mock_call, mock_popen, mock_iptables):
+        mock_popen.return_value.communicate.return_value = ('boom\n', None)
+        mock_popen.return_value.returncode = 1
+        firewall.init()
+
+        self.assertRaises(subprocess.CalledProcessError,
+                          firewall.update_filters, self.ironic)
+        self.assertIsNone(firewall.BLACKLIST_CACHE)
+        self.assertFalse(firewall.JUMP_INSTALLED)
+
+
+@mock.patch.object(firewall, '_iptables')
+@mock.patch.object(subprocess, 'Popen')
+@mock.patch.object(subprocess, 'check_call')
+class TestFirewallIpset(test_base.NodeTest):
+    def setUp(self):
+        super(TestFirewallIpset, self).setUp()
+        CONF.set_override('port_cache_refresh_period', 0, 'firewall')
+        for name, value in [('ENABLED', True), ('_ipset', mock.DEFAULT)]:
+            patcher = mock.patch.object(firewall, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        CONF.set_override('firewall_backend', 'ipset', 'firewall')
+        self.ironic = mock.Mock()
+        self.ports = [mock.Mock(address=mac)
+                      for mac in ('11:22:33:44:55:66', 'aa:bb:cc:dd:ee:ff')]
+        self.ironic.port.list.return_value = self.ports
+        node_cache.add_node(self.node.uuid, mac=['11:22:33:44:55:66'],
+                            state=istate.States.waiting,
+                            bmc_address='1.2.3.4')
+        self.ipset = CONF.firewall.ipset_name
+
+    def _restored(self, mock_popen):
+        return [call[0][0].split('\n')
+                for call in
+                mock_popen.return_value.communicate.call_args_list]
+
+    def _succeed(self, mock_popen):
+        mock_popen.return_value.communicate.return_value = ('', None)
+        mock_popen.return_value.returncode = 0
+
+    def test_init(self, mock_call, mock_popen, mock_iptables):
+        firewall.init()
+        firewall._ipset.assert_called_once_with('create', self.ipset,
+                                                'hash:mac', '-exist')
+
+        firewall.clean_up()
+        firewall._ipset.assert_called_with('destroy', self.ipset,
+                                           ignore=True)
+
+    def test_update_filters(self, mock_call, mock_popen, mock_iptables):
+        self._succeed(mock_popen)
+        firewall.init()
+        mock_iptables.reset_mock()
+
+        firewall.update_filters(self.ironic)
+
+        mock_popen.assert_called_once_with(
+            ('sudo', 'ironic-inspector-rootwrap', CONF.rootwrap_config,
+             'ipset', 'restore', '-exist'),
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT, universal_newlines=True)
+        self.assertEqual([['flush %s' % self.ipset,
+                           'add %s aa:bb:cc:dd:ee:ff' % self.ipset,
+                           '']],
+                         self._restored(mock_popen))
+        mock_iptables.assert_any_call('-A', firewall.NEW_CHAIN,
+                                      '-m', 'set', '--match-set', self.ipset,
+                                      'src', '-j', 'DROP')
+        mock_iptables.assert_any_call('-A', firewall.NEW_CHAIN,
+                                      '-j', 'ACCEPT')
+        self.assertEqual({'aa:bb:cc:dd:ee:ff'}, firewall.IPSET_ENTRIES)
+
+        # Only changes are applied, the chain is not touched
+        mock_iptables.reset_mock()
+        mock_popen.return_value.communicate.reset_mock()
+        self.ports[1] = mock.Mock(address='00:00:00:00:00:01')
+        firewall.update_filters(self.ironic)
+
+        self.assertFalse(mock_iptables.called)
+        self.assertEqual([['del %s aa:bb:cc:dd:ee:ff' % self.ipset,
+                           'add %s 00:00:00:00:00:01' % self.ipset,
+                           '']],
+                         self._restored(mock_popen))
+        self.assertEqual({'00:00:00:00:00:01'}, firewall.IPSET_ENTRIES)
+
+        # Nothing changed
+        mock_popen.reset_mock()
+        firewall.update_filters(self.ironic)
+        self.assertFalse(mock_popen.called)
+        self.assertFalse(mock_iptables.called)
+
+    def test_update_filters_failure(self, mock_call, mock_popen,
+                                    mock_iptables):
+        self._succeed(mock_popen)
+        firewall.init()
+        firewall.update_filters(self.ironic)
+
+        mock_popen.return_value.returncode = 1
+        self.ports.append(mock.Mock(address='00:00:00:00:00:01'))
+        self.assertRaises(subprocess.CalledProcessError,
+                          firewall.update_filters, self.ironic)
+        self.assertIsNone(firewall.IPSET_ENTRIES)
+
+        # The ipset is rebuilt on the next run
+        mock_popen.return_value.returncode = 0
+        mock_popen.return_value.communicate.reset_mock()
+        firewall.update_filters(self.ironic)
+        self.assertEqual('flush %s' % self.ipset,
+                         self._restored(mock_popen)[0][0])
+
+    def test_enable_after_disable(self, mock_call, mock_popen,
+                                  mock_iptables):
+        self._succeed(mock_popen)
+        firewall.init()
+        firewall.update_filters(self.ironic)
+
+        node_cache._delete_nodes_removed_from_ironic(
+            node_cache._list_node_uuids())
+        firewall.update_filters(self.ironic)
+        self.assertFalse(firewall.ENABLED)
+        mock_iptables.assert_any_call('-A', firewall.NEW_CHAIN,
+                                      '-j', 'REJECT')
+
+        node_cache.add_node(self.node.uuid, mac=['11:22:33:44:55:66'],
+                            state=istate.States.waiting,
+                            bmc_address='1.2.3.4')
+        mock_iptables.reset_mock()
+        mock_popen.return_value.communicate.reset_mock()
+        firewall.update_filters(self.ironic)
+
+        self.assertTrue(firewall.ENABLED)
+        self.assertEqual('flush %s' % self.ipset,
+                         self._restored(mock_popen)[0][0])
+        mock_iptables.assert_any_call('-A', firewall.NEW_CHAIN,
+                                      '-m', 'set', '--match-set', self.ipset,
+                                      'src', '-j', 'DROP')
+
+
+@mock.patch.object(firewall, '_iptables')
+@mock.patch.object(subprocess, 'check_call')
+class TestFirewallWhitelist(test_base.NodeTest):
+    def setUp(self):
+        super(TestFirewallWhitelist, self).setUp()
+        CONF.set_override('port_cache_refresh_period', 0, 'firewall')
+        patcher = mock.patch.object(firewall, 'ENABLED', True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        CONF.set_override('filter_mode', 'whitelist', 'firewall')
+        self.ironic = mock.Mock()
+        self.ironic.port.list.return_value = [
+            mock.Mock(address=mac)
+            for mac in ('11:22:33:44:55:66', 'aa:bb:cc:dd:ee:ff')]
+        node_cache.add_node(self.node.uuid, mac=['11:22:33:44:55:66'],
+                            state=istate.States.waiting,
+                            bmc_address='1.2.3.4')
+
+    def test_update_filters(self, mock_call, mock_iptables):
+        firewall.init()
+        mock_iptables.reset_mock()
+
+        firewall.update_filters(self.ironic)
+
+        self.assertFalse(self.ironic.port.list.called)
+        rules = [call[0] for call in mock_iptables.call_args_list
+                 if call[0][:2] == ('-A', firewall.NEW_CHAIN)]
+        self.assertEqual([('-A', firewall.NEW_CHAIN, '-m', 'mac',
+                           '--mac-source', '11:22:33:44:55:66',
+                           '-j', 'ACCEPT'),
+                          ('-A', firewall.NEW_CHAIN, '-j', 'DROP')],
+                         rules)
+        self.assertEqual({'11:22:33:44:55:66'}, firewall.WHITELIST_CACHE)
+        self.assertIsNone(firewall.BLACKLIST_CACHE)
+
+        # check caching
+        mock_iptables.reset_mock()
+        firewall.update_filters(self.ironic)
+        self.assertFalse(mock_iptables.called)
+
+    def test_update_filters_node_not_found_hook(self, mock_call,
+                                                mock_iptables):
+        CONF.set_override('node_not_found_hook', 'enroll', 'processing')
+        firewall.init()
+        mock_iptables.reset_mock()
+
+        firewall.update_filters(self.ironic)
+
+        self.ironic.port.list.assert_called_once_with(
+            limit=0, fields=port_cache.FIELDS)
+        mock_iptables.assert_any_call('-A', firewall.NEW_CHAIN, '-m', 'mac',
+                                      '--mac-source', 'aa:bb:cc:dd:ee:ff',
+                                      '-j', 'DROP')
+        mock_iptables.assert_any_call('-A', firewall.NEW_CHAIN,
+                                      '-j', 'ACCEPT')
+        self.assertIsNone(firewall.WHITELIST_CACHE)
+
+    def test_update_filters_infiniband(self, mock_call, mock_iptables):
+        CONF.set_override('ethoib_interfaces', ['eth0'], 'firewall')
+        self.ironic.port.list.return_value = [
+            mock.Mock(address='11:22:33:44:55:66',
+                      extra={'client-id': TestFirewall.CLIENT_ID},
+                      spec=['address', 'extra'])]
+        firewall.init()
+
+        fileobj = mock.mock_open(read_data=IB_DATA)
+        with mock.patch('six.moves.builtins.open', fileobj, create=True):
+            firewall.update_filters(self.ironic)
+
+        self.ironic.port.list.assert_called_once_with(
+            address='11:22:33:44:55:66', fields=['address', 'extra'])
+        mock_iptables.assert_any_call('-A', firewall.NEW_CHAIN, '-m', 'mac',
+                                      '--mac-source', '02:00:00:61:00:02',
+                                      '-j', 'ACCEPT')
+
+    @mock.patch.object(firewall, '_update_ipset', autospec=True)
+    def test_update_filters_ipset(self, mock_ipset, mock_call,
+                                  mock_iptables):
+        CONF.set_override('firewall_backend', 'ipset', 'firewall')
+        with mock.patch.object(firewall, '_ipset'):
+            firewall.init()
+
+        firewall.update_filters(self.ironic)
+
+        mock_ipset.assert_called_once_with({'11:22:33:44:55:66'},
+                                           'ACCEPT', 'DROP')
+
+
+@mock.patch.object(plugins_base, 'pxe_filter_driver', autospec=True)
+class TestFilterDriver(test_base.BaseTest):
+    def test_dispatch(self, mock_driver):
+        firewall.init()
+        mock_driver.return_value.init.assert_called_once_with()
+        firewall.update_filters(mock.sentinel.ironic)
+        mock_driver.return_value.update_filters.assert_called_once_with(
+            mock.sentinel.ironic)
+        firewall.clean_up()
+        mock_driver.return_value.clean_up.assert_called_once_with()
+
+    def test_disabled(self, mock_driver):
+        CONF.set_override('manage_firewall', False, 'firewall')
+        firewall.init()
+        firewall.update_filters()
+        firewall.clean_up()
+        self.assertFalse(mock_driver.called)
+
+
+class TestDefaultFilterDriver(test_base.BaseTest):
+    def test_iptables(self):
+        self.assertIsInstance(plugins_base.pxe_filter_driver(),
+                              firewall.IptablesFilter)
+
+
+@mock.patch.object(firewall, 'update_filters', autospec=True)
+@mock.patch.object(eventlet, 'spawn_after', autospec=True)
+class TestRequestUpdate(test_base.NodeTest):
+    def setUp(self):
+        super(TestRequestUpdate, self).setUp()
+        firewall._PENDING_UPDATE = None
+        self.addCleanup(setattr, firewall, '_PENDING_UPDATE', None)
+
+    def test_coalesced(self, mock_spawn, mock_update):
+        for _i in range(3):
+            firewall.request_update()
+
+        mock_spawn.assert_called_once_with(
+            CONF.firewall.firewall_update_delay, firewall._scheduled_update)
+        self.assertFalse(mock_update.called)
+
+        firewall._scheduled_update()
+        mock_update.assert_called_once_with()
+        self.assertIsNone(firewall._PENDING_UPDATE)
+
+        firewall.request_update()
+        self.assertEqual(2, mock_spawn.call_count)
+
+    def test_wait(self, mock_spawn, mock_update):
+        mock_spawn.side_effect = lambda delay, func: eventlet.spawn(func)
+        firewall.request_update(wait=True)
+        mock_update.assert_called_once_with()
+
+    def test_wait_failure(self, mock_spawn, mock_update):
+        mock_spawn.side_effect = lambda delay, func: eventlet.spawn(func)
+        mock_update.side_effect = RuntimeError('boom')
+        self.assertRaises(RuntimeError, firewall.request_update, wait=True)
+        self.assertIsNone(firewall._PENDING_UPDATE)
+
+    def test_failure_without_waiters(self, mock_spawn, mock_update):
+        mock_update.side_effect = RuntimeError('boom')
+        firewall.request_update()
+        firewall._scheduled_update()
+        mock_update.assert_called_once_with()
+
+    def test_disabled(self, mock_spawn, mock_update):
+        CONF.set_override('manage_firewall', False, 'firewall')
+        firewall.request_update(wait=True)
+        self.assertFalse(mock_spawn.called)
+
+    @mock.patch.object(plugins_base, 'pxe_filter_driver', autospec=True)
+    def test_registered_on_init(self, mock_driver, mock_spawn, mock_update):
+        firewall.init()
+        node_cache.add_node(self.uuid, istate.States.starting)
+        mock_spawn.assert_called_once_with(
+            CONF.firewall.firewall_update_delay, firewall._scheduled_update)
+
+
+class TestEoibNeighs(test_base.BaseTest):
+    def setUp(self):
+        super(TestEoibNeighs, self).setUp()
+        firewall._NEIGHS_CACHE.clear()
+        CONF.set_override('ethoib_interfaces', ['eth0'], 'firewall')
+        self.port = mock.Mock(address='7c:fe:90:29:24:4f',
+                              extra={'client-id': TestFirewall.CLIENT_ID},
+                              spec=['address', 'extra'])
+
+    def neighs(self, data=IB_DATA):
+        fileobj = mock.mock_open(read_data=data)
+        with mock.patch('six.moves.builtins.open', fileobj, create=True):
+            return firewall._eoib_neighs('eth0')
+
+    def test_parse(self):
+        self.assertEqual({'7c:fe:90:03:00:29:26:52': '02:00:02:97:00:01',
+                          '7c:fe:90:03:00:29:24:4f': '02:00:00:61:00:02'},
+                         self.neighs())
+
+    @mock.patch.object(firewall, 'NEIGH_REGEX', wraps=firewall.NEIGH_REGEX)
+    def test_parsed_once(self, mock_regex):
+        first = self.neighs()
+        self.assertIs(first, self.neighs())
+        self.assertEqual(1, mock_regex.finditer.call_count)
+
+        self.neighs(IB_DATA + 'EMAC=02:00:00:61:00:03 IMAC=61:fe:80:00:00'
+                    ':00:00:00:00:7c:fe:90:03:00:29:24:50\n')
+        self.assertEqual(2, mock_regex.finditer.call_count)
+
+    def test_no_such_file(self):
+        with mock.patch('six.moves.builtins.open', side_effect=IOError()):
+            self.assertIsNone(firewall._eoib_neighs('eth0'))
+
+    def test_mapping(self):
+        fileobj = mock.mock_open(read_data=IB_DATA)
+        with mock.patch('six.moves.builtins.open', fileobj, create=True):
+            mapping = firewall._ib_mac_to_rmac_mapping(
+                {self.port.address, '11:22:33:44:55:66'},
+                [self.port, mock.Mock(address='11:22:33:44:55:66',
+                                      extra={})])
+        self.assertEqual({self.port.address: '02:00:00:61:00:02'}, mapping)
+
+    @mock.patch.object(firewall, '_apply_filter', autospec=True)
+    @mock.patch.object(port_cache, 'ports', autospec=True)
+    def test_rebuild_only_on_changes(self, mock_ports, mock_apply):
+        firewall.BLACKLIST_CACHE = None
+        self.addCleanup(setattr, firewall, 'BLACKLIST_CACHE', None)
+        mock_ports.return_value = [self.port]
+
+        for _i in range(2):
+            self.neighs_update(IB_DATA)
+        mock_apply.assert_called_once_with({'02:00:00:61:00:02'},
+                                           whitelist=False)
+
+        self.neighs_update(IB_DATA.replace('02:00:00:61:00:02',
+                                           '02:00:00:61:00:03'))
+        mock_apply.assert_called_with({'02:00:00:61:00:03'},
+                                      whitelist=False)
+        self.assertEqual(2, mock_apply.call_count)
+
+    def neighs_update(self, data):
+        fileobj = mock.mock_open(read_data=data)
+        with mock.patch('six.moves.builtins.open', fileobj, create=True):
+            firewall._update_blacklist(mock.Mock())
+
+
+@mock.patch.object(rootwrap_client, 'Client', autospec=True)
+@mock.patch.object(subprocess, 'check_call', autospec=True)
+@mock.patch.object(subprocess, 'check_output', autospec=True)
+class TestRootwrapDaemon(test_base.BaseTest):
+    def setUp(self):
+        super(TestRootwrapDaemon, self).setUp()
+        CONF.set_override('use_rootwrap_daemon', True, 'firewall')
+        CONF.set_override('rootwrap_config', '/rootwrap.conf')
+        firewall._COMMAND_STATISTICS.clear()
+        self.addCleanup(setattr, firewall, 'ROOTWRAP_CLIENT', None)
+
+    def init(self, mock_client):
+        self.client = mock_client.return_value
+        self.client.execute.return_value = (0, '', '')
+        firewall.init()
+        mock_client.assert_called_once_with(
+            ['sudo', 'ironic-inspector-rootwrap-daemon', '/rootwrap.conf'])
+
+    def test_init(self, mock_output, mock_call, mock_client):
+        self.init(mock_client)
+
+        self.assertEqual(
+            [mock.call(['iptables', '-w', '-h'], None),
+             mock.call(['iptables', '-w', '-D', 'INPUT', '-i', 'br-ctlplane',
+                        '-p', 'udp', '--dport', '67', '-j',
+                        'ironic-inspector'], None),
+             mock.call(['iptables', '-w', '-F', 'ironic-inspector'], None),
+             mock.call(['iptables', '-w', '-X', 'ironic-inspector'], None),
+             mock.call(['iptables', '-w', '-N', 'ironic-inspector'], None)],
+            self.client.execute.call_args_list)
+        self.assertFalse(mock_output.called)
+        self.assertFalse(mock_call.called)
+
+    def test_init_old_iptables(self, mock_output, mock_call, mock_client):
+        mock_client.return_value.execute.side_effect = [
+            (2, '', 'unknown option'), (0, '', ''), (0, '', ''),
+            (0, '', ''), (0, '', '')]
+        firewall.init()
+        self.assertEqual(('sudo', 'ironic-inspector-rootwrap',
+                          '/rootwrap.conf', 'iptables'),
+                         firewall.BASE_COMMAND)
+
+    def test_failure(self, mock_output, mock_call, mock_client):
+        self.init(mock_client)
+        self.client.execute.return_value = (1, 'out\n', 'err')
+
+        firewall._iptables('-F', 'chain', ignore=True)
+        exc = self.assertRaises(subprocess.CalledProcessError,
+                                firewall._iptables, '-F', 'chain')
+        self.assertEqual(1, exc.returncode)
+        self.assertEqual('out\nerr', exc.output)
+
+    def test_restore(self, mock_output, mock_call, mock_client):
+        self.init(mock_client)
+        firewall.ipset_restore(['add set mac'])
+        self.client.execute.assert_called_with(
+            ['ipset', 'restore', '-exist'], 'add set mac\n')
+
+    def test_not_rootwrap_command(self, mock_output, mock_call, mock_client):
+        self.init(mock_client)
+        self.client.execute.reset_mock()
+        mock_output.return_value = ''
+
+        firewall._execute(('/fake/iptables',), 'iptables', ('-L',))
+
+        mock_output.assert_called_once_with(
+            ('/fake/iptables', '-L'), stderr=subprocess.STDOUT,
+            universal_newlines=True)
+        self.assertFalse(self.client.execute.called)
+
+    def test_statistics(self, mock_output, mock_call, mock_client):
+        self.init(mock_client)
+        firewall.ipset_restore(['add set mac'])
+
+        stats = firewall.command_statistics()
+        self.assertEqual({'iptables', 'ipset'}, set(stats))
+        self.assertEqual(5, stats['iptables']['count'])
+        self.assertEqual(1, stats['ipset']['count'])
+        self.assertEqual(stats['iptables']['total_time'] / 5,
+                         stats['iptables']['average_time'])
+
+
+@mock.patch.object(firewall, '_iptables', autospec=True)
+@mock.patch.object(firewall, '_run', autospec=True)
+@mock.patch.object(firewall, '_iptables_supports_wait', lambda: True)
+class TestWarmStart(test_base.NodeTest):
+    def setUp(self):
+        super(TestWarmStart, self).setUp()
+        self.state_file = os.path.join(
+            self.useFixture(fixtures.TempDir()).path, 'state.json')
+        CONF.set_override('state_file', self.state_file, 'firewall')
+        CONF.set_override('port_cache_refresh_period', 0, 'firewall')
+        self.ironic = mock.Mock()
+        self.ironic.port.list.return_value = [
+            mock.Mock(address=mac, extra={})
+            for mac in ('11:22:33:44:55:66', 'aa:bb:cc:dd:ee:ff')]
+        node_cache.add_node(self.node.uuid, mac=['11:22:33:44:55:66'],
+                            state=istate.States.waiting,
+                            bmc_address='1.2.3.4')
+        self.chain = CONF.firewall.firewall_chain
+        self.rules = ('-N %(chain)s\n'
+                      '-A %(chain)s -m mac --mac-source AA:BB:CC:DD:EE:FF '
+                      '-j DROP\n'
+                      '-A %(chain)s -j ACCEPT\n' % {'chain': self.chain})
+        for name in ('ENABLED', 'BLACKLIST_CACHE', 'WHITELIST_CACHE',
+                     'IB_MAPPING_CACHE', 'IPSET_ENTRIES', 'GENERATION'):
+            patcher = mock.patch.object(firewall, name,
+                                        getattr(firewall, name))
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def load(self):
+        with open(self.state_file) as fp:
+            return json.load(fp)
+
+    def save(self, mock_run, mock_iptables):
+        firewall.init()
+        firewall.update_filters(self.ironic)
+        mock_run.reset_mock()
+        mock_iptables.reset_mock()
+
+    def test_save(self, mock_run, mock_iptables):
+        self.save(mock_run, mock_iptables)
+        self.assertEqual({'generation': 1,
+                          'backend': 'iptables',
+                          'chain': self.chain,
+                          'interface': 'br-ctlplane',
+                          'ipset': 'ironic-inspector',
+                          'mode': 'blacklist',
+                          'macs': ['aa:bb:cc:dd:ee:ff'],
+                          'ib_mapping': {}}, self.load())
+
+        self.ironic.port.list.return_value.append(
+            mock.Mock(address='12:12:12:12:12:12', extra={}))
+        firewall.update_filters(self.ironic)
+        state = self.load()
+        self.assertEqual(2, state['generation'])
+        self.assertEqual(['12:12:12:12:12:12', 'aa:bb:cc:dd:ee:ff'],
+                         state['macs'])
+
+    def test_adopt(self, mock_run, mock_iptables):
+        self.save(mock_run, mock_iptables)
+        firewall.BLACKLIST_CACHE = None
+        mock_run.side_effect = [(0, ''), (0, self.rules)]
+
+        firewall.init()
+
+        mock_run.assert_has_calls([
+            mock.call(firewall.BASE_COMMAND + ('-C',) +
+                      firewall._dhcp_jump(self.chain)),
+            mock.call(firewall.BASE_COMMAND + ('-S', self.chain))])
+        self.assertFalse(mock_iptables.called)
+        self.assertEqual({'aa:bb:cc:dd:ee:ff'}, firewall.BLACKLIST_CACHE)
+        self.assertEqual(1, firewall.GENERATION)
+
+        firewall.update_filters(self.ironic)
+        self.assertFalse(mock_iptables.called)
+
+    def test_adopt_disabled(self, mock_run, mock_iptables):
+        node_cache._delete_nodes_removed_from_ironic(
+            node_cache._list_node_uuids())
+        self.save(mock_run, mock_iptables)
+        self.assertEqual('disabled', self.load()['mode'])
+        mock_run.side_effect = [
+            (0, ''),
+            (0, '-A %s -j REJECT --reject-with icmp-port-unreachable'
+             % self.chain)]
+
+        firewall.init()
+
+        self.assertFalse(mock_iptables.called)
+        self.assertFalse(firewall.ENABLED)
+
+    def test_jump_missing(self, mock_run, mock_iptables):
+        self.save(mock_run, mock_iptables)
+        mock_run.return_value = (1, '')
+
+        firewall.init()
+
+        mock_iptables.assert_any_call('-F', self.chain, ignore=True)
+        mock_iptables.assert_any_call('-N', self.chain)
+        self.assertIsNone(firewall.BLACKLIST_CACHE)
+
+    def test_chain_changed(self, mock_run, mock_iptables):
+        self.save(mock_run, mock_iptables)
+        mock_run.side_effect = [(0, ''),
+                                (0, self.rules.replace('AA:BB', 'AA:BA'))]
+
+        firewall.init()
+
+        mock_iptables.assert_any_call('-N', self.chain)
+        self.assertIsNone(firewall.BLACKLIST_CACHE)
+
+    def test_configuration_changed(self, mock_run, mock_iptables):
+        self.save(mock_run, mock_iptables)
+        CONF.set_override('firewall_chain', 'other', 'firewall')
+
+        firewall.init()
+
+        self.assertFalse(mock_run.called)
+        mock_iptables.assert_any_call('-N', 'other')
+
+    def test_no_state(self, mock_run, mock_iptables):
+        firewall.init()
+        self.assertFalse(mock_run.called)
+        mock_iptables.assert_any_call('-N', self.chain)
+
+    @mock.patch.object(firewall, '_ipset', autospec=True)
+    @mock.patch.object(firewall, 'ipset_restore', autospec=True)
+    def test_adopt_ipset(self, mock_restore, mock_ipset, mock_run,
+                         mock_iptables):
+        CONF.set_override('firewall_backend', 'ipset', 'firewall')
+        self.save(mock_run, mock_iptables)
+        mock_restore.reset_mock()
+        mock_run.side_effect = [
+            (0, ''),
+            (0, '-A %(chain)s -m set --match-set ironic-inspector src -j '
+                'DROP\n-A %(chain)s -j ACCEPT\n' % {'chain': self.chain}),
+            (0, 'Name: ironic-inspector\nType: hash:mac\nMembers:\n'
+                'AA:BB:CC:DD:EE:FF\n')]
+
+        firewall.init()
+
+        mock_run.assert_called_with(firewall.IPSET_COMMAND +
+                                    ('list', 'ironic-inspector'))
+        self.assertEqual({'aa:bb:cc:dd:ee:ff'}, firewall.IPSET_ENTRIES)
+        firewall.update_filters(self.ironic)
+        self.assertFalse(mock_restore.called)
+        self.assertFalse(mock_iptables.called)
+
+    def test_clean_up_keeps_chain(self, mock_run, mock_iptables):
+        firewall.init()
+        mock_iptables.reset_mock()
+        firewall.clean_up()
+        self.assertFalse(mock_iptables.called)
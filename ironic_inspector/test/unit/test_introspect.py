@@ -47,7 +47,7 @@ class BaseTest(test_base.NodeTest):
         return cli
 
 
-@mock.patch.object(firewall, 'update_filters', autospec=True)
+@mock.patch.object(firewall, 'request_update', autospec=True)
 @mock.patch.object(node_cache, 'start_introspection', autospec=True)
 @mock.patch.object(ir_utils, 'get_client', autospec=True)
 class TestIntrospect(BaseTest):
@@ -57,7 +57,8 @@ class TestIntrospect(BaseTest):
 
         introspect.introspect(self.node.uuid)
 
-        cli.node.get.assert_called_once_with(self.uuid)
+        cli.node.get.assert_called_once_with(
+            self.uuid, fields=introspect._NODE_FIELDS)
         cli.node.validate.assert_called_once_with(self.uuid)
 
         start_mock.assert_called_once_with(self.uuid,
@@ -66,7 +67,7 @@ class TestIntrospect(BaseTest):
         self.node_info.ports.assert_called_once_with()
         self.node_info.add_attribute.assert_called_once_with('mac',
                                                              self.macs)
-        filters_mock.assert_called_with(cli)
+        filters_mock.assert_called_with(wait=True)
         cli.node.set_boot_device.assert_called_once_with(self.uuid,
                                                          'pxe',
                                                          persistent=False)
@@ -84,7 +85,8 @@ class TestIntrospect(BaseTest):
 
         introspect.introspect(self.node.uuid)
 
-        cli.node.get.assert_called_once_with(self.uuid)
+        cli.node.get.assert_called_once_with(
+            self.uuid, fields=introspect._NODE_FIELDS)
         cli.node.validate.assert_called_once_with(self.uuid)
 
         start_mock.assert_called_once_with(self.uuid,
@@ -93,7 +95,7 @@ class TestIntrospect(BaseTest):
         self.node_info.ports.assert_called_once_with()
         self.node_info.add_attribute.assert_called_once_with('mac',
                                                              self.macs)
-        filters_mock.assert_called_with(cli)
+        filters_mock.assert_called_with(wait=True)
         cli.node.set_boot_device.assert_called_once_with(self.uuid,
                                                          'pxe',
                                                          persistent=False)
@@ -124,7 +126,8 @@ class TestIntrospect(BaseTest):
 
         introspect.introspect(self.node.uuid)
 
-        cli.node.get.assert_called_once_with(self.uuid)
+        cli.node.get.assert_called_once_with(
+            self.uuid, fields=introspect._NODE_FIELDS)
 
         start_mock.assert_called_once_with(self.uuid,
                                            bmc_address=self.bmc_address,
@@ -146,7 +149,8 @@ class TestIntrospect(BaseTest):
 
         introspect.introspect(self.node.uuid)
 
-        cli.node.get.assert_called_once_with(self.uuid)
+        cli.node.get.assert_called_once_with(
+            self.uuid, fields=introspect._NODE_FIELDS)
 
         start_mock.assert_called_once_with(self.uuid,
                                            bmc_address=self.bmc_address,
@@ -332,7 +336,7 @@ class TestIntrospect(BaseTest):
         self.assertEqual(42, introspect._LAST_INTROSPECTION_TIME)
 
 
-@mock.patch.object(firewall, 'update_filters', autospec=True)
+@mock.patch.object(firewall, 'request_update', autospec=True)
 @mock.patch.object(node_cache, 'start_introspection', autospec=True)
 @mock.patch.object(ir_utils, 'get_client', autospec=True)
 class TestSetIpmiCredentials(BaseTest):
@@ -353,7 +357,7 @@ class TestSetIpmiCredentials(BaseTest):
         start_mock.assert_called_once_with(self.uuid,
                                            bmc_address=self.bmc_address,
                                            ironic=cli)
-        filters_mock.assert_called_with(cli)
+        filters_mock.assert_called_with(wait=True)
         self.assertFalse(cli.node.validate.called)
         self.assertFalse(cli.node.set_boot_device.called)
         self.assertFalse(cli.node.set_power_state.called)
@@ -386,7 +390,7 @@ class TestSetIpmiCredentials(BaseTest):
         start_mock.assert_called_once_with(self.uuid,
                                            bmc_address=self.bmc_address,
                                            ironic=cli)
-        filters_mock.assert_called_with(cli)
+        filters_mock.assert_called_with(wait=True)
         self.assertFalse(cli.node.validate.called)
         self.assertFalse(cli.node.set_boot_device.called)
         self.assertFalse(cli.node.set_power_state.called)
@@ -415,7 +419,6 @@ class TestSetIpmiCredentials(BaseTest):
                           new_ipmi_credentials=self.new_creds)
 
 
-@mock.patch.object(firewall, 'update_filters', autospec=True)
 @mock.patch.object(node_cache, 'get_node', autospec=True)
 @mock.patch.object(ir_utils, 'get_client', autospec=True)
 class TestAbort(BaseTest):
@@ -424,7 +427,7 @@ class TestAbort(BaseTest):
         self.node_info.started_at = None
         self.node_info.finished_at = None
 
-    def test_ok(self, client_mock, get_mock, filters_mock):
+    def test_ok(self, client_mock, get_mock):
         cli = self._prepare(client_mock)
         get_mock.return_value = self.node_info
         self.node_info.acquire_lock.return_value = True
@@ -436,12 +439,11 @@ class TestAbort(BaseTest):
         get_mock.assert_called_once_with(self.uuid, ironic=cli,
                                          locked=False)
         self.node_info.acquire_lock.assert_called_once_with(blocking=False)
-        filters_mock.assert_called_once_with(cli)
         cli.node.set_power_state.assert_called_once_with(self.uuid, 'off')
         self.node_info.finished.assert_called_once_with(error='Canceled '
                                                         'by operator')
 
-    def test_node_not_found(self, client_mock, get_mock, filters_mock):
+    def test_node_not_found(self, client_mock, get_mock):
         cli = self._prepare(client_mock)
         exc = utils.Error('Not found.', code=404)
         get_mock.side_effect = exc
@@ -449,11 +451,10 @@ class TestAbort(BaseTest):
         self.assertRaisesRegex(utils.Error, str(exc),
                                introspect.abort, self.uuid)
 
-        self.assertEqual(0, filters_mock.call_count)
         self.assertEqual(0, cli.node.set_power_state.call_count)
         self.assertEqual(0, self.node_info.finished.call_count)
 
-    def test_node_locked(self, client_mock, get_mock, filters_mock):
+    def test_node_locked(self, client_mock, get_mock):
         cli = self._prepare(client_mock)
         get_mock.return_value = self.node_info
         self.node_info.acquire_lock.return_value = False
@@ -462,12 +463,11 @@ class TestAbort(BaseTest):
         self.assertRaisesRegex(utils.Error, 'Node is locked, please, '
                                'retry later', introspect.abort, self.uuid)
 
-        self.assertEqual(0, filters_mock.call_count)
         self.assertEqual(0, cli.node.set_power_state.call_count)
         self.assertEqual(0, self.node_info.finshed.call_count)
 
     def test_introspection_already_finished(self, client_mock,
-                                            get_mock, filters_mock):
+                                            get_mock):
         cli = self._prepare(client_mock)
         get_mock.return_value = self.node_info
         self.node_info.acquire_lock.return_value = True
@@ -476,31 +476,10 @@ class TestAbort(BaseTest):
 
         introspect.abort(self.uuid)
 
-        self.assertEqual(0, filters_mock.call_count)
         self.assertEqual(0, cli.node.set_power_state.call_count)
         self.assertEqual(0, self.node_info.finshed.call_count)
 
-    def test_firewall_update_exception(self, client_mock, get_mock,
-                                       filters_mock):
-        cli = self._prepare(client_mock)
-        get_mock.return_value = self.node_info
-        self.node_info.acquire_lock.return_value = True
-        self.node_info.started_at = time.time()
-        self.node_info.finished_at = None
-        filters_mock.side_effect = Exception('Boom')
-
-        introspect.abort(self.uuid)
-
-        get_mock.assert_called_once_with(self.uuid, ironic=cli,
-                                         locked=False)
-        self.node_info.acquire_lock.assert_called_once_with(blocking=False)
-        filters_mock.assert_called_once_with(cli)
-        cli.node.set_power_state.assert_called_once_with(self.uuid, 'off')
-        self.node_info.finished.assert_called_once_with(error='Canceled '
-                                                        'by operator')
-
-    def test_node_power_off_exception(self, client_mock, get_mock,
-                                      filters_mock):
+    def test_node_power_off_exception(self, client_mock, get_mock):
         cli = self._prepare(client_mock)
         get_mock.return_value = self.node_info
         self.node_info.acquire_lock.return_value = True
@@ -513,7 +492,6 @@ class TestAbort(BaseTest):
         get_mock.assert_called_once_with(self.uuid, ironic=cli,
                                          locked=False)
         self.node_info.acquire_lock.assert_called_once_with(blocking=False)
-        filters_mock.assert_called_once_with(cli)
         cli.node.set_power_state.assert_called_once_with(self.uuid, 'off')
         self.node_info.finished.assert_called_once_with(error='Canceled '
                                                         'by operator')
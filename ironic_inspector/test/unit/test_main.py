@@ -272,11 +272,24 @@ class TestApiListStatus(GetStatusAPIBaseTest):
                                           limit=CONF.api_max_limit)
 
 
+class _Stream(object):
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.closed = False
+
+    def __iter__(self):
+        return iter(self.chunks)
+
+    def close(self):
+        self.closed = True
+
+
+@mock.patch.object(main.swift, 'SwiftAPI', autospec=True)
 class TestApiGetData(BaseAPITest):
-    @mock.patch.object(main.swift, 'SwiftAPI', autospec=True)
-    def test_get_introspection_data(self, swift_mock):
+    def setUp(self):
+        super(TestApiGetData, self).setUp()
         CONF.set_override('store_data', 'swift', 'processing')
-        data = {
+        self.data = {
             'ipmi_address': '1.2.3.4',
             'cpus': 2,
             'cpu_arch': 'x86_64',
@@ -286,45 +299,195 @@ class TestApiGetData(BaseAPITest):
                 'em1': {'mac': '11:22:33:44:55:66', 'ip': '1.2.0.1'},
             }
         }
+        self.body = json.dumps(self.data).encode('utf-8')
+        self.stream = _Stream([self.body[:10], self.body[10:]])
+        self.headers = {'etag': 'abcd', 'content-length': str(len(self.body))}
+        self.name = 'inspector_data-%s' % self.uuid
+        main._PARSED_DATA.clear()
+
+    def test_get_introspection_data(self, swift_mock):
+        swift_conn = swift_mock.return_value
+        swift_conn.get_object_stream.return_value = (self.headers,
+                                                     self.stream)
+
+        res = self.app.get('/v1/introspection/%s/data' % self.uuid,
+                           buffered=True)
+
+        swift_conn.get_object_stream.assert_called_once_with(self.name)
+        self.assertEqual(200, res.status_code)
+        self.assertEqual(self.data, json.loads(res.data.decode('utf-8')))
+        self.assertEqual(str(len(self.body)), res.headers['Content-Length'])
+        self.assertEqual('"abcd"', res.headers['ETag'])
+        self.assertTrue(self.stream.closed)
+
+    def test_not_modified(self, swift_mock):
         swift_conn = swift_mock.return_value
-        swift_conn.get_object.return_value = json.dumps(data)
+        swift_conn.get_object_stream.return_value = (self.headers,
+                                                     self.stream)
+
+        res = self.app.get('/v1/introspection/%s/data' % self.uuid,
+                           headers={'If-None-Match': '"abcd"'},
+                           buffered=True)
+
+        self.assertEqual(304, res.status_code)
+        self.assertEqual(b'', res.data)
+        self.assertEqual('"abcd"', res.headers['ETag'])
+        self.assertTrue(self.stream.closed)
+
+    def test_modified(self, swift_mock):
+        swift_conn = swift_mock.return_value
+        swift_conn.get_object_stream.return_value = (self.headers,
+                                                     self.stream)
+
+        res = self.app.get('/v1/introspection/%s/data' % self.uuid,
+                           headers={'If-None-Match': '"old"'})
+
+        self.assertEqual(200, res.status_code)
+        self.assertEqual(self.body, res.data)
+
+    def test_get_compressed_introspection_data(self, swift_mock):
+        CONF.set_override('data_compression', 'gzip', 'swift')
+        payload, headers = main.swift.compress(self.body)
+        swift_conn = swift_mock.return_value
+        swift_conn.get_object_stream.side_effect = lambda name: (
+            {'x-object-meta-inspector-encoding': 'gzip', 'etag': 'abcd',
+             'content-length': str(len(payload))},
+            _Stream([payload[:10], payload[10:]]))
+
+        res = self.app.get('/v1/introspection/%s/data' % self.uuid,
+                           headers={'Accept-Encoding': 'gzip, deflate'})
+        self.assertEqual(200, res.status_code)
+        self.assertEqual('gzip', res.headers['Content-Encoding'])
+        self.assertEqual(str(len(payload)), res.headers['Content-Length'])
+        self.assertEqual('"abcd"', res.headers['ETag'])
+        self.assertEqual(payload, res.data)
+
         res = self.app.get('/v1/introspection/%s/data' % self.uuid)
-        name = 'inspector_data-%s' % self.uuid
-        swift_conn.get_object.assert_called_once_with(name)
         self.assertEqual(200, res.status_code)
-        self.assertEqual(data, json.loads(res.data.decode('utf-8')))
+        self.assertNotIn('Content-Encoding', res.headers)
+        self.assertNotIn('Content-Length', res.headers)
+        self.assertEqual('"abcd-decoded"', res.headers['ETag'])
+        self.assertEqual(self.data, json.loads(res.data.decode('utf-8')))
 
-    @mock.patch.object(main.swift, 'SwiftAPI', autospec=True)
     def test_introspection_data_not_stored(self, swift_mock):
         CONF.set_override('store_data', 'none', 'processing')
         swift_conn = swift_mock.return_value
         res = self.app.get('/v1/introspection/%s/data' % self.uuid)
-        self.assertFalse(swift_conn.get_object.called)
+        self.assertFalse(swift_conn.get_object_stream.called)
         self.assertEqual(404, res.status_code)
 
     @mock.patch.object(ir_utils, 'get_node', autospec=True)
-    @mock.patch.object(main.swift, 'SwiftAPI', autospec=True)
-    def test_with_name(self, swift_mock, get_mock):
+    def test_with_name(self, get_mock, swift_mock):
         get_mock.return_value = mock.Mock(uuid=self.uuid)
-        CONF.set_override('store_data', 'swift', 'processing')
-        data = {
-            'ipmi_address': '1.2.3.4',
-            'cpus': 2,
-            'cpu_arch': 'x86_64',
-            'memory_mb': 1024,
-            'local_gb': 20,
-            'interfaces': {
-                'em1': {'mac': '11:22:33:44:55:66', 'ip': '1.2.0.1'},
-            }
-        }
         swift_conn = swift_mock.return_value
-        swift_conn.get_object.return_value = json.dumps(data)
+        swift_conn.get_object_stream.return_value = (self.headers,
+                                                     self.stream)
         res = self.app.get('/v1/introspection/name1/data')
-        name = 'inspector_data-%s' % self.uuid
-        swift_conn.get_object.assert_called_once_with(name)
+        swift_conn.get_object_stream.assert_called_once_with(self.name)
         self.assertEqual(200, res.status_code)
-        self.assertEqual(data, json.loads(res.data.decode('utf-8')))
-        get_mock.assert_called_once_with('name1', fields=['uuid'])
+        self.assertEqual(self.data, json.loads(res.data.decode('utf-8')))
+        get_mock.assert_called_once_with('name1', ironic=None, fields=['uuid'])
+
+    def test_fields(self, swift_mock):
+        swift_conn = swift_mock.return_value
+        swift_conn.head_object.return_value = self.headers
+        swift_conn.get_object_stream.return_value = (self.headers,
+                                                     self.stream)
+
+        res = self.app.get('/v1/introspection/%s/data?fields=cpus&'
+                           'fields=data://interfaces.*.mac&fields=missing'
+                           % self.uuid)
+
+        self.assertEqual(200, res.status_code)
+        self.assertEqual({'cpus': [2],
+                          'data://interfaces.*.mac': ['11:22:33:44:55:66'],
+                          'missing': []},
+                         json.loads(res.data.decode('utf-8')))
+        self.assertTrue(self.stream.closed)
+        self.assertNotEqual('"abcd"', res.headers['ETag'])
+
+    def test_fields_parsed_once(self, swift_mock):
+        swift_conn = swift_mock.return_value
+        swift_conn.head_object.return_value = self.headers
+        swift_conn.get_object_stream.return_value = (self.headers,
+                                                     self.stream)
+        url = '/v1/introspection/%s/data?fields=cpus' % self.uuid
+
+        res = self.app.get(url)
+        self.assertEqual({'cpus': [2]}, json.loads(res.data.decode('utf-8')))
+        etag = res.headers['ETag']
+
+        res = self.app.get('/v1/introspection/%s/data?fields=memory_mb'
+                           % self.uuid)
+        self.assertEqual({'memory_mb': [1024]},
+                         json.loads(res.data.decode('utf-8')))
+
+        res = self.app.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(304, res.status_code)
+
+        # the data is only downloaded on the first request
+        swift_conn.get_object_stream.assert_called_once_with(self.name)
+        self.assertEqual([mock.call(self.name)] * 3,
+                         swift_conn.head_object.call_args_list)
+
+    def test_fields_data_changed(self, swift_mock):
+        swift_conn = swift_mock.return_value
+        new_body = json.dumps({'cpus': 4}).encode('utf-8')
+        streams = [(self.headers, self.stream),
+                   ({'etag': 'efgh'}, _Stream([new_body]))]
+        swift_conn.head_object.side_effect = [self.headers, {'etag': 'efgh'}]
+        swift_conn.get_object_stream.side_effect = lambda name: streams.pop(0)
+        url = '/v1/introspection/%s/data?fields=cpus' % self.uuid
+
+        self.app.get(url)
+        res = self.app.get(url)
+
+        self.assertEqual({'cpus': [4]}, json.loads(res.data.decode('utf-8')))
+
+    def test_fields_compressed(self, swift_mock):
+        CONF.set_override('data_compression', 'zlib', 'swift')
+        payload, headers = main.swift.compress(self.body)
+        swift_conn = swift_mock.return_value
+        swift_conn.head_object.return_value = {'etag': 'abcd'}
+        swift_conn.get_object_stream.return_value = (
+            {'x-object-meta-inspector-encoding': 'zlib', 'etag': 'abcd'},
+            _Stream([payload]))
+
+        res = self.app.get('/v1/introspection/%s/data?fields=cpu_arch'
+                           % self.uuid)
+
+        self.assertEqual(200, res.status_code)
+        self.assertEqual({'cpu_arch': ['x86_64']},
+                         json.loads(res.data.decode('utf-8')))
+
+    def test_fields_invalid(self, swift_mock):
+        swift_conn = swift_mock.return_value
+        for field in ('node://driver', 'interfaces.[', ''):
+            res = self.app.get('/v1/introspection/%s/data?fields=%s'
+                               % (self.uuid, field))
+            self.assertEqual(400, res.status_code)
+        self.assertFalse(swift_conn.head_object.called)
+        self.assertFalse(swift_conn.get_object_stream.called)
+
+    @mock.patch.object(main.plugins_base, 'introspection_data_store',
+                       autospec=True)
+    def test_fields_without_etag(self, store_mock, swift_mock):
+        store = store_mock.return_value
+        store.get_etag.return_value = None
+        store.get_stream.return_value = main.plugins_base.StoredData(
+            body=[self.body], length=len(self.body), etag='abcd',
+            encoding=None)
+        url = '/v1/introspection/%s/data?fields=cpus' % self.uuid
+
+        res = self.app.get(url)
+        self.assertEqual({'cpus': [2]}, json.loads(res.data.decode('utf-8')))
+
+        # the body is not read again while the stream has the same tag
+        store.get_stream.return_value = main.plugins_base.StoredData(
+            body=_Stream(None), length=None, etag='abcd', encoding=None)
+        res = self.app.get(url)
+        self.assertEqual({'cpus': [2]}, json.loads(res.data.decode('utf-8')))
+        self.assertEqual(2, store.get_stream.call_count)
 
 
 @mock.patch.object(process, 'reapply', autospec=True)
@@ -504,6 +667,117 @@ class TestApiRules(BaseAPITest):
         self.assertEqual(204, res.status_code)
         delete_mock.assert_called_once_with(self.uuid)
 
+    @mock.patch.object(rules, 'import_rules', autospec=True)
+    def test_import(self, import_mock):
+        import_mock.return_value = [
+            mock.Mock(spec=rules.IntrospectionRule,
+                      **{'as_dict.return_value': {'uuid': self.uuid}})
+        ]
+        data = {'rules': [{'uuid': self.uuid, 'conditions': [],
+                           'actions': []}],
+                'replace': True}
+
+        res = self.app.post('/v1/rules/import', data=json.dumps(data))
+        self.assertEqual(200, res.status_code)
+        self.assertEqual({'rules': [{'uuid': self.uuid,
+                                     'links': [{
+                                         'href': '/v1/rules/' + self.uuid,
+                                         'rel': 'self'}]}]},
+                         json.loads(res.data.decode('utf-8')))
+        import_mock.assert_called_once_with(data['rules'], replace=True)
+        import_mock.return_value[0].as_dict.assert_called_once_with(
+            short=True)
+
+    @mock.patch.object(rules, 'import_rules', autospec=True)
+    def test_import_invalid(self, import_mock):
+        import_mock.side_effect = utils.Error('boom')
+
+        res = self.app.post('/v1/rules/import', data=json.dumps({}))
+        self.assertEqual(400, res.status_code)
+        import_mock.assert_called_once_with(None, replace=False)
+
+    @mock.patch.object(rules, 'import_rules', autospec=True)
+    def test_import_not_object(self, import_mock):
+        res = self.app.post('/v1/rules/import', data=json.dumps([]))
+        self.assertEqual(400, res.status_code)
+        self.assertFalse(import_mock.called)
+
+    @mock.patch.object(rules, 'export_rules', autospec=True)
+    def test_export(self, export_mock):
+        exp = [{'uuid': 'foo'}, {'uuid': 'bar'}]
+        export_mock.return_value = iter([
+            mock.Mock(spec=rules.IntrospectionRule,
+                      **{'as_dict.return_value': item})
+            for item in exp])
+
+        res = self.app.get('/v1/rules/export')
+        self.assertEqual(200, res.status_code)
+        self.assertEqual('application/json', res.mimetype)
+        self.assertEqual({'rules': exp},
+                         json.loads(res.data.decode('utf-8')))
+
+    @mock.patch.object(rules, 'export_rules', autospec=True)
+    def test_export_empty(self, export_mock):
+        export_mock.return_value = iter([])
+
+        res = self.app.get('/v1/rules/export')
+        self.assertEqual(200, res.status_code)
+        self.assertEqual({'rules': []},
+                         json.loads(res.data.decode('utf-8')))
+
+    @mock.patch.object(ir_utils, 'get_node_uuid', autospec=True)
+    @mock.patch.object(rules, 'dry_run', autospec=True)
+    def test_dry_run(self, dry_run_mock, uuid_mock):
+        result = {'matched': [self.uuid], 'errors': {'uuid2': 'boom'}}
+        dry_run_mock.return_value = result
+        uuid_mock.side_effect = lambda node: node.replace('name-', '')
+        conditions = [{'op': 'eq', 'field': 'memory_mb', 'value': 1024}]
+
+        res = self.app.post('/v1/rules/dry-run',
+                            data=json.dumps({'conditions': conditions,
+                                             'nodes': [self.uuid,
+                                                       'name-uuid2']}))
+
+        self.assertEqual(200, res.status_code)
+        self.assertEqual(result, json.loads(res.data.decode('utf-8')))
+        dry_run_mock.assert_called_once_with(conditions, [self.uuid, 'uuid2'])
+
+    @mock.patch.object(rules, 'dry_run', autospec=True)
+    def test_dry_run_invalid_nodes(self, dry_run_mock):
+        for body in ([], {}, {'nodes': []}, {'nodes': self.uuid},
+                     {'nodes': [42]}):
+            res = self.app.post('/v1/rules/dry-run', data=json.dumps(body))
+            self.assertEqual(400, res.status_code)
+        self.assertFalse(dry_run_mock.called)
+
+    @mock.patch.object(rules, 'dry_run', autospec=True)
+    def test_dry_run_invalid_conditions(self, dry_run_mock):
+        dry_run_mock.side_effect = utils.Error('boom')
+
+        res = self.app.post('/v1/rules/dry-run',
+                            data=json.dumps({'nodes': [self.uuid]}))
+        self.assertEqual(400, res.status_code)
+        dry_run_mock.assert_called_once_with([], [self.uuid])
+
+    @mock.patch.object(rules, 'get')
+    def test_get_statistics(self, get_mock):
+        stats = {'uuid': self.uuid, 'conditions': [], 'order': []}
+        get_mock.return_value = mock.Mock(spec=rules.IntrospectionRule,
+                                          **{'statistics.return_value':
+                                             stats})
+
+        res = self.app.get('/v1/rules/%s/statistics' % self.uuid)
+        self.assertEqual(200, res.status_code)
+        self.assertEqual(stats, json.loads(res.data.decode('utf-8')))
+        get_mock.assert_called_once_with(self.uuid)
+
+    @mock.patch.object(rules, 'get')
+    def test_get_statistics_not_found(self, get_mock):
+        get_mock.side_effect = utils.Error('boom', code=404)
+
+        res = self.app.get('/v1/rules/%s/statistics' % self.uuid)
+        self.assertEqual(404, res.status_code)
+
 
 class TestApiMisc(BaseAPITest):
     @mock.patch.object(node_cache, 'get_node', autospec=True)
@@ -712,6 +986,16 @@ class TestInit(test_base.BaseTest):
         self.assertRaises(SystemExit, self.service.init)
         mock_log.assert_called_once_with(mock.ANY, "'foo!'")
 
+    @mock.patch.object(main.LOG, 'critical')
+    def test_init_failed_data_store(self, mock_log, mock_node_cache,
+                                    mock_get_client, mock_auth,
+                                    mock_firewall):
+        CONF.set_override('store_data', 'foo!', 'processing')
+
+        self.assertRaises(SystemExit, self.service.init)
+        mock_log.assert_called_once_with(
+            mock.ANY, {'store': 'foo!', 'exc': mock.ANY})
+
 
 class TestCreateSSLContext(test_base.BaseTest):
 
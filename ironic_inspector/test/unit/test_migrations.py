@@ -439,6 +439,52 @@ class MigrationCheckersMixin(object):
         self.assertEqual('foo', row.name)
         self.assertEqual('bar', row.value)
 
+    def _check_25a7b6cd4556(self, engine, data):
+        introspection_data = db_utils.get_table(engine, 'introspection_data')
+        col_names = [column.name for column in introspection_data.c]
+        self.assertIn('uuid', col_names)
+        self.assertIsInstance(introspection_data.c.uuid.type,
+                              sqlalchemy.types.String)
+        self.assertIn('processed', col_names)
+        self.assertIsInstance(introspection_data.c.processed.type,
+                              sqlalchemy.types.Boolean)
+        self.assertIn('data', col_names)
+        self.assertIsInstance(introspection_data.c.data.type,
+                              sqlalchemy.types.Text)
+
+        nodes = db_utils.get_table(engine, 'nodes')
+        nodes.insert().execute({'uuid': 'node-uuid', 'state': 'finished'})
+        introspection_data.insert().execute(
+            {'uuid': 'node-uuid', 'processed': True, 'data': '{}'})
+        introspection_data.insert().execute(
+            {'uuid': 'node-uuid', 'processed': False, 'data': '{"a": 1}'})
+
+        rows = introspection_data.select(
+            introspection_data.c.uuid == 'node-uuid').execute().fetchall()
+        self.assertEqual({(True, '{}'), (False, '{"a": 1}')},
+                         {(row.processed, row.data) for row in rows})
+
+    def _pre_upgrade_d9a2368b86ff(self, engine):
+        rules = db_utils.get_table(engine, 'rules')
+        created_at = datetime.datetime(2017, 3, 1, 12, 0, 0)
+        data = [('rule-b', created_at),
+                ('rule-c', created_at + datetime.timedelta(seconds=1)),
+                ('rule-a', created_at)]
+        for uuid, created_at in data:
+            rules.insert().execute({'uuid': uuid, 'created_at': created_at,
+                                    'disabled': False})
+        return data
+
+    def _check_d9a2368b86ff(self, engine, data):
+        rules = db_utils.get_table(engine, 'rules')
+        col_names = [column.name for column in rules.c]
+        self.assertIn('position', col_names)
+        self.assertIsInstance(rules.c.position.type, sqlalchemy.types.Integer)
+
+        rows = rules.select().order_by(rules.c.position).execute().fetchall()
+        self.assertEqual([('rule-a', 0), ('rule-b', 1), ('rule-c', 2)],
+                         [(row.uuid, row.position) for row in rows])
+
     def test_upgrade_and_version(self):
         with patch_with_engine(self.engine):
             self.migration_ext.upgrade('head')
@@ -17,6 +17,7 @@ import json
 import unittest
 
 import automaton
+from ironicclient import exceptions as ironic_exc
 import mock
 from oslo_config import cfg
 import oslo_db
@@ -28,6 +29,7 @@ from ironic_inspector.common import ironic as ir_utils
 from ironic_inspector import db
 from ironic_inspector import introspection_state as istate
 from ironic_inspector import node_cache
+from ironic_inspector import port_cache
 from ironic_inspector.test import base as test_base
 from ironic_inspector import utils
 
@@ -74,6 +76,27 @@ class TestNodeCache(test_base.NodeTest):
                           ('mac', self.macs[2], self.uuid)],
                          [(row.name, row.value, row.node_uuid) for row in res])
 
+    def test_add_node_keeps_data(self):
+        session = db.get_session()
+        with session.begin():
+            db.Node(uuid=self.uuid, state=istate.States.finished,
+                    finished_at=datetime.datetime.utcnow(),
+                    error='boom').save(session)
+            db.IntrospectionData(uuid=self.uuid, processed=True,
+                                 data='{}').save(session)
+        db.get_engine().execute('PRAGMA foreign_keys = ON')
+        self.addCleanup(db.get_engine().execute, 'PRAGMA foreign_keys = OFF')
+
+        node = node_cache.add_node(self.uuid, istate.States.starting)
+
+        row = db.model_query(db.Node).filter_by(uuid=self.uuid).one()
+        self.assertEqual((istate.States.starting, node.started_at, None,
+                          None),
+                         (row.state, row.started_at, row.finished_at,
+                          row.error))
+        self.assertEqual(row.version_id, node.version_id)
+        self.assertEqual(1, db.model_query(db.IntrospectionData).count())
+
     def test__delete_node(self):
         session = db.get_session()
         with session.begin():
@@ -99,22 +122,6 @@ class TestNodeCache(test_base.NodeTest):
             uuid=self.uuid).first()
         self.assertIsNone(row_option)
 
-    @mock.patch.object(node_cache, '_get_lock_ctx', autospec=True)
-    @mock.patch.object(node_cache, '_list_node_uuids')
-    @mock.patch.object(node_cache, '_delete_node')
-    def test_delete_nodes_not_in_list(self, mock__delete_node,
-                                      mock__list_node_uuids,
-                                      mock__get_lock_ctx):
-        uuid2 = uuidutils.generate_uuid()
-        uuids = {self.uuid}
-        mock__list_node_uuids.return_value = {self.uuid, uuid2}
-        session = db.get_session()
-        with session.begin():
-            node_cache.delete_nodes_not_in_list(uuids)
-        mock__delete_node.assert_called_once_with(uuid2)
-        mock__get_lock_ctx.assert_called_once_with(uuid2)
-        mock__get_lock_ctx.return_value.__enter__.assert_called_once_with()
-
     def test_active_macs(self):
         session = db.get_session()
         with session.begin():
@@ -388,6 +395,31 @@ class TestNodeCacheCleanUp(test_base.NodeTest):
 
         self.assertEqual([], db.model_query(db.Node).all())
 
+    def test_old_status_with_data(self):
+        CONF.set_override('node_status_keep_time', 42)
+        uuid2 = uuidutils.generate_uuid()
+        session = db.get_session()
+        with session.begin():
+            db.model_query(db.Attribute, session=session).delete()
+            db.model_query(db.Option, session=session).delete()
+            db.model_query(db.Node, session=session).update(
+                {'finished_at': (datetime.datetime.utcnow() -
+                                 datetime.timedelta(seconds=100))})
+            db.Node(uuid=uuid2, state=istate.States.finished,
+                    finished_at=datetime.datetime.utcnow()).save(session)
+            for uuid in (self.uuid, uuid2):
+                db.IntrospectionData(uuid=uuid, processed=True,
+                                     data='{}').save(session)
+        db.get_engine().execute('PRAGMA foreign_keys = ON')
+        self.addCleanup(db.get_engine().execute, 'PRAGMA foreign_keys = OFF')
+
+        self.assertEqual([], node_cache.clean_up())
+
+        self.assertEqual([uuid2],
+                         [row.uuid for row in db.model_query(db.Node)])
+        self.assertEqual([uuid2], [row.uuid for row in
+                                   db.model_query(db.IntrospectionData)])
+
 
 class TestNodeCacheGetNode(test_base.NodeTest):
     def test_ok(self):
@@ -444,7 +476,7 @@ class TestNodeCacheGetNode(test_base.NodeTest):
         self.assertIsNone(info.finished_at)
         self.assertIsNone(info.error)
         self.assertFalse(info._locked)
-        ironic.node.get.assert_called_once_with('name')
+        ironic.node.get.assert_called_once_with('name', fields=['uuid'])
 
 
 @mock.patch.object(timeutils, 'utcnow', lambda: datetime.datetime(1, 1, 1))
@@ -490,6 +522,137 @@ class TestNodeInfoFinished(test_base.NodeTest):
         self.node_info.finished()
         self.assertFalse(self.node_info._locked)
 
+    def test_notifies_listeners(self):
+        listener = mock.Mock()
+        node_cache.add_state_listener(listener)
+        self.node_info.finished()
+        listener.assert_called_once_with()
+
+
+@mock.patch.object(node_cache, '_delete_node', autospec=True)
+@mock.patch.object(node_cache, '_list_node_uuids', autospec=True)
+class TestSyncWithIronic(test_base.NodeTest):
+    def setUp(self):
+        super(TestSyncWithIronic, self).setUp()
+        self.ironic = mock.Mock()
+        self.uuid2 = uuidutils.generate_uuid()
+
+    def _pages(self, *pages):
+        return [[mock.Mock(uuid=uuid) for uuid in page] for page in pages]
+
+    @mock.patch.object(node_cache, '_SYNC_PAGE_SIZE', 2)
+    @mock.patch.object(port_cache, 'remove_nodes', autospec=True)
+    @mock.patch.object(ir_utils, 'invalidate_node_names', autospec=True)
+    def test_deleted(self, mock_invalidate, mock_remove_ports, mock_list,
+                     mock_delete):
+        mock_list.return_value = {self.uuid, self.uuid2}
+        self.ironic.node.list.side_effect = self._pages(
+            ['a', self.uuid], ['b'])
+
+        node_cache.sync_with_ironic(self.ironic)
+
+        mock_delete.assert_called_once_with(self.uuid2)
+        mock_invalidate.assert_called_once_with({self.uuid2})
+        mock_remove_ports.assert_called_once_with({self.uuid2})
+        self.ironic.node.list.assert_has_calls([
+            mock.call(limit=2, marker=None, fields=['uuid']),
+            mock.call(limit=2, marker=self.uuid, fields=['uuid'])])
+
+    @mock.patch.object(node_cache, '_SYNC_PAGE_SIZE', 2)
+    def test_stops_when_all_found(self, mock_list, mock_delete):
+        mock_list.return_value = {self.uuid}
+        self.ironic.node.list.side_effect = self._pages(
+            ['a', self.uuid], ['b', 'c'])
+
+        node_cache.sync_with_ironic(self.ironic)
+
+        self.assertFalse(mock_delete.called)
+        self.ironic.node.list.assert_called_once_with(
+            limit=2, marker=None, fields=['uuid'])
+
+    def test_empty_cache(self, mock_list, mock_delete):
+        mock_list.return_value = set()
+        node_cache.sync_with_ironic(self.ironic)
+        self.assertFalse(self.ironic.node.list.called)
+
+
+@mock.patch.object(node_cache, '_delete_node', autospec=True)
+@mock.patch.object(node_cache, '_list_node_uuids', autospec=True)
+class TestCheckDeletedNodes(test_base.NodeTest):
+    def setUp(self):
+        super(TestCheckDeletedNodes, self).setUp()
+        self.ironic = mock.Mock()
+        self.uuids = sorted(uuidutils.generate_uuid() for _i in range(3))
+        self.cfg.config(ironic_sync_batch_size=2)
+
+    def test_batches(self, mock_list, mock_delete):
+        mock_list.return_value = set(self.uuids)
+        self.ironic.node.get.side_effect = lambda uuid, **kw: mock.Mock(
+            uuid=uuid)
+
+        node_cache.check_deleted_nodes(self.ironic)
+        self.assertEqual(2, self.ironic.node.get.call_count)
+        node_cache.check_deleted_nodes(self.ironic)
+        self.assertEqual(3, self.ironic.node.get.call_count)
+        self.ironic.node.get.assert_called_with(mock.ANY, fields=['uuid'])
+        checked = {c[0][0] for c in self.ironic.node.get.call_args_list}
+        self.assertEqual(set(self.uuids), checked)
+
+        # The next round starts
+        node_cache.check_deleted_nodes(self.ironic)
+        self.assertEqual(5, self.ironic.node.get.call_count)
+        self.assertFalse(mock_delete.called)
+
+    def test_deleted(self, mock_list, mock_delete):
+        mock_list.return_value = {self.uuid}
+        self.ironic.node.get.side_effect = ironic_exc.NotFound()
+
+        node_cache.check_deleted_nodes(self.ironic)
+
+        mock_delete.assert_called_once_with(self.uuid)
+
+    def test_disabled(self, mock_list, mock_delete):
+        self.cfg.config(ironic_sync_batch_size=0)
+        node_cache.check_deleted_nodes(self.ironic)
+        self.assertFalse(mock_list.called)
+        self.assertFalse(self.ironic.node.get.called)
+
+
+class TestStateListeners(test_base.NodeTest):
+    def setUp(self):
+        super(TestStateListeners, self).setUp()
+        self.listener = mock.Mock()
+        node_cache.add_state_listener(self.listener)
+
+    def test_registered_once(self):
+        node_cache.add_state_listener(self.listener)
+        node_cache.add_node(self.uuid, istate.States.starting)
+        self.listener.assert_called_once_with()
+
+    def test_macs_added(self):
+        self.node_info.add_attribute('bmc_address', '1.2.3.4')
+        self.assertFalse(self.listener.called)
+        self.node_info.add_attribute(node_cache.MACS_ATTRIBUTE, self.macs)
+        self.listener.assert_called_once_with()
+
+    @mock.patch.object(node_cache, '_list_node_uuids', autospec=True)
+    def test_nodes_deleted(self, mock_list):
+        mock_list.return_value = {self.uuid}
+        ironic = mock.Mock()
+        ironic.node.list.return_value = [mock.Mock(uuid=self.uuid)]
+        node_cache.sync_with_ironic(ironic)
+        self.assertFalse(self.listener.called)
+        ironic.node.list.return_value = []
+        node_cache.sync_with_ironic(ironic)
+        self.listener.assert_called_once_with()
+
+    def test_failure_ignored(self):
+        self.listener.side_effect = RuntimeError('boom')
+        other = mock.Mock()
+        node_cache.add_state_listener(other)
+        node_cache.add_node(self.uuid, istate.States.starting)
+        other.assert_called_once_with()
+
 
 class TestNodeInfoOptions(test_base.NodeTest):
     def setUp(self):
@@ -547,6 +710,34 @@ class TestNodeCacheIronicObjects(unittest.TestCase):
         mock_ironic.assert_called_once_with()
         mock_ironic.return_value.node.get.assert_called_once_with(self.uuid)
 
+    def test_node_fields(self, mock_ironic):
+        get = mock_ironic.return_value.node.get
+        get.side_effect = lambda uuid, fields=None: mock.Mock(fields=fields)
+        node_info = node_cache.NodeInfo(uuid=self.uuid, started_at=0)
+
+        node = node_info.node(fields=['driver', 'properties'])
+        self.assertEqual(['driver', 'properties', 'uuid'], node.fields)
+        self.assertIs(node, node_info.node(fields=['properties']))
+        self.assertEqual(1, get.call_count)
+
+        # Merged with the fields requested before
+        node = node_info.node(fields=['extra'])
+        self.assertEqual(['driver', 'extra', 'properties', 'uuid'],
+                         node.fields)
+
+        # Upgraded to the whole node
+        node = node_info.node()
+        self.assertIsNone(node.fields)
+        self.assertIs(node, node_info.node(fields=['instance_info']))
+        self.assertEqual(3, get.call_count)
+
+    def test_node_provided_all_fields(self, mock_ironic):
+        node_info = node_cache.NodeInfo(uuid=self.uuid, started_at=0,
+                                        node=mock.sentinel.node)
+        self.assertIs(mock.sentinel.node,
+                      node_info.node(fields=['properties']))
+        self.assertFalse(mock_ironic.called)
+
     def test_node_ironic_preset(self, mock_ironic):
         mock_ironic2 = mock.Mock()
         mock_ironic2.node.get.return_value = mock.sentinel.node
@@ -691,6 +882,105 @@ class TestUpdate(test_base.NodeTest):
         self.node_info.replace_field('/extra/foo', lambda v: v)
         self.assertFalse(self.ironic.node.update.called)
 
+    def test_batch_patches(self):
+        self.ironic.node.update.return_value = mock.sentinel.node
+        self.node.properties['capabilities'] = 'foo:bar'
+
+        with self.node_info.batch_patches():
+            self.node_info.patch([{'op': 'add', 'path': 'extra/foo',
+                                   'value': 'bar'}])
+            self.node_info.replace_field('/extra/foo', lambda v: v + '1')
+            self.node_info.update_capabilities(x=1)
+            self.node_info.update_capabilities(y=2)
+            self.assertEqual('bar1', self.node_info.node().extra['foo'])
+            self.assertFalse(self.ironic.node.update.called)
+
+        self.ironic.node.update.assert_called_once_with(self.uuid, mock.ANY)
+        patches = self.ironic.node.update.call_args[0][1]
+        self.assertEqual([{'op': 'add', 'path': '/extra/foo',
+                           'value': 'bar'},
+                          {'op': 'replace', 'path': '/extra/foo',
+                           'value': 'bar1'}], patches[:2])
+        self.assertEqual({'foo': 'bar', 'x': '1', 'y': '2'},
+                         ir_utils.capabilities_to_dict(patches[-1]['value']))
+        self.assertIs(mock.sentinel.node, self.node_info.node())
+
+    def test_batch_patches_fetches_patched_fields(self):
+        node_info = node_cache.NodeInfo(uuid=self.uuid, started_at=0,
+                                        ironic=self.ironic)
+        self.ironic.node.get.return_value = mock.Mock(extra={},
+                                                      properties={})
+
+        with node_info.batch_patches():
+            node_info.patch([{'op': 'add', 'path': '/extra/foo',
+                              'value': 'bar'},
+                             {'op': 'add', 'path': '/properties/cpus',
+                              'value': 4}])
+
+        self.ironic.node.get.assert_called_once_with(
+            self.uuid, fields=['extra', 'properties', 'uuid'])
+        self.ironic.node.update.assert_called_once_with(self.uuid, mock.ANY)
+
+    def test_batch_patches_keeps_patches_on_refetch(self):
+        node_info = node_cache.NodeInfo(uuid=self.uuid, started_at=0,
+                                        ironic=self.ironic)
+        self.ironic.node.get.side_effect = [
+            mock.Mock(properties={'capabilities': 'a:1'}),
+            mock.Mock(properties={'capabilities': 'a:1'}, extra={}),
+        ]
+
+        with node_info.batch_patches():
+            node_info.update_capabilities(b='2')
+            node_info.patch([{'op': 'add', 'path': '/extra/x',
+                              'value': 'y'}])
+            node_info.update_capabilities(c='3')
+
+        self.ironic.node.get.assert_has_calls([
+            mock.call(self.uuid, fields=['properties', 'uuid']),
+            mock.call(self.uuid, fields=['extra', 'properties', 'uuid'])])
+        self.ironic.node.update.assert_called_once_with(self.uuid, mock.ANY)
+        patches = self.ironic.node.update.call_args[0][1]
+        self.assertEqual(3, len(patches))
+        self.assertEqual({'a': '1', 'b': '2'},
+                         ir_utils.capabilities_to_dict(patches[0]['value']))
+        self.assertEqual({'op': 'add', 'path': '/extra/x', 'value': 'y'},
+                         patches[1])
+        self.assertEqual({'a': '1', 'b': '2', 'c': '3'},
+                         ir_utils.capabilities_to_dict(patches[2]['value']))
+
+    def test_batch_patches_unsupported(self):
+        first = [{'op': 'add', 'path': '/extra/foo', 'value': 'bar'}]
+        second = [{'op': 'add', 'path': '/extra/foo/bar', 'value': 42}]
+
+        with self.node_info.batch_patches():
+            self.node_info.patch(first)
+            self.node_info.patch(second)
+            self.ironic.node.update.assert_called_once_with(
+                self.uuid, first + second)
+
+        self.assertEqual(1, self.ironic.node.update.call_count)
+
+    def test_batch_patches_explicit_ironic(self):
+        ironic = mock.Mock()
+        patch = [{'op': 'add', 'path': '/extra/foo', 'value': 'bar'}]
+
+        with self.node_info.batch_patches():
+            self.node_info.patch(patch, ironic=ironic)
+            ironic.node.update.assert_called_once_with(self.uuid, patch)
+
+        self.assertFalse(self.ironic.node.update.called)
+
+    def test_batch_patches_failure(self):
+        self.ironic.node.update.side_effect = RuntimeError('boom')
+
+        def _batch():
+            with self.node_info.batch_patches():
+                self.node_info.patch([{'op': 'add', 'path': '/extra/foo',
+                                       'value': 'bar'}])
+
+        self.assertRaises(RuntimeError, _batch)
+        self.assertIsNone(self.node_info._node)
+
     def test_patch_port(self):
         self.ironic.port.update.return_value = mock.sentinel.port
 
@@ -721,6 +1011,23 @@ class TestUpdate(test_base.NodeTest):
         self.ironic.port.delete.assert_called_once_with('0')
         self.assertEqual(['mac1'], list(self.node_info.ports()))
 
+    @mock.patch.object(port_cache, 'remove', autospec=True)
+    def test_delete_port_updates_port_cache(self, mock_remove):
+        self.node_info.delete_port('mac0')
+        mock_remove.assert_called_once_with('0')
+
+    @mock.patch.object(port_cache, 'add', autospec=True)
+    def test_create_ports_updates_port_cache(self, mock_add):
+        self.ironic.port.create.return_value = mock.sentinel.port
+        self.node_info.create_ports(['mac2'])
+        mock_add.assert_called_once_with(mock.sentinel.port)
+
+    @mock.patch.object(port_cache, 'add', autospec=True)
+    def test_patch_port_updates_port_cache(self, mock_add):
+        self.ironic.port.update.return_value = mock.sentinel.port
+        self.node_info.patch_port('mac0', ['patch'])
+        mock_add.assert_called_once_with(mock.sentinel.port)
+
 
 class TestNodeCacheGetByPath(test_base.NodeTest):
     def setUp(self):
@@ -11,7 +11,9 @@
 # under the License.
 
 import copy
+import time
 
+from ironicclient import exceptions as ironic_exc
 import mock
 
 from ironic_inspector.common import ironic as ir_utils
@@ -37,6 +39,7 @@ class TestEnrollNodeNotFoundHook(test_base.NodeTest):
     def setUp(self):
         super(TestEnrollNodeNotFoundHook, self).setUp()
         self.ironic = mock.MagicMock()
+        discovery._BMC_ADDRESSES = None
 
     @mock.patch.object(node_cache, 'create_node', autospec=True)
     @mock.patch.object(ir_utils, 'get_client', autospec=True)
@@ -123,6 +126,20 @@ class TestEnrollNodeNotFoundHook(test_base.NodeTest):
                                         self.ironic)
 
     def test__check_existing_nodes_existing_node(self):
+        node = mock.MagicMock(driver_info={'ipmi_address': self.bmc_address},
+                              uuid='fake_node')
+        self.ironic.node.list.return_value = [node]
+        self.ironic.node.get.return_value = node
+        introspection_data = {}
+        node_driver_info = {'ipmi_address': self.bmc_address}
+
+        self.assertRaises(utils.Error, discovery._check_existing_nodes,
+                          introspection_data, node_driver_info, self.ironic)
+        self.ironic.node.get.assert_called_once_with(
+            'fake_node', fields=['uuid', 'driver_info'])
+
+    def test__check_existing_nodes_existing_node_no_index(self):
+        self.cfg.config(node_index_refresh_period=0, group='discovery')
         self.ironic.node.list.return_value = [mock.MagicMock(
             driver_info={'ipmi_address': self.bmc_address}, uuid='fake_node')]
         introspection_data = {}
@@ -130,3 +147,84 @@ class TestEnrollNodeNotFoundHook(test_base.NodeTest):
 
         self.assertRaises(utils.Error, discovery._check_existing_nodes,
                           introspection_data, node_driver_info, self.ironic)
+        self.assertFalse(self.ironic.node.get.called)
+
+
+class TestNodeIndex(test_base.NodeTest):
+    def setUp(self):
+        super(TestNodeIndex, self).setUp()
+        discovery._BMC_ADDRESSES = None
+        self.ironic = mock.Mock()
+        self.node1 = mock.Mock(uuid='uuid1',
+                               driver_info={'ipmi_address': '1.2.3.4'},
+                               created_at='2016-01-01', updated_at=None)
+        self.node2 = mock.Mock(uuid='uuid2',
+                               driver_info={'ipmi_address': '1.2.3.5'},
+                               created_at='2016-01-02',
+                               updated_at='2016-01-03')
+        self.ironic.node.list.return_value = [self.node1, self.node2]
+        self.ironic.node.get.side_effect = lambda uuid, **kw: {
+            'uuid1': self.node1, 'uuid2': self.node2}[uuid]
+
+    def test_loaded_once(self):
+        self.assertEqual('uuid1', discovery._find_node_by_bmc_address(
+            '1.2.3.4', self.ironic))
+        self.ironic.node.list.assert_called_once_with(
+            fields=discovery._NODE_FIELDS, limit=0)
+
+        self.ironic.node.list.reset_mock()
+        self.ironic.node.list.return_value = []
+        self.assertEqual('uuid2', discovery._find_node_by_bmc_address(
+            '1.2.3.5', self.ironic))
+        self.assertIsNone(discovery._find_node_by_bmc_address(
+            '1.2.3.6', self.ironic))
+        # Only incremental updates
+        self.assertEqual(4, self.ironic.node.list.call_count)
+        self.ironic.node.list.assert_called_with(
+            limit=10, marker=None, sort_key='updated_at', sort_dir='desc',
+            fields=discovery._NODE_FIELDS)
+
+    def test_updated_node(self):
+        discovery._find_node_by_bmc_address('1.2.3.4', self.ironic)
+        self.node1.driver_info = {'ipmi_address': '1.2.3.6'}
+        self.node1.updated_at = '2016-01-04'
+        self.ironic.node.list.return_value = [self.node1]
+
+        self.assertIsNone(discovery._find_node_by_bmc_address(
+            '1.2.3.4', self.ironic))
+        self.assertEqual('uuid1', discovery._find_node_by_bmc_address(
+            '1.2.3.6', self.ironic))
+
+    def test_deleted_node(self):
+        discovery._find_node_by_bmc_address('1.2.3.4', self.ironic)
+        self.ironic.node.list.return_value = []
+        self.ironic.node.get.side_effect = ironic_exc.NotFound()
+
+        self.assertIsNone(discovery._find_node_by_bmc_address(
+            '1.2.3.4', self.ironic))
+        self.assertNotIn('1.2.3.4', discovery._BMC_INDEX)
+
+    @mock.patch.object(time, 'time', autospec=True)
+    def test_full_reload(self, mock_time):
+        mock_time.return_value = 1000
+        discovery._find_node_by_bmc_address('1.2.3.4', self.ironic)
+        mock_time.return_value = 1000 + 600
+        self.ironic.node.list.reset_mock()
+
+        discovery._find_node_by_bmc_address('1.2.3.4', self.ironic)
+
+        self.ironic.node.list.assert_called_once_with(
+            fields=discovery._NODE_FIELDS, limit=0)
+
+    @mock.patch.object(ir_utils, 'get_ipmi_address', autospec=True)
+    def test_resolution_failure_skipped(self, mock_get):
+        def _get(node):
+            if node.uuid == 'uuid1':
+                raise utils.Error('boom')
+            return '1.2.3.5'
+        mock_get.side_effect = _get
+
+        self.assertEqual('uuid2', discovery._find_node_by_bmc_address(
+            '1.2.3.5', self.ironic))
+        self.assertEqual({'uuid1': None, 'uuid2': '1.2.3.5'},
+                         discovery._BMC_ADDRESSES)
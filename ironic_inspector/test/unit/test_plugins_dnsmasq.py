@@ -0,0 +1,230 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+
+import fixtures
+import mock
+from oslo_config import cfg
+
+from ironic_inspector import firewall
+from ironic_inspector import node_cache
+from ironic_inspector.plugins import base as plugins_base
+from ironic_inspector.plugins import dnsmasq
+from ironic_inspector import port_cache
+from ironic_inspector.test import base as test_base
+
+
+CONF = cfg.CONF
+
+
+@mock.patch.object(node_cache, 'active_macs', autospec=True)
+@mock.patch.object(firewall, 'should_enable_dhcp', autospec=True)
+class TestDnsmasqFilter(test_base.BaseTest):
+    def setUp(self):
+        super(TestDnsmasqFilter, self).setUp()
+        self.hostsdir = os.path.join(
+            self.useFixture(fixtures.TempDir()).path, 'hostsdir')
+        CONF.set_override('dhcp_hostsdir', self.hostsdir,
+                          'dnsmasq_pxe_filter')
+        CONF.set_override('port_cache_refresh_period', 0, 'firewall')
+        self.ironic = mock.Mock()
+        self.ironic.port.list.return_value = [
+            mock.Mock(address='11:22:33:44:55:66'),
+            mock.Mock(address='66:55:44:33:22:11'),
+        ]
+        self.driver = dnsmasq.DnsmasqFilter()
+        self.driver.init()
+
+    def read(self):
+        result = {}
+        for name in os.listdir(self.hostsdir):
+            with open(os.path.join(self.hostsdir, name)) as fp:
+                result[name] = fp.read()
+        return result
+
+    def test_loaded_as_driver(self, mock_enable, mock_active):
+        CONF.set_override('driver', 'dnsmasq', 'firewall')
+        self.assertIsInstance(plugins_base.pxe_filter_driver(),
+                              dnsmasq.DnsmasqFilter)
+
+    def test_blacklist(self, mock_enable, mock_active):
+        mock_active.return_value = {'11:22:33:44:55:66'}
+
+        self.driver.update_filters(self.ironic)
+
+        self.assertEqual({'11:22:33:44:55:66': '11:22:33:44:55:66\n',
+                          '66:55:44:33:22:11': '66:55:44:33:22:11,ignore\n'},
+                         self.read())
+        self.ironic.port.list.assert_called_once_with(
+            limit=0, fields=port_cache.FIELDS)
+
+    def test_blacklist_removed_port_allowed(self, mock_enable, mock_active):
+        mock_active.return_value = set()
+        self.driver.update_filters(self.ironic)
+        self.ironic.port.list.return_value = [
+            mock.Mock(address='11:22:33:44:55:66')]
+
+        self.driver.update_filters(self.ironic)
+
+        self.assertEqual({'11:22:33:44:55:66': '11:22:33:44:55:66,ignore\n',
+                          '66:55:44:33:22:11': '66:55:44:33:22:11\n'},
+                         self.read())
+
+    def test_whitelist(self, mock_enable, mock_active):
+        CONF.set_override('filter_mode', 'whitelist', 'firewall')
+        mock_active.return_value = {'11:22:33:44:55:66'}
+        self.driver.update_filters(self.ironic)
+        self.assertEqual({'11:22:33:44:55:66': '11:22:33:44:55:66\n'},
+                         self.read())
+
+        mock_active.return_value = {'66:55:44:33:22:11'}
+        self.driver.update_filters(self.ironic)
+
+        self.assertEqual({'11:22:33:44:55:66': '11:22:33:44:55:66,ignore\n',
+                          '66:55:44:33:22:11': '66:55:44:33:22:11\n'},
+                         self.read())
+        self.assertFalse(self.ironic.port.list.called)
+
+    def test_disabled(self, mock_enable, mock_active):
+        mock_active.return_value = {'11:22:33:44:55:66'}
+        self.driver.update_filters(self.ironic)
+        mock_enable.return_value = False
+
+        self.driver.update_filters(self.ironic)
+
+        self.assertEqual({'11:22:33:44:55:66': '11:22:33:44:55:66,ignore\n',
+                          '66:55:44:33:22:11': '66:55:44:33:22:11,ignore\n'},
+                         self.read())
+
+    @mock.patch.object(os, 'rename', autospec=True)
+    def test_only_changes_written(self, mock_rename, mock_enable,
+                                  mock_active):
+        mock_active.return_value = set()
+        self.driver.update_filters(self.ironic)
+        self.assertEqual(2, mock_rename.call_count)
+        mock_rename.reset_mock()
+
+        self.driver.update_filters(self.ironic)
+        self.assertFalse(mock_rename.called)
+
+        mock_active.return_value = {'11:22:33:44:55:66'}
+        self.driver.update_filters(self.ironic)
+        mock_rename.assert_called_once_with(
+            os.path.join(self.hostsdir, '.11:22:33:44:55:66.tmp'),
+            os.path.join(self.hostsdir, '11:22:33:44:55:66'))
+
+    def test_init_reads_existing_files(self, mock_enable, mock_active):
+        mock_active.return_value = set()
+        self.driver.update_filters(self.ironic)
+        self.ironic.port.list.return_value = []
+
+        driver = dnsmasq.DnsmasqFilter()
+        driver.init()
+        self.assertEqual({'11:22:33:44:55:66': False,
+                          '66:55:44:33:22:11': False}, driver._entries)
+
+        driver.update_filters(self.ironic)
+        self.assertEqual({'11:22:33:44:55:66': '11:22:33:44:55:66\n',
+                          '66:55:44:33:22:11': '66:55:44:33:22:11\n'},
+                         self.read())
+
+    @mock.patch.object(os, 'rename', autospec=True)
+    def test_failed_write_retried(self, mock_rename, mock_enable,
+                                  mock_active):
+        mock_active.return_value = set()
+        self.ironic.port.list.return_value = [
+            mock.Mock(address='11:22:33:44:55:66')]
+        mock_rename.side_effect = OSError()
+        self.assertRaises(OSError, self.driver.update_filters, self.ironic)
+
+        mock_rename.side_effect = None
+        self.driver.update_filters(self.ironic)
+        self.assertEqual(2, mock_rename.call_count)
+
+
+@mock.patch.object(dnsmasq, 'LOG', autospec=True)
+class TestCheckDnsmasqConfig(test_base.BaseTest):
+    def setUp(self):
+        super(TestCheckDnsmasqConfig, self).setUp()
+        tempdir = self.useFixture(fixtures.TempDir()).path
+        self.hostsdir = os.path.join(tempdir, 'hostsdir')
+        self.config_file = os.path.join(tempdir, 'dnsmasq.conf')
+        CONF.set_override('dhcp_hostsdir', self.hostsdir,
+                          'dnsmasq_pxe_filter')
+        CONF.set_override('dnsmasq_config_file', self.config_file,
+                          'dnsmasq_pxe_filter')
+        self.driver = dnsmasq.DnsmasqFilter()
+
+    def write(self, *lines):
+        with open(self.config_file, 'w') as fp:
+            fp.write('\n'.join(('port=0',) + lines + ('',)))
+
+    def test_ok(self, mock_log):
+        self.write('dhcp-hostsdir=%s/' % self.hostsdir,
+                   'dhcp-ignore=tag:!known  # whitelist')
+        CONF.set_override('filter_mode', 'whitelist', 'firewall')
+
+        self.driver.init()
+
+        self.assertFalse(mock_log.warning.called)
+        self.assertFalse(mock_log.info.called)
+
+    def test_no_hostsdir(self, mock_log):
+        self.write('# dhcp-hostsdir=%s' % self.hostsdir,
+                   'dhcp-ignore=tag:!known')
+
+        self.driver.init()
+
+        mock_log.warning.assert_called_once_with(
+            mock.ANY, {'path': self.config_file, 'dir': self.hostsdir})
+
+    def test_whitelist_without_ignore(self, mock_log):
+        self.write('dhcp-hostsdir=%s' % self.hostsdir)
+        CONF.set_override('filter_mode', 'whitelist', 'firewall')
+
+        self.driver.init()
+
+        mock_log.warning.assert_called_once_with(mock.ANY, self.config_file)
+        self.assertIn('whitelist', mock_log.warning.call_args[0][0])
+
+    def test_blacklist_without_ignore(self, mock_log):
+        self.write('dhcp-hostsdir=%s' % self.hostsdir)
+
+        self.driver.init()
+
+        self.assertFalse(mock_log.warning.called)
+        mock_log.info.assert_called_once_with(mock.ANY, self.config_file)
+
+    def test_discovery_with_ignore(self, mock_log):
+        self.write('dhcp-hostsdir=%s' % self.hostsdir,
+                   'dhcp-ignore=tag:!known')
+        CONF.set_override('node_not_found_hook', 'example', 'processing')
+
+        self.driver.init()
+
+        mock_log.warning.assert_called_once_with(mock.ANY, self.config_file)
+        self.assertIn('discovery', mock_log.warning.call_args[0][0])
+
+    def test_cannot_read(self, mock_log):
+        self.driver.init()
+
+        mock_log.warning.assert_called_once_with(
+            mock.ANY, {'path': self.config_file, 'error': mock.ANY})
+
+    def test_not_set(self, mock_log):
+        CONF.set_override('dnsmasq_config_file', None, 'dnsmasq_pxe_filter')
+
+        self.driver.init()
+
+        self.assertFalse(mock_log.warning.called)
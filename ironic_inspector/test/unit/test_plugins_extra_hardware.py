@@ -15,6 +15,7 @@ import json
 
 import mock
 
+from ironic_inspector.common import swift
 from ironic_inspector import node_cache
 from ironic_inspector.plugins import extra_hardware
 from ironic_inspector.test import base as test_base
@@ -36,7 +37,8 @@ class TestExtraHardware(test_base.NodeTest):
 
         swift_conn = swift_mock.return_value
         name = 'extra_hardware-%s' % self.uuid
-        swift_conn.create_object.assert_called_once_with(name, data)
+        swift_conn.create_object.assert_called_once_with(name, data,
+                                                         headers=None)
         patch_mock.assert_called_once_with(
             [{'op': 'add', 'path': '/extra/hardware_swift_object',
               'value': name}])
@@ -70,13 +72,29 @@ class TestExtraHardware(test_base.NodeTest):
 
         swift_conn = swift_mock.return_value
         name = 'extra_hardware-%s' % self.uuid
-        swift_conn.create_object.assert_called_once_with(name, data)
+        swift_conn.create_object.assert_called_once_with(name, data,
+                                                         headers=None)
         patch_mock.assert_called_once_with(
             [{'op': 'add', 'path': '/extra/hardware_swift_object',
               'value': name}])
 
         self.assertNotIn('data', introspection_data)
 
+    def test_data_compressed(self, patch_mock, swift_mock):
+        self.cfg.config(data_compression='zlib', group='swift')
+        introspection_data = {
+            'data': [['memory', 'total', 'size', '4294967296']]}
+        data = json.dumps(introspection_data['data'])
+        self.hook.before_update(introspection_data, self.node_info)
+
+        swift_conn = swift_mock.return_value
+        name = 'extra_hardware-%s' % self.uuid
+        swift_conn.create_object.assert_called_once_with(
+            name, mock.ANY,
+            headers={'X-Object-Meta-Inspector-Encoding': 'zlib'})
+        payload = swift_conn.create_object.call_args[0][1]
+        self.assertEqual(data, swift.decompress(payload, 'zlib'))
+
     def test_no_data_recieved(self, patch_mock, swift_mock):
         introspection_data = {'cats': 'meow'}
         swift_conn = swift_mock.return_value
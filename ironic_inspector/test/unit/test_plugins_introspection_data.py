@@ -0,0 +1,242 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import json
+import os
+
+import fixtures
+import mock
+from oslo_config import cfg
+
+from ironic_inspector.common import swift
+from ironic_inspector import db
+from ironic_inspector import node_cache
+from ironic_inspector.plugins import base as plugins_base
+from ironic_inspector.plugins import introspection_data
+from ironic_inspector.test import base as test_base
+from ironic_inspector import utils
+
+
+CONF = cfg.CONF
+
+
+class TestDriverLoading(test_base.BaseTest):
+    def test_loaded(self):
+        for name, cls in [('none', introspection_data.NoStore),
+                          ('swift', introspection_data.SwiftStore),
+                          ('filesystem', introspection_data.FilesystemStore),
+                          ('database', introspection_data.DatabaseStore)]:
+            CONF.set_override('store_data', name, 'processing')
+            plugins_base._INTROSPECTION_DATA_MGR = None
+            self.assertIsInstance(plugins_base.introspection_data_store(),
+                                  cls)
+
+
+class TestNoStore(test_base.BaseTest):
+    def test_save_and_get(self):
+        store = introspection_data.NoStore()
+        self.assertIsNone(store.save('uuid', {'cpus': 2}))
+        exc = self.assertRaises(utils.Error, store.get, 'uuid')
+        self.assertEqual(404, exc.http_code)
+
+
+@mock.patch.object(swift, 'SwiftAPI', autospec=True)
+class TestSwiftStore(test_base.BaseTest):
+    def setUp(self):
+        super(TestSwiftStore, self).setUp()
+        self.store = introspection_data.SwiftStore()
+
+    def test_save(self, swift_mock):
+        location = self.store.save('uuid', {'cpus': 2}, processed=False)
+
+        self.assertEqual('inspector_data-uuid-UNPROCESSED', location)
+        swift_mock.return_value.create_object.assert_called_once_with(
+            location, json.dumps({'cpus': 2}), headers=None)
+
+    def test_get_stream(self, swift_mock):
+        swift_mock.return_value.get_object_stream.return_value = (
+            {'x-object-meta-inspector-encoding': 'gzip', 'etag': '"abcd"',
+             'content-length': '7'}, [b'payload'])
+
+        stored = self.store.get_stream('uuid', processed=False)
+
+        self.assertEqual(([b'payload'], 7, 'abcd', 'gzip'), stored)
+        swift_mock.return_value.get_object_stream.assert_called_once_with(
+            'inspector_data-uuid-UNPROCESSED')
+
+    def test_get_etag(self, swift_mock):
+        swift_mock.return_value.head_object.return_value = {
+            'etag': '"abcd"', 'content-length': '7'}
+
+        self.assertEqual('abcd', self.store.get_etag('uuid'))
+        swift_mock.return_value.head_object.assert_called_once_with(
+            'inspector_data-uuid')
+        self.assertFalse(swift_mock.return_value.get_object_stream.called)
+
+
+class TestDefaultGetStream(test_base.BaseTest):
+    def test_get_stream(self):
+        store = introspection_data.NoStore()
+        with mock.patch.object(store, 'get', autospec=True) as mock_get:
+            mock_get.return_value = '{"cpus": 2}'
+            stored = store.get_stream('uuid')
+
+        self.assertEqual([b'{"cpus": 2}'], stored.body)
+        self.assertEqual(11, stored.length)
+        self.assertEqual(hashlib.md5(b'{"cpus": 2}').hexdigest(), stored.etag)
+        self.assertIsNone(stored.encoding)
+
+
+class TestDefaultGetMany(test_base.BaseTest):
+    def test_get_many(self):
+        store = introspection_data.NoStore()
+        with mock.patch.object(store, 'get', autospec=True) as mock_get:
+            mock_get.side_effect = lambda uuid, processed: {
+                'uuid1': '{"cpus": 2}'}[uuid]
+            found, errors = store.get_many(['uuid1', 'uuid2'],
+                                           processed=False)
+
+        self.assertEqual({'uuid1': '{"cpus": 2}'}, found)
+        self.assertIsInstance(errors['uuid2'], KeyError)
+        mock_get.assert_has_calls([mock.call('uuid1', processed=False),
+                                   mock.call('uuid2', processed=False)])
+
+
+class TestFilesystemStore(test_base.BaseTest):
+    def setUp(self):
+        super(TestFilesystemStore, self).setUp()
+        self.directory = self.useFixture(fixtures.TempDir()).path
+        CONF.set_override('directory', self.directory, 'filesystem_store')
+        self.store = introspection_data.FilesystemStore()
+        self.uuid = 'ab0e6e4b-7f0e-4ce3-8f0a-d1b9d3d6b1a5'
+        self.data = {'cpus': 2, 'interfaces': {'em1': {'ip': '1.2.3.4'}}}
+
+    def test_save_and_get(self):
+        location = self.store.save(self.uuid, self.data)
+
+        self.assertEqual(os.path.join(self.directory, 'ab', self.uuid),
+                         location)
+        self.assertEqual([self.uuid],
+                         os.listdir(os.path.join(self.directory, 'ab')))
+        self.assertEqual(self.data, json.loads(self.store.get(self.uuid)))
+        self.assertRaises(utils.Error, self.store.get, self.uuid,
+                          processed=False)
+
+    def test_save_unprocessed_overwrite(self):
+        self.store.save(self.uuid, {'old': True}, processed=False)
+        location = self.store.save(self.uuid, self.data, processed=False)
+
+        self.assertEqual(self.uuid + '-UNPROCESSED',
+                         os.path.basename(location))
+        self.assertEqual(self.data,
+                         json.loads(self.store.get(self.uuid,
+                                                   processed=False)))
+
+    @mock.patch.object(introspection_data, '_CHUNK_SIZE', 8)
+    def test_get_stream(self):
+        self.store.save(self.uuid, self.data)
+        expected = json.dumps(self.data).encode('utf-8')
+
+        for use_mmap in (False, True):
+            CONF.set_override('use_mmap', use_mmap, 'filesystem_store')
+            stored = self.store.get_stream(self.uuid)
+            chunks = list(stored.body)
+            self.assertEqual(expected, b''.join(chunks))
+            self.assertTrue(all(len(chunk) <= 8 for chunk in chunks))
+            self.assertEqual(len(expected), stored.length)
+            self.assertIsNone(stored.encoding)
+
+    def test_etag_changes(self):
+        self.store.save(self.uuid, self.data)
+        stored = self.store.get_stream(self.uuid)
+        stored.body.close()
+        self.store.save(self.uuid, {'cpus': 4})
+
+        new_stored = self.store.get_stream(self.uuid)
+        new_stored.body.close()
+
+        self.assertNotEqual(stored.etag, new_stored.etag)
+
+    def test_get_etag(self):
+        self.store.save(self.uuid, self.data)
+        stored = self.store.get_stream(self.uuid)
+        stored.body.close()
+
+        self.assertEqual(stored.etag, self.store.get_etag(self.uuid))
+        self.assertRaises(utils.Error, self.store.get_etag, self.uuid,
+                          processed=False)
+
+    def test_get_mmap(self):
+        CONF.set_override('use_mmap', True, 'filesystem_store')
+        self.store.save(self.uuid, self.data)
+
+        self.assertEqual(self.data, json.loads(self.store.get(self.uuid)))
+
+    def test_get_mmap_empty(self):
+        CONF.set_override('use_mmap', True, 'filesystem_store')
+        os.makedirs(os.path.join(self.directory, 'ab'))
+        open(os.path.join(self.directory, 'ab', self.uuid), 'w').close()
+
+        self.assertEqual('', self.store.get(self.uuid))
+
+    def test_get_not_found(self):
+        exc = self.assertRaises(utils.Error, self.store.get, self.uuid)
+        self.assertEqual(404, exc.http_code)
+
+    @mock.patch.object(os, 'rename', autospec=True)
+    def test_save_failure_cleans_up(self, mock_rename):
+        mock_rename.side_effect = OSError('boom')
+
+        self.assertRaisesRegex(utils.Error, 'boom', self.store.save,
+                               self.uuid, self.data)
+        self.assertEqual([], os.listdir(os.path.join(self.directory, 'ab')))
+
+
+class TestDatabaseStore(test_base.NodeTest):
+    def setUp(self):
+        super(TestDatabaseStore, self).setUp()
+        self.store = introspection_data.DatabaseStore()
+        node_cache.add_node(self.uuid, 'starting')
+
+    def test_save_and_get(self):
+        self.assertIsNone(self.store.save(self.uuid, {'cpus': 2}))
+        self.store.save(self.uuid, {'cpus': 1}, processed=False)
+        self.store.save(self.uuid, {'cpus': 4})
+
+        self.assertEqual({'cpus': 4}, json.loads(self.store.get(self.uuid)))
+        self.assertEqual({'cpus': 1},
+                         json.loads(self.store.get(self.uuid,
+                                                   processed=False)))
+        self.assertEqual(2, db.model_query(db.IntrospectionData).count())
+
+    def test_get_not_found(self):
+        exc = self.assertRaises(utils.Error, self.store.get, self.uuid)
+        self.assertEqual(404, exc.http_code)
+
+    def test_get_many(self):
+        self.store.save(self.uuid, {'cpus': 2})
+        self.store.save(self.uuid, {'cpus': 1}, processed=False)
+
+        found, errors = self.store.get_many([self.uuid, 'uuid2'])
+
+        self.assertEqual({self.uuid: json.dumps({'cpus': 2})}, found)
+        self.assertEqual(['uuid2'], list(errors))
+        self.assertEqual(404, errors['uuid2'].http_code)
+
+    def test_deleted_with_node(self):
+        self.store.save(self.uuid, {'cpus': 2})
+
+        node_cache._delete_node(self.uuid)
+
+        self.assertRaises(utils.Error, self.store.get, self.uuid)
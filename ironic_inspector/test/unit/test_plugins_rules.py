@@ -14,6 +14,8 @@
 
 """Tests for introspection rules plugins."""
 
+import unittest
+
 import mock
 
 from ironic_inspector.common import ironic as ir_utils
@@ -74,6 +76,44 @@ class TestSimpleConditions(test_base.BaseTest):
             self._test(cond, expected, *values)
 
 
+class TestSimpleConditionsCheckMany(test_base.BaseTest):
+    conditions = [rules_plugins.EqCondition(), rules_plugins.NeCondition(),
+                  rules_plugins.GtCondition(), rules_plugins.GeCondition(),
+                  rules_plugins.LtCondition(), rules_plugins.LeCondition()]
+
+    def _test(self, fields, value):
+        for cond in self.conditions:
+            expected = [cond.check(None, field, {'value': value})
+                        for field in fields]
+            self.assertEqual(expected,
+                             cond.check_many(fields, {'value': value}))
+
+    def test_int(self):
+        self._test([41, 42, 43, 42.5, -42.5, True], 42)
+
+    def test_float(self):
+        self._test([4, 4.2, 4.3, 42], 4.2)
+
+    def test_string(self):
+        self._test(['foo', 'bar', 'baz'], 'bar')
+
+    def test_without_numpy(self):
+        with mock.patch.object(rules_plugins, 'numpy', None):
+            self._test([41, 42, 43, 42.5], 42)
+
+    @unittest.skipIf(rules_plugins.numpy is None, 'requires numpy')
+    def test_non_numeric_field(self):
+        cond = rules_plugins.EqCondition()
+        self.assertRaises(TypeError, cond.check_many, [42, '42'],
+                          {'value': 42})
+
+    def test_mixed_types(self):
+        cond = rules_plugins.EqCondition()
+        self.assertEqual([False, True, False],
+                         cond.check_many([42, 'foo', ['foo']],
+                                         {'value': 'foo'}))
+
+
 class TestReConditions(test_base.BaseTest):
     def test_validate(self):
         for cond in (rules_plugins.MatchesCondition(),
@@ -91,6 +131,7 @@ class TestReConditions(test_base.BaseTest):
                                 (r'^(foo|bar)$', 'foo', True),
                                 (r'fo', 'foo', False)]:
             self.assertEqual(res, cond.check(None, field, {'value': reg}))
+            self.assertEqual([res], cond.check_many([field], {'value': reg}))
 
     def test_contains(self):
         cond = rules_plugins.ContainsCondition()
@@ -100,6 +141,7 @@ class TestReConditions(test_base.BaseTest):
                                 (r'[1-9]*', 42, True),
                                 (r'bar', 'foo', False)]:
             self.assertEqual(res, cond.check(None, field, {'value': reg}))
+            self.assertEqual([res], cond.check_many([field], {'value': reg}))
 
 
 class TestNetCondition(test_base.BaseTest):
@@ -115,6 +157,11 @@ class TestNetCondition(test_base.BaseTest):
         self.assertFalse(self.cond.check(None, '192.1.2.4',
                                          {'value': '192.0.2.1/24'}))
 
+    def test_check_many(self):
+        self.assertEqual([True, False],
+                         self.cond.check_many(['192.0.2.4', '192.1.2.4'],
+                                              {'value': '192.0.2.1/24'}))
+
 
 class TestEmptyCondition(test_base.BaseTest):
     cond = rules_plugins.EmptyCondition()
@@ -0,0 +1,290 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+
+from ironicclient import exceptions as ironic_exc
+import mock
+from oslo_config import cfg
+
+from ironic_inspector.common import ironic as ir_utils
+from ironic_inspector import port_cache
+from ironic_inspector.test import base as test_base
+
+
+CONF = cfg.CONF
+
+
+def make_port(uuid, created_at='2017-01-01T00:00:00+00:00', updated_at=None,
+              address=None, node_uuid=None):
+    return mock.Mock(uuid=uuid, address=address or 'mac-%s' % uuid,
+                     extra={}, node_uuid=node_uuid, created_at=created_at,
+                     updated_at=updated_at)
+
+
+@mock.patch.object(time, 'time', autospec=True)
+class TestPorts(test_base.BaseTest):
+    def setUp(self):
+        super(TestPorts, self).setUp()
+        self.ironic = mock.Mock()
+        self.ports = [
+            make_port('1', updated_at='2017-01-02T00:00:00+00:00'),
+            make_port('2', created_at='2017-01-03T00:00:00+00:00'),
+        ]
+        self.full_call = mock.call(limit=0, fields=port_cache.FIELDS)
+        CONF.set_override('port_cache_sweep_period', 0, 'firewall')
+
+    def incremental_call(self, key, marker=None, limit=None):
+        if limit is None:
+            limit = min(ir_utils._FIRST_PAGE_SIZE, port_cache._PAGE_SIZE)
+        return mock.call(limit=limit, marker=marker,
+                         sort_key=key, sort_dir='desc',
+                         fields=port_cache.FIELDS)
+
+    def test_full_refresh(self, mock_time):
+        mock_time.return_value = 100
+        self.ironic.port.list.return_value = self.ports
+
+        result = port_cache.ports(self.ironic)
+
+        self.assertEqual(set(self.ports), set(result))
+        self.ironic.port.list.assert_called_once_with(
+            limit=0, fields=port_cache.FIELDS)
+        self.assertEqual({'created_at': '2017-01-03T00:00:00+00:00',
+                          'updated_at': '2017-01-02T00:00:00+00:00'},
+                         port_cache._WATERMARKS)
+
+    def test_incremental_refresh(self, mock_time):
+        mock_time.return_value = 100
+        self.ironic.port.list.return_value = self.ports
+        port_cache.ports(self.ironic)
+
+        new = make_port('3', created_at='2017-01-04T00:00:00+00:00')
+        updated = make_port('1', updated_at='2017-01-05T00:00:00+00:00',
+                            address='new-mac')
+        self.ironic.port.list.reset_mock()
+        self.ironic.port.list.side_effect = [
+            # created_at, newest first
+            [new, self.ports[1], updated],
+            # updated_at, newest first, never updated last
+            [updated, self.ports[1], new],
+        ]
+        mock_time.return_value = 200
+
+        result = port_cache.ports(self.ironic)
+
+        self.assertEqual({('1', 'new-mac'), ('2', 'mac-2'), ('3', 'mac-3')},
+                         {(p.uuid, p.address) for p in result})
+        self.assertEqual([self.incremental_call('created_at'),
+                          self.incremental_call('updated_at')],
+                         self.ironic.port.list.call_args_list)
+        self.assertEqual({'created_at': '2017-01-04T00:00:00+00:00',
+                          'updated_at': '2017-01-05T00:00:00+00:00'},
+                         port_cache._WATERMARKS)
+
+    @mock.patch.object(ir_utils, '_FIRST_PAGE_SIZE', 1)
+    @mock.patch.object(port_cache, '_PAGE_SIZE', 2)
+    def test_incremental_pagination(self, mock_time):
+        mock_time.return_value = 100
+        self.ironic.port.list.return_value = self.ports
+        port_cache.ports(self.ironic)
+
+        new = [make_port(str(i), created_at='2017-02-0%dT00:00:00+00:00' % i)
+               for i in range(3, 6)]
+        self.ironic.port.list.reset_mock()
+        self.ironic.port.list.side_effect = [
+            [new[2]],
+            [new[1], new[0]],
+            [self.ports[1], self.ports[0]],
+            # updated_at, ports without the timestamp last
+            [self.ports[0]],
+            [],
+        ]
+
+        result = port_cache.ports(self.ironic)
+
+        self.assertEqual(5, len(result))
+        self.assertEqual([self.incremental_call('created_at', limit=1),
+                          self.incremental_call('created_at', '5', limit=2),
+                          self.incremental_call('created_at', '3', limit=2),
+                          self.incremental_call('updated_at', limit=1),
+                          self.incremental_call('updated_at', '1', limit=2)],
+                         self.ironic.port.list.call_args_list)
+
+    def test_incremental_nulls_first(self, mock_time):
+        mock_time.return_value = 100
+        self.ironic.port.list.return_value = self.ports
+        port_cache.ports(self.ironic)
+
+        never_updated = [make_port(str(i)) for i in range(3, 23)]
+        self.ironic.port.list.reset_mock()
+        self.ironic.port.list.side_effect = [
+            [self.ports[1]],
+            # updated_at, ports without the timestamp first, as on PostgreSQL
+            never_updated[:ir_utils._FIRST_PAGE_SIZE],
+        ]
+
+        result = port_cache.ports(self.ironic)
+
+        # paging stops on the first port without the timestamp
+        self.assertEqual({'1', '2'}, {port.uuid for port in result})
+        self.assertEqual([self.incremental_call('created_at'),
+                          self.incremental_call('updated_at')],
+                         self.ironic.port.list.call_args_list)
+        self.assertEqual('2017-01-02T00:00:00+00:00',
+                         port_cache._WATERMARKS['updated_at'])
+
+    def test_sweep(self, mock_time):
+        CONF.set_override('port_cache_sweep_period', 60, 'firewall')
+        mock_time.return_value = 100
+        self.ironic.port.list.return_value = self.ports
+        port_cache.ports(self.ironic)
+
+        self.ironic.port.list.reset_mock()
+        self.ironic.port.list.side_effect = [[], []]
+        mock_time.return_value = 159
+        self.assertEqual(2, len(port_cache.ports(self.ironic)))
+        self.assertEqual(2, self.ironic.port.list.call_count)
+
+        self.ironic.port.list.reset_mock()
+        self.ironic.port.list.side_effect = [[], [], [mock.Mock(uuid='2')]]
+        mock_time.return_value = 160
+
+        self.assertEqual([self.ports[1]], port_cache.ports(self.ironic))
+        self.assertEqual([self.incremental_call('created_at'),
+                          self.incremental_call('updated_at'),
+                          mock.call(limit=0, fields=['uuid'])],
+                         self.ironic.port.list.call_args_list)
+        self.assertNotIn('mac-1', port_cache._BY_ADDRESS)
+
+        # the next sweep is only after the period
+        self.ironic.port.list.reset_mock()
+        self.ironic.port.list.side_effect = [[], []]
+        mock_time.return_value = 200
+        port_cache.ports(self.ironic)
+        self.assertEqual(2, self.ironic.port.list.call_count)
+
+    def test_remove_nodes(self, mock_time):
+        mock_time.return_value = 100
+        self.ironic.port.list.return_value = [
+            make_port('1', node_uuid='node1'),
+            make_port('2', node_uuid='node2'),
+            make_port('3', node_uuid='node1'),
+        ]
+        port_cache.ports(self.ironic)
+
+        port_cache.remove_nodes(['node1', 'node3'])
+
+        self.assertEqual(['2'], list(port_cache._PORTS))
+        self.assertEqual(['mac-2'], list(port_cache._BY_ADDRESS))
+
+    def test_remove_nodes_not_loaded(self, mock_time):
+        port_cache.remove_nodes(['node1'])
+        self.assertIsNone(port_cache._PORTS)
+
+    def test_full_refresh_after_period(self, mock_time):
+        CONF.set_override('port_cache_refresh_period', 60, 'firewall')
+        mock_time.return_value = 100
+        self.ironic.port.list.return_value = self.ports
+        port_cache.ports(self.ironic)
+
+        self.ironic.port.list.return_value = self.ports[:1]
+        mock_time.return_value = 160
+
+        self.assertEqual(self.ports[:1], port_cache.ports(self.ironic))
+        self.assertEqual([self.full_call, self.full_call],
+                         self.ironic.port.list.call_args_list)
+
+    def test_disabled(self, mock_time):
+        CONF.set_override('port_cache_refresh_period', 0, 'firewall')
+        self.ironic.port.list.return_value = self.ports
+
+        for _i in range(2):
+            self.assertEqual(self.ports, port_cache.ports(self.ironic))
+
+        self.assertEqual([self.full_call, self.full_call],
+                         self.ironic.port.list.call_args_list)
+        self.assertIsNone(port_cache._PORTS)
+
+    def test_add_remove(self, mock_time):
+        mock_time.return_value = 100
+        self.ironic.port.list.return_value = self.ports
+        port_cache.ports(self.ironic)
+        new = make_port('3')
+
+        port_cache.add(new)
+        port_cache.remove('1')
+        port_cache.remove('42')
+
+        self.assertEqual({'2': self.ports[1], '3': new}, port_cache._PORTS)
+
+    def test_add_remove_not_loaded(self, mock_time):
+        port_cache.add(make_port('3'))
+        port_cache.remove('1')
+        self.assertIsNone(port_cache._PORTS)
+
+    def test_invalidate(self, mock_time):
+        mock_time.return_value = 100
+        self.ironic.port.list.return_value = self.ports
+        port_cache.ports(self.ironic)
+
+        port_cache.invalidate()
+        port_cache.ports(self.ironic)
+
+        self.assertEqual([self.full_call, self.full_call],
+                         self.ironic.port.list.call_args_list)
+
+    def test_find(self, mock_time):
+        mock_time.return_value = 100
+        self.ironic.port.list.return_value = self.ports
+        self.ironic.port.get.side_effect = lambda uuid, **kw: mock.Mock(
+            uuid=uuid)
+
+        self.assertEqual('2', port_cache.find('MAC-2', self.ironic).uuid)
+        self.assertIsNone(port_cache.find('mac-3', self.ironic))
+
+        self.ironic.port.get.assert_called_once_with(
+            '2', fields=port_cache.FIELDS)
+        self.assertEqual([self.full_call,
+                          self.incremental_call('created_at'),
+                          self.incremental_call('updated_at')],
+                         self.ironic.port.list.call_args_list)
+
+    def test_find_updated_address(self, mock_time):
+        mock_time.return_value = 100
+        self.ironic.port.list.return_value = self.ports
+        port_cache.ports(self.ironic)
+        self.ironic.port.list.return_value = []
+
+        port_cache.add(make_port('1', address='new-mac'))
+
+        self.assertIsNone(port_cache.find('mac-1', self.ironic))
+        self.assertIsNotNone(port_cache.find('new-mac', self.ironic))
+
+    def test_find_deleted(self, mock_time):
+        mock_time.return_value = 100
+        self.ironic.port.list.return_value = self.ports
+        self.ironic.port.get.side_effect = ironic_exc.NotFound()
+
+        self.assertIsNone(port_cache.find('mac-2', self.ironic))
+        self.assertNotIn('2', port_cache._PORTS)
+        self.assertNotIn('mac-2', port_cache._BY_ADDRESS)
+
+    def test_find_disabled(self, mock_time):
+        CONF.set_override('port_cache_refresh_period', 0, 'firewall')
+        self.ironic.port.list.return_value = self.ports[1:]
+
+        self.assertIs(self.ports[1], port_cache.find('mac-2', self.ironic))
+
+        self.ironic.port.list.assert_called_once_with(address='mac-2')
+        self.assertFalse(self.ironic.port.get.called)
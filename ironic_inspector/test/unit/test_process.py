@@ -28,12 +28,13 @@ from oslo_utils import timeutils
 from oslo_utils import uuidutils
 
 from ironic_inspector.common import ironic as ir_utils
+from ironic_inspector.common import swift
 from ironic_inspector import db
-from ironic_inspector import firewall
 from ironic_inspector import introspection_state as istate
 from ironic_inspector import node_cache
 from ironic_inspector.plugins import base as plugins_base
 from ironic_inspector.plugins import example as example_plugin
+from ironic_inspector.plugins import introspection_data
 from ironic_inspector import process
 from ironic_inspector.test import base as test_base
 from ironic_inspector import utils
@@ -72,6 +73,8 @@ class BaseProcessTest(BaseTest):
         self.node_info.finished = mock.Mock()
         self.find_mock.return_value = self.node_info
         self.cli.node.get.return_value = self.node
+        self.node_fields = ['driver_info', 'properties', 'provision_state',
+                            'uuid']
         self.process_mock = self.process_fixture.mock
         self.process_mock.return_value = self.fake_result_json
 
@@ -86,7 +89,8 @@ class TestProcess(BaseProcessTest):
                                                mac=mock.ANY)
         actual_macs = self.find_mock.call_args[1]['mac']
         self.assertEqual(sorted(self.all_macs), sorted(actual_macs))
-        self.cli.node.get.assert_called_once_with(self.uuid)
+        self.cli.node.get.assert_called_once_with(
+            self.uuid, fields=self.node_fields)
         self.process_mock.assert_called_once_with(
             self.node_info, self.node, self.data)
 
@@ -97,10 +101,19 @@ class TestProcess(BaseProcessTest):
         self.find_mock.assert_called_once_with(bmc_address=None, mac=mock.ANY)
         actual_macs = self.find_mock.call_args[1]['mac']
         self.assertEqual(sorted(self.all_macs), sorted(actual_macs))
-        self.cli.node.get.assert_called_once_with(self.uuid)
+        self.cli.node.get.assert_called_once_with(
+            self.uuid, fields=self.node_fields)
         self.process_mock.assert_called_once_with(self.node_info, self.node,
                                                   self.data)
 
+    def test_hooks_node_fields(self):
+        CONF.set_override('processing_hooks', 'ramdisk_error,extra_hardware',
+                          'processing')
+        process.process(self.data)
+        self.cli.node.get.assert_called_once_with(
+            self.uuid, fields=['driver_info', 'extra', 'provision_state',
+                               'uuid'])
+
     def test_not_found_in_cache(self):
         self.find_mock.side_effect = utils.Error('not found')
         self.assertRaisesRegex(utils.Error,
@@ -115,7 +128,8 @@ class TestProcess(BaseProcessTest):
         self.assertRaisesRegex(utils.Error,
                                'Node %s was not found' % self.uuid,
                                process.process, self.data)
-        self.cli.node.get.assert_called_once_with(self.uuid)
+        self.cli.node.get.assert_called_once_with(
+            self.uuid, fields=self.node_fields)
         self.assertFalse(self.process_mock.called)
         self.node_info.finished.assert_called_once_with(error=mock.ANY)
 
@@ -228,12 +242,12 @@ class TestUnprocessedData(BaseProcessTest):
 
         store_mock.assert_called_once_with(mock.ANY, expected)
 
-    @mock.patch.object(process.swift, 'SwiftAPI', autospec=True)
+    @mock.patch.object(swift, 'SwiftAPI', autospec=True)
     def test_save_unprocessed_data_failure(self, swift_mock):
         CONF.set_override('store_data', 'swift', 'processing')
         name = 'inspector_data-%s-%s' % (
             self.uuid,
-            process._UNPROCESSED_DATA_STORE_SUFFIX
+            introspection_data.UNPROCESSED_SUFFIX
         )
 
         swift_conn = swift_mock.return_value
@@ -243,7 +257,8 @@ class TestUnprocessedData(BaseProcessTest):
 
         # assert store failure doesn't break processing
         self.assertEqual(self.fake_result_json, res)
-        swift_conn.create_object.assert_called_once_with(name, mock.ANY)
+        swift_conn.create_object.assert_called_once_with(name, mock.ANY,
+                                                         headers=None)
 
 
 @mock.patch.object(example_plugin.ExampleProcessingHook, 'before_processing',
@@ -367,9 +382,6 @@ class TestProcessNode(BaseTest):
         self.cli.node.update.return_value = self.node
         self.cli.node.list_ports.return_value = []
 
-        self.useFixture(fixtures.MockPatchObject(
-            firewall, 'update_filters', autospec=True))
-
         self.useFixture(fixtures.MockPatchObject(
             eventlet.greenthread, 'sleep', autospec=True))
         self.node_info._state = istate.States.waiting
@@ -413,6 +425,22 @@ class TestProcessNode(BaseTest):
         post_hook_mock.assert_called_once_with(self.data, self.node_info)
         finished_mock.assert_called_once_with(mock.ANY)
 
+    @mock.patch.object(process.rules, 'apply', autospec=True)
+    def test_rules_reuse_cached_node(self, apply_mock):
+        node_info = node_cache.NodeInfo(uuid=self.uuid,
+                                        started_at=self.started_at,
+                                        node=self.node)
+        node_info._state = istate.States.waiting
+        # a hook updating the node refreshes the cached node
+        node_info.update_properties(cpus=4)
+        apply_mock.side_effect = lambda node_info, data: self.assertIs(
+            self.node, node_info.node())
+
+        process._process_node(node_info, self.node, self.data)
+
+        apply_mock.assert_called_once_with(node_info, self.data)
+        self.assertFalse(self.cli.node.get.called)
+
     def test_port_failed(self):
         self.cli.port.create.side_effect = (
             [exceptions.Conflict()] + self.ports[1:])
@@ -502,7 +530,7 @@ class TestProcessNode(BaseTest):
         self.assertFalse(self.cli.node.set_power_state.called)
         finished_mock.assert_called_once_with(self.node_info)
 
-    @mock.patch.object(process.swift, 'SwiftAPI', autospec=True)
+    @mock.patch.object(swift, 'SwiftAPI', autospec=True)
     def test_store_data(self, swift_mock):
         CONF.set_override('store_data', 'swift', 'processing')
         swift_conn = swift_mock.return_value
@@ -511,11 +539,12 @@ class TestProcessNode(BaseTest):
 
         process._process_node(self.node_info, self.node, self.data)
 
-        swift_conn.create_object.assert_called_once_with(name, mock.ANY)
+        swift_conn.create_object.assert_called_once_with(name, mock.ANY,
+                                                         headers=None)
         self.assertEqual(expected,
                          json.loads(swift_conn.create_object.call_args[0][1]))
 
-    @mock.patch.object(process.swift, 'SwiftAPI', autospec=True)
+    @mock.patch.object(swift, 'SwiftAPI', autospec=True)
     def test_store_data_no_logs(self, swift_mock):
         CONF.set_override('store_data', 'swift', 'processing')
         swift_conn = swift_mock.return_value
@@ -524,11 +553,12 @@ class TestProcessNode(BaseTest):
 
         process._process_node(self.node_info, self.node, self.data)
 
-        swift_conn.create_object.assert_called_once_with(name, mock.ANY)
+        swift_conn.create_object.assert_called_once_with(name, mock.ANY,
+                                                         headers=None)
         self.assertNotIn('logs',
                          json.loads(swift_conn.create_object.call_args[0][1]))
 
-    @mock.patch.object(process.swift, 'SwiftAPI', autospec=True)
+    @mock.patch.object(swift, 'SwiftAPI', autospec=True)
     def test_store_data_location(self, swift_mock):
         CONF.set_override('store_data', 'swift', 'processing')
         CONF.set_override('store_data_location', 'inspector_data_object',
@@ -541,11 +571,25 @@ class TestProcessNode(BaseTest):
 
         process._process_node(self.node_info, self.node, self.data)
 
-        swift_conn.create_object.assert_called_once_with(name, mock.ANY)
+        swift_conn.create_object.assert_called_once_with(name, mock.ANY,
+                                                         headers=None)
         self.assertEqual(expected,
                          json.loads(swift_conn.create_object.call_args[0][1]))
         self.cli.node.update.assert_any_call(self.uuid, patch)
 
+    def test_store_data_database(self):
+        CONF.set_override('store_data', 'database', 'processing')
+        CONF.set_override('store_data_location', 'inspector_data_object',
+                          'processing')
+
+        process._process_node(self.node_info, self.node, self.data)
+
+        stored = plugins_base.introspection_data_store().get(self.uuid)
+        self.assertEqual(self.data, json.loads(stored))
+        for call in self.cli.node.update.call_args_list:
+            self.assertNotIn('/extra/inspector_data_object',
+                             [item['path'] for item in call[0][1]])
+
 
 @mock.patch.object(process, '_reapply', autospec=True)
 @mock.patch.object(node_cache, 'get_node', autospec=True)
@@ -591,7 +635,7 @@ class TestReapply(BaseTest):
 
 @mock.patch.object(example_plugin.ExampleProcessingHook, 'before_update')
 @mock.patch.object(process.rules, 'apply', autospec=True)
-@mock.patch.object(process.swift, 'SwiftAPI', autospec=True)
+@mock.patch.object(swift, 'SwiftAPI', autospec=True)
 @mock.patch.object(node_cache.NodeInfo, 'finished', autospec=True)
 @mock.patch.object(node_cache.NodeInfo, 'release_lock', autospec=True)
 class TestReapplyNode(BaseTest):
@@ -637,16 +681,17 @@ class TestReapplyNode(BaseTest):
     def test_ok(self, finished_mock, swift_mock, apply_mock,
                 post_hook_mock):
         swift_name = 'inspector_data-%s' % self.uuid
-        swift_mock.get_object.return_value = json.dumps(self.data)
+        swift_mock.get_object.return_value = ({}, json.dumps(self.data))
 
         self.call()
 
         post_hook_mock.assert_called_once_with(mock.ANY, self.node_info)
         swift_mock.create_object.assert_called_once_with(swift_name,
-                                                         mock.ANY)
+                                                         mock.ANY,
+                                                         headers=None)
         swifted_data = json.loads(swift_mock.create_object.call_args[0][1])
 
-        self.node_info.invalidate_cache.assert_called_once_with()
+        self.assertFalse(self.node_info.invalidate_cache.called)
         apply_mock.assert_called_once_with(self.node_info, swifted_data)
 
         # assert no power operations were performed
@@ -671,7 +716,7 @@ class TestReapplyNode(BaseTest):
                                           post_hook_mock, ):
         exc = Exception('Oops')
         expected_error = ('Unexpected exception Exception while fetching '
-                          'unprocessed introspection data from Swift: Oops')
+                          'unprocessed introspection data: Oops')
         swift_mock.get_object.side_effect = exc
         self.call()
 
@@ -689,7 +734,7 @@ class TestReapplyNode(BaseTest):
         plugins_base._HOOKS_MGR = None
 
         exc = Exception('Failed.')
-        swift_mock.get_object.return_value = json.dumps(self.data)
+        swift_mock.get_object.return_value = ({}, json.dumps(self.data))
 
         with mock.patch.object(example_plugin.ExampleProcessingHook,
                                'before_processing') as before_processing_mock:
@@ -713,7 +758,7 @@ class TestReapplyNode(BaseTest):
     def test_generic_exception_creating_ports(self, finished_mock,
                                               swift_mock, apply_mock,
                                               post_hook_mock):
-        swift_mock.get_object.return_value = json.dumps(self.data)
+        swift_mock.get_object.return_value = ({}, json.dumps(self.data))
         exc = Exception('Oops')
         self.cli.port.create.side_effect = exc
         self.call()
@@ -14,9 +14,15 @@
 
 """Tests for introspection rules."""
 
+import datetime
+import json
+
 import mock
 from oslo_utils import uuidutils
+import six
 
+from ironic_inspector.common import ironic as ir_utils
+from ironic_inspector.common import swift
 from ironic_inspector import db
 from ironic_inspector.plugins import base as plugins_base
 from ironic_inspector import rules
@@ -181,6 +187,114 @@ class TestDeleteRule(BaseTest):
         self.assertFalse(db.model_query(db.RuleAction).all())
 
 
+class TestImportExportRules(BaseTest):
+    def setUp(self):
+        super(TestImportExportRules, self).setUp()
+        self.uuid2 = uuidutils.generate_uuid()
+        rules.create(self.conditions_json, self.actions_json, uuid=self.uuid,
+                     description='first')
+        rules.create(self.conditions_json, self.actions_json, uuid=self.uuid2,
+                     description='second')
+
+    def _rule_json(self, uuid=None, description=None):
+        rule_json = {'conditions': self.conditions_json,
+                     'actions': [{'action': 'set-attribute',
+                                  'path': '/extra/foo', 'value': 42}],
+                     'description': description}
+        if uuid:
+            rule_json['uuid'] = uuid
+        return rule_json
+
+    def _descriptions(self):
+        return [rule.description for rule in rules.get_all()]
+
+    def test_upsert(self):
+        uuid3 = uuidutils.generate_uuid()
+        result = rules.import_rules([self._rule_json(uuid3, 'third'),
+                                     self._rule_json(self.uuid, 'updated'),
+                                     self._rule_json(None, 'fourth')])
+
+        self.assertEqual(['third', 'updated', 'fourth'],
+                         [rule.description for rule in result])
+        self.assertEqual(['updated', 'second', 'third', 'fourth'],
+                         self._descriptions())
+        self.assertEqual('set-attribute',
+                         rules.get(self.uuid).as_dict()['actions'][0]
+                         ['action'])
+        self.assertEqual(len(self.conditions_json),
+                         db.model_query(db.RuleCondition)
+                         .filter_by(rule=self.uuid).count())
+
+    def test_replace(self):
+        rules.import_rules([self._rule_json(self.uuid2, 'updated'),
+                            self._rule_json(None, 'new')], replace=True)
+
+        self.assertEqual(['updated', 'new'], self._descriptions())
+        self.assertEqual(2 * len(self.conditions_json),
+                         db.model_query(db.RuleCondition).count())
+        self.assertEqual(2, db.model_query(db.RuleAction).count())
+
+    def test_replace_with_nothing(self):
+        self.assertEqual([], rules.import_rules([], replace=True))
+        self.assertEqual([], rules.get_all())
+
+    def test_invalid_rule_nothing_changed(self):
+        bad = self._rule_json(None, 'bad')
+        bad['actions'] = [{'action': 'foobar'}]
+
+        six.assertRaisesRegex(self, utils.Error, 'Invalid rule #1',
+                              rules.import_rules,
+                              [self._rule_json(self.uuid, 'updated'), bad],
+                              replace=True)
+        self.assertEqual(['first', 'second'], self._descriptions())
+
+    def test_invalid_uuid(self):
+        self.assertRaises(utils.Error, rules.import_rules,
+                          [self._rule_json('foo')])
+
+    def test_duplicate_uuid(self):
+        six.assertRaisesRegex(self, utils.Error, 'Duplicate',
+                              rules.import_rules,
+                              [self._rule_json(self.uuid, 'a'),
+                               self._rule_json(self.uuid, 'b')])
+        self.assertEqual(['first', 'second'], self._descriptions())
+
+    def test_not_a_list(self):
+        self.assertRaises(utils.Error, rules.import_rules, {})
+        self.assertRaises(utils.Error, rules.import_rules, ['foo'])
+
+    def test_export(self):
+        for batch_size in (1, 100):
+            result = [rule.as_dict()
+                      for rule in rules.export_rules(batch_size=batch_size)]
+            self.assertEqual([self.uuid, self.uuid2],
+                             [rule['uuid'] for rule in result])
+            self.assertEqual(self.conditions_json, result[0]['conditions'])
+
+    def test_export_import_round_trip(self):
+        exported = [rule.as_dict() for rule in rules.export_rules()]
+        rules.import_rules(list(reversed(exported)), replace=True)
+        self.assertEqual(['second', 'first'], self._descriptions())
+
+    @mock.patch.object(rules.timeutils, 'utcnow', autospec=True)
+    def test_order_with_same_created_at(self, mock_utcnow):
+        # NOTE(dtantsur): emulate DATETIME columns without fractional seconds
+        mock_utcnow.return_value = datetime.datetime(2017, 3, 1, 12, 0, 0)
+        uuids = sorted(uuidutils.generate_uuid() for _ in range(5))
+        rules.import_rules([self._rule_json(uuid, str(idx))
+                            for idx, uuid in enumerate(reversed(uuids))])
+        rules.create(self.conditions_json, self.actions_json,
+                     description='last')
+
+        self.assertEqual(['first', 'second', '0', '1', '2', '3', '4', 'last'],
+                         self._descriptions())
+
+        exported = [rule.as_dict() for rule in rules.export_rules()]
+        rules.import_rules(list(reversed(exported)), replace=True)
+        self.assertEqual(['last', '4', '3', '2', '1', '0', 'second', 'first'],
+                         self._descriptions())
+
+
 @mock.patch.object(plugins_base, 'rule_conditions_manager', autospec=True)
 class TestCheckConditions(BaseTest):
     def setUp(self):
@@ -368,6 +482,315 @@ class TestCheckConditionsSchemePath(BaseTest):
                           rule.check_conditions(self.node_info, self.data))
 
 
+class TestParseDataPath(test_base.BaseTest):
+    def test_parse(self):
+        data = {'inventory': {'disks': [{'name': 'sda'}, {'name': 'sdb'}]}}
+        for field in ('inventory.disks[*].name',
+                      'data://inventory.disks[*].name'):
+            expr = rules.parse_data_path(field)
+            self.assertEqual(['sda', 'sdb'],
+                             [match.value for match in expr.find(data)])
+
+    def test_invalid(self):
+        for field in ('node://driver', 'inventory.['):
+            exc = self.assertRaises(utils.Error, rules.parse_data_path, field)
+            self.assertEqual(400, exc.http_code)
+
+
+class TestConditionsOrder(BaseTest):
+    def setUp(self):
+        super(TestConditionsOrder, self).setUp()
+        self.addCleanup(rules._STATISTICS.clear)
+        self.rule = rules.create(conditions_json=self.conditions_json,
+                                 actions_json=self.actions_json)
+        self.first, self.second = self.rule._conditions
+
+    def _set_statistics(self, cond, checked, passed, average_time):
+        stats = self.rule._statistics(cond)
+        stats.checked = checked
+        stats.passed = passed
+        stats.total_time = average_time * checked
+
+    def test_collects_statistics(self):
+        self.data['local_gb'] = 60
+        self.assertTrue(self.rule.check_conditions(self.node_info,
+                                                   self.data))
+        self.data['local_gb'] = 42
+        self.assertFalse(self.rule.check_conditions(self.node_info,
+                                                    self.data))
+
+        stats = self.rule.statistics()
+        self.assertEqual(self.rule._uuid, stats['uuid'])
+        self.assertEqual([0, 1], stats['order'])
+        self.assertEqual([{'checked': 2, 'passed': 2},
+                          {'checked': 2, 'passed': 1}],
+                         [{k: v for k, v in cond['statistics'].items()
+                           if k != 'average_time'}
+                          for cond in stats['conditions']])
+        self.assertEqual('memory_mb', stats['conditions'][0]['field'])
+
+    def test_not_enough_statistics(self):
+        self._set_statistics(self.first, 5, 5, 1.0)
+        self._set_statistics(self.second, 5, 0, 0.001)
+        self.assertEqual([self.first, self.second],
+                         self.rule.conditions_order())
+
+        self._set_statistics(self.first, 100, 0, 0.001)
+        self.assertEqual([self.second, self.first],
+                         self.rule.conditions_order())
+
+    def test_selective_first(self):
+        self._set_statistics(self.first, 100, 100, 0.001)
+        self._set_statistics(self.second, 100, 0, 0.001)
+        self.assertEqual([self.second, self.first],
+                         self.rule.conditions_order())
+
+        self.assertFalse(self.rule.check_conditions(self.node_info,
+                                                    self.data))
+        self.assertEqual(100, self.rule._statistics(self.first).checked)
+        self.assertEqual(101, self.rule._statistics(self.second).checked)
+
+    def test_cheap_first(self):
+        self._set_statistics(self.first, 100, 50, 0.001)
+        self._set_statistics(self.second, 100, 50, 0.1)
+        self.assertEqual([self.first, self.second],
+                         self.rule.conditions_order())
+
+        self._set_statistics(self.first, 100, 50, 0.1)
+        self._set_statistics(self.second, 100, 50, 0.001)
+        self.assertEqual([self.second, self.first],
+                         self.rule.conditions_order())
+
+    @mock.patch.object(plugins_base.RuleConditionPlugin, 'SIDE_EFFECTS',
+                       True)
+    def test_side_effects(self):
+        self._set_statistics(self.first, 100, 100, 0.001)
+        self._set_statistics(self.second, 100, 0, 0.001)
+        self.assertEqual([self.first, self.second],
+                         self.rule.conditions_order())
+        self.assertEqual([0, 1], self.rule.statistics()['order'])
+
+    def test_fallback_to_defined_order(self):
+        self.conditions_json = [
+            {'op': 'eq', 'field': 'memory_mb', 'value': 1024},
+            {'op': 'ge', 'field': 'local_gb', 'value': 60},
+        ]
+        self.rule = rules.create(conditions_json=self.conditions_json,
+                                 actions_json=self.actions_json)
+        self.first, self.second = self.rule._conditions
+        self._set_statistics(self.first, 100, 100, 0.001)
+        self._set_statistics(self.second, 100, 0, 0.001)
+        self.data['memory_mb'] = 512
+        self.data['local_gb'] = 'not a number'
+
+        self.assertFalse(self.rule.check_conditions(self.node_info,
+                                                    self.data))
+
+        self.data['memory_mb'] = 1024
+        self.assertRaises(ValueError, self.rule.check_conditions,
+                          self.node_info, self.data)
+
+    def test_fallback_records_statistics_once(self):
+        self.conditions_json = [
+            {'op': 'eq', 'field': 'cpus', 'value': 4},
+            {'op': 'eq', 'field': 'memory_mb', 'value': 1024},
+            {'op': 'ge', 'field': 'local_gb', 'value': 60},
+        ]
+        self.rule = rules.create(conditions_json=self.conditions_json,
+                                 actions_json=self.actions_json)
+        first, second, third = self.rule._conditions
+        self._set_statistics(first, 100, 50, 0.001)
+        self._set_statistics(second, 100, 100, 0.001)
+        self._set_statistics(third, 100, 0, 0.01)
+        self.assertEqual([first, third, second],
+                         self.rule.conditions_order())
+        self.data.update(memory_mb=512, cpus=4, local_gb='not a number')
+
+        # the third condition fails with the reordered conditions, the
+        # first one is checked again in the defined order
+        self.assertFalse(self.rule.check_conditions(self.node_info,
+                                                    self.data))
+
+        self.assertEqual((101, 51), (self.rule._statistics(first).checked,
+                                     self.rule._statistics(first).passed))
+        self.assertEqual((101, 100), (self.rule._statistics(second).checked,
+                                      self.rule._statistics(second).passed))
+        self.assertEqual(100, self.rule._statistics(third).checked)
+
+    def test_delete_drops_statistics(self):
+        self.rule.check_conditions(self.node_info, self.data)
+        self.assertIn(self.rule._uuid, rules._STATISTICS)
+        rules.delete(self.rule._uuid)
+        self.assertNotIn(self.rule._uuid, rules._STATISTICS)
+
+
+class TestCheckConditionsBulk(BaseTest):
+    def setUp(self):
+        super(TestCheckConditionsBulk, self).setUp()
+        self.data_set = [
+            {'memory_mb': 1024, 'local_gb': 60,
+             'interfaces': [{'ip': '1.1.1.1'}, {'ip': '1.2.3.4'}]},
+            {'memory_mb': 1024, 'local_gb': 42,
+             'interfaces': [{'ip': '1.2.3.4'}]},
+            {'memory_mb': 2048, 'local_gb': 60,
+             'interfaces': [{'ip': '1.2.3.4'}, {'ip': '1.3.2.2'}]},
+            {'memory_mb': 1024, 'interfaces': []},
+            {'memory_mb': 1024, 'local_gb': 60.5,
+             'interfaces': [{'ip': None}]},
+            {},
+        ]
+
+    def _test(self, conditions_json, errors=None):
+        rule = rules.create(conditions_json=conditions_json,
+                            actions_json=self.actions_json)
+        expected = []
+        for data in self.data_set:
+            try:
+                expected.append(rule.check_conditions(self.node_info, data))
+            except Exception:
+                expected.append(False)
+
+        mask, errs = rule.check_conditions_bulk(self.data_set)
+        self.assertEqual(expected, mask)
+        self.assertEqual(errors or [], sorted(errs))
+
+    def test_simple(self):
+        self._test(self.conditions_json)
+
+    def test_invert(self):
+        self.conditions_json[1]['invert'] = True
+        self._test(self.conditions_json)
+
+    def test_multiple(self):
+        for multiple in ('any', 'all', 'first'):
+            self._test([{'op': 'eq', 'field': 'interfaces[*].ip',
+                         'value': '1.2.3.4', 'multiple': multiple}])
+
+    def test_allow_none(self):
+        self._test([{'op': 'is-empty', 'field': 'local_gb'}])
+
+    def test_errors(self):
+        self._test([{'op': 'in-net', 'field': 'interfaces[*].ip',
+                     'value': '1.2.3.0/24'}], errors=[4])
+
+    def test_no_conditions(self):
+        self._test([])
+
+    def test_node_path(self):
+        rule = rules.create(
+            conditions_json=[{'op': 'eq', 'field': 'node://driver',
+                              'value': 'fake'}],
+            actions_json=self.actions_json)
+        nodes = [{'driver': 'fake'}, {'driver': 'ipmi'}]
+
+        self.assertEqual(([True, False], {}),
+                         rule.check_conditions_bulk([{}, {}], nodes))
+        self.assertRaises(utils.Error, rule.check_conditions_bulk, [{}, {}])
+
+
+@mock.patch.object(swift, 'get_introspection_data', autospec=True)
+class TestDryRun(BaseTest):
+    def setUp(self):
+        super(TestDryRun, self).setUp()
+        self.cfg.config(store_data='swift', group='processing')
+        self.stored = {
+            'uuid1': {'memory_mb': 1024, 'local_gb': 60},
+            'uuid2': {'memory_mb': 1024, 'local_gb': 42},
+        }
+
+    def _get_data(self, uuid, suffix=None):
+        try:
+            return json.dumps(self.stored[uuid])
+        except KeyError:
+            raise utils.Error('not found')
+
+    def test_dry_run(self, mock_get_data):
+        mock_get_data.side_effect = self._get_data
+
+        result = rules.dry_run(self.conditions_json,
+                               ['uuid1', 'uuid2', 'uuid3'])
+
+        self.assertEqual(['uuid1'], result['matched'])
+        self.assertEqual({'uuid3': 'not found'}, result['errors'])
+        self.assertFalse(db.model_query(db.Rule).all())
+
+    @mock.patch.object(ir_utils, 'get_node', autospec=True)
+    @mock.patch.object(ir_utils, 'get_client', autospec=True)
+    def test_node_path(self, mock_client, mock_get_node, mock_get_data):
+        mock_get_data.side_effect = self._get_data
+        drivers = {'uuid1': 'pxe_ipmitool', 'uuid2': 'fake'}
+        mock_get_node.side_effect = lambda uuid, **kw: mock.Mock(
+            **{'to_dict.return_value': {'driver': drivers[uuid],
+                                        'extra': {'foo': 'baz'}}})
+
+        result = rules.dry_run([{'op': 'eq', 'field': 'node://driver',
+                                 'value': 'fake'},
+                                {'op': 'eq', 'field': 'node://$.extra.foo',
+                                 'value': 'bar', 'invert': True}],
+                               ['uuid1', 'uuid2'])
+
+        self.assertEqual(['uuid2'], result['matched'])
+        self.assertEqual({}, result['errors'])
+        mock_get_node.assert_has_calls(
+            [mock.call(uuid, ironic=mock_client.return_value,
+                       fields=['driver', 'extra', 'uuid'])
+             for uuid in ('uuid1', 'uuid2')], any_order=True)
+        self.assertFalse(mock_client.return_value.node.list.called)
+
+    @mock.patch.object(ir_utils, 'get_node', autospec=True)
+    @mock.patch.object(ir_utils, 'get_client', autospec=True)
+    def test_node_path_all_fields(self, mock_client, mock_get_node,
+                                  mock_get_data):
+        mock_get_data.side_effect = self._get_data
+        mock_get_node.return_value.to_dict.return_value = {'driver': 'fake'}
+
+        result = rules.dry_run([{'op': 'eq', 'field': 'node://$..driver',
+                                 'value': 'fake'}],
+                               ['uuid1'])
+
+        self.assertEqual(['uuid1'], result['matched'])
+        mock_get_node.assert_called_once_with(
+            'uuid1', ironic=mock_client.return_value)
+
+    @mock.patch.object(ir_utils, 'get_node', autospec=True)
+    @mock.patch.object(ir_utils, 'get_client', autospec=True)
+    def test_node_not_found(self, mock_client, mock_get_node,
+                            mock_get_data):
+        mock_get_data.side_effect = self._get_data
+        mock_get_node.side_effect = ir_utils.NotFound('uuid1')
+
+        result = rules.dry_run([{'op': 'eq', 'field': 'node://driver',
+                                 'value': 'fake', 'invert': True}],
+                               ['uuid1'])
+
+        self.assertEqual([], result['matched'])
+        self.assertEqual(['uuid1'], list(result['errors']))
+        self.assertIn('was not found', result['errors']['uuid1'])
+
+    def test_invalid_conditions(self, mock_get_data):
+        self.conditions_json[0]['op'] = 'foobar'
+        self.assertRaisesRegex(utils.Error,
+                               'Validation failed for conditions',
+                               rules.dry_run, self.conditions_json,
+                               ['uuid1'])
+        self.assertFalse(mock_get_data.called)
+
+    def test_store_data_disabled(self, mock_get_data):
+        self.cfg.config(store_data='none', group='processing')
+        exc = self.assertRaises(utils.Error, rules.dry_run,
+                                self.conditions_json, ['uuid1'])
+        self.assertEqual(400, exc.http_code)
+        self.assertFalse(mock_get_data.called)
+
+    def test_invalid_data(self, mock_get_data):
+        mock_get_data.return_value = 'not json'
+
+        result = rules.dry_run(self.conditions_json, ['uuid1'])
+
+        self.assertEqual([], result['matched'])
+        self.assertEqual(['uuid1'], list(result['errors']))
+
+
 @mock.patch.object(plugins_base, 'rule_actions_manager', autospec=True)
 class TestApplyActions(BaseTest):
     def setUp(self):
@@ -445,6 +868,95 @@ class TestApplyActions(BaseTest):
                          self.act_mock.rollback.call_count)
         self.assertFalse(self.act_mock.apply.called)
 
+    def test_apply_data_format_value_not_stored(self, mock_ext_mgr):
+        self.rule = rules.create(actions_json=[
+            {'action': 'set-attribute',
+             'path': '/driver_info/ipmi_address',
+             'value': '{data[memory_mb]}'}],
+            conditions_json=self.conditions_json
+        )
+        mock_ext_mgr.return_value.__getitem__.return_value = self.ext_mock
+
+        self.rule.apply_actions(self.node_info, data=self.data)
+        self.rule.apply_actions(self.node_info, data={'memory_mb': 42})
+
+        self.act_mock.apply.assert_has_calls([
+            mock.call(self.node_info, {'path': '/driver_info/ipmi_address',
+                                       'value': '1024'}),
+            mock.call(self.node_info, {'path': '/driver_info/ipmi_address',
+                                       'value': '42'}),
+        ])
+        self.assertEqual('{data[memory_mb]}',
+                         self.rule._actions[0].params['value'])
+
+    def test_rollback_not_overridden(self, mock_ext_mgr):
+        class Action(plugins_base.RuleActionPlugin):
+            apply = mock.Mock()
+
+        act = Action()
+        self.ext_mock.obj = act
+        mock_ext_mgr.return_value.__getitem__.return_value = self.ext_mock
+
+        with mock.patch.object(plugins_base.RuleActionPlugin,
+                               'rollback') as rollback_mock:
+            self.rule.apply_actions(self.node_info, rollback=True)
+
+        self.assertFalse(rollback_mock.called)
+        self.assertFalse(act.apply.called)
+
+
+class TestApplyActionsPatches(BaseTest):
+    def test_patches_in_one_request(self):
+        self.rule = rules.create(actions_json=[
+            {'action': 'set-attribute', 'path': '/extra/foo',
+             'value': '{data[memory_mb]}'},
+            {'action': 'set-capability', 'name': 'x', 'value': '1'},
+            {'action': 'extend-attribute', 'path': '/extra/list',
+             'value': 42}],
+            conditions_json=self.conditions_json
+        )
+        ironic = mock.Mock()
+        self.node_info._ironic = ironic
+
+        self.rule.apply_actions(self.node_info, data=self.data)
+
+        ironic.node.update.assert_called_once_with(self.node_info.uuid,
+                                                   mock.ANY)
+        patches = ironic.node.update.call_args[0][1]
+        self.assertEqual([('add', '/extra/foo', '1024'),
+                          ('add', '/properties/capabilities', 'x:1'),
+                          ('add', '/extra/list', [42])],
+                         [(p['op'], p['path'], p['value'])
+                          for p in patches])
+
+
+class TestParamTemplate(test_base.BaseTest):
+    def test_format(self):
+        data = {'a': {'b': [1, 'x']}, 'c': 3.14159}
+        for template in ['plain', '', '{data[a][b][1]}',
+                         '{{{data[c]:.2f}}}', 'x{data[a]!r}y',
+                         '{data[c]:{data[a][b][0]}}']:
+            self.assertEqual(template.format(data=data),
+                             rules.ParamTemplate(template).format(data),
+                             template)
+
+    def test_missing_key(self):
+        self.assertRaises(KeyError,
+                          rules.ParamTemplate('{data[a]}').format, {})
+        self.assertRaises(KeyError,
+                          rules.ParamTemplate('{foo}').format, {})
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, rules.ParamTemplate, '{data[a]')
+
+    def test_create_invalid(self):
+        six.assertRaisesRegex(self, utils.Error,
+                              'Invalid formatting template',
+                              rules.create, [],
+                              [{'action': 'set-attribute',
+                                'path': '/extra/foo',
+                                'value': '{data[a]'}])
+
 
 @mock.patch.object(rules, 'get_all', autospec=True)
 class TestApply(BaseTest):
@@ -14,6 +14,10 @@
 
 # Mostly copied from ironic/tests/test_swift.py
 
+import gzip
+import io
+import json
+
 try:
     from unittest import mock
 except ImportError:
@@ -65,8 +69,18 @@ class SwiftTestCase(BaseTest):
 
     def test___init__(self, connection_mock, load_mock, opts_mock):
         swift.SwiftAPI()
+        self.assertFalse(connection_mock.called)
+
+    def test_connection_reused(self, connection_mock, load_mock, opts_mock):
+        connection_obj_mock = connection_mock.return_value
+        connection_obj_mock.get_object.return_value = ('headers', 'data')
+
+        swift.SwiftAPI().get_object('object')
+        swift.SwiftAPI().create_object('object', 'some-string-data')
+
         connection_mock.assert_called_once_with(
             session=load_mock.return_value)
+        load_mock.assert_called_once_with(swift.SWIFT_GROUP)
 
     def test_create_object(self, connection_mock, load_mock, opts_mock):
         swiftapi = swift.SwiftAPI()
@@ -82,6 +96,36 @@ class SwiftTestCase(BaseTest):
             'ironic-inspector', 'object', 'some-string-data', headers=None)
         self.assertEqual('object-uuid', object_uuid)
 
+    def test_create_object_container_cached(self, connection_mock,
+                                            load_mock, opts_mock):
+        swiftapi = swift.SwiftAPI()
+        connection_obj_mock = connection_mock.return_value
+
+        swiftapi.create_object('object1', 'some-string-data')
+        swiftapi.create_object('object2', 'some-string-data')
+        swiftapi.create_object('object3', 'some-string-data',
+                               container='other')
+
+        connection_obj_mock.put_container.assert_has_calls(
+            [mock.call('ironic-inspector'), mock.call('other')])
+        self.assertEqual(2, connection_obj_mock.put_container.call_count)
+        self.assertEqual(3, connection_obj_mock.put_object.call_count)
+
+    def test_create_object_container_deleted(self, connection_mock,
+                                             load_mock, opts_mock):
+        swiftapi = swift.SwiftAPI()
+        connection_obj_mock = connection_mock.return_value
+        swiftapi.create_object('object1', 'some-string-data')
+        connection_obj_mock.put_object.side_effect = [
+            swift_exception.ClientException('', http_status=404),
+            'object-uuid']
+
+        object_uuid = swiftapi.create_object('object2', 'some-string-data')
+
+        self.assertEqual('object-uuid', object_uuid)
+        self.assertEqual(2, connection_obj_mock.put_container.call_count)
+        self.assertEqual(3, connection_obj_mock.put_object.call_count)
+
     def test_create_object_create_container_fails(self, connection_mock,
                                                   load_mock, opts_mock):
         swiftapi = swift.SwiftAPI()
@@ -126,3 +170,158 @@ class SwiftTestCase(BaseTest):
                           'object')
         connection_obj_mock.get_object.assert_called_once_with(
             'ironic-inspector', 'object')
+
+    def test_get_object_with_headers(self, connection_mock, load_mock,
+                                     opts_mock):
+        connection_obj_mock = connection_mock.return_value
+        connection_obj_mock.get_object.return_value = ({'etag': 'abc'},
+                                                       'data')
+
+        result = swift.SwiftAPI().get_object('object', with_headers=True)
+
+        self.assertEqual(({'etag': 'abc'}, 'data'), result)
+
+    def test_head_object(self, connection_mock, load_mock, opts_mock):
+        connection_obj_mock = connection_mock.return_value
+        connection_obj_mock.head_object.return_value = {'etag': 'abc'}
+
+        headers = swift.SwiftAPI().head_object('object')
+
+        self.assertEqual({'etag': 'abc'}, headers)
+        connection_obj_mock.head_object.assert_called_once_with(
+            'ironic-inspector', 'object')
+        self.assertEqual(1, len(swift._POOL.free_items))
+
+    def test_head_object_fails(self, connection_mock, load_mock, opts_mock):
+        connection_obj_mock = connection_mock.return_value
+        connection_obj_mock.head_object.side_effect = self.swift_exception
+
+        self.assertRaises(utils.Error, swift.SwiftAPI().head_object,
+                          'object')
+        self.assertEqual(1, len(swift._POOL.free_items))
+
+    def test_get_object_stream(self, connection_mock, load_mock, opts_mock):
+        connection_obj_mock = connection_mock.return_value
+        connection_obj_mock.get_object.return_value = ({'etag': 'abc'},
+                                                       iter([b'da', b'ta']))
+        swiftapi = swift.SwiftAPI()
+
+        headers, body = swiftapi.get_object_stream('object')
+
+        self.assertEqual({'etag': 'abc'}, headers)
+        # the connection is not returned to the pool until the body is read
+        self.assertEqual(0, len(swift._POOL.free_items))
+        self.assertEqual([b'da', b'ta'], list(body))
+        self.assertEqual(1, len(swift._POOL.free_items))
+        connection_obj_mock.get_object.assert_called_once_with(
+            'ironic-inspector', 'object', resp_chunk_size=swift.CHUNK_SIZE)
+        self.assertFalse(connection_obj_mock.close.called)
+
+    def test_get_object_stream_closed(self, connection_mock, load_mock,
+                                      opts_mock):
+        connection_obj_mock = connection_mock.return_value
+        connection_obj_mock.get_object.return_value = ({}, iter([b'data']))
+
+        headers, body = swift.SwiftAPI().get_object_stream('object')
+        body.close()
+        body.close()
+
+        connection_obj_mock.close.assert_called_once_with()
+        self.assertEqual(1, len(swift._POOL.free_items))
+
+    def test_get_object_stream_fails(self, connection_mock, load_mock,
+                                     opts_mock):
+        connection_obj_mock = connection_mock.return_value
+        connection_obj_mock.get_object.side_effect = self.swift_exception
+
+        self.assertRaises(utils.Error, swift.SwiftAPI().get_object_stream,
+                          'object')
+        self.assertEqual(1, len(swift._POOL.free_items))
+
+
+@mock.patch.object(swift, 'SwiftAPI', autospec=True)
+class TestIntrospectionData(BaseTest):
+    def setUp(self):
+        super(TestIntrospectionData, self).setUp()
+        self.name = 'inspector_data-%s' % self.uuid
+
+    def test_store_uncompressed(self, swift_mock):
+        swift_conn = swift_mock.return_value
+
+        result = swift.store_introspection_data(self.data, self.uuid)
+
+        self.assertEqual(self.name, result)
+        swift_conn.create_object.assert_called_once_with(
+            self.name, json.dumps(self.data), headers=None)
+
+    def test_store_and_get_compressed(self, swift_mock):
+        swift_conn = swift_mock.return_value
+        for encoding in ('gzip', 'zlib'):
+            self.cfg.config(data_compression=encoding, group='swift')
+            swift_conn.reset_mock()
+
+            swift.store_introspection_data(self.data, self.uuid,
+                                           suffix='UNPROCESSED')
+
+            name = self.name + '-UNPROCESSED'
+            swift_conn.create_object.assert_called_once_with(
+                name, mock.ANY,
+                headers={'X-Object-Meta-Inspector-Encoding': encoding})
+            payload = swift_conn.create_object.call_args[0][1]
+            self.assertNotEqual(json.dumps(self.data), payload)
+
+            swift_conn.get_object.return_value = (
+                {'x-object-meta-inspector-encoding': encoding}, payload)
+            result = swift.get_introspection_data(self.uuid,
+                                                  suffix='UNPROCESSED')
+            self.assertEqual(self.data, json.loads(result))
+            swift_conn.get_object.assert_called_once_with(name,
+                                                          with_headers=True)
+
+    def test_get_gzip_readable_by_gzip_module(self, swift_mock):
+        self.cfg.config(data_compression='gzip', group='swift')
+        payload, _headers = swift.compress('{"answer": 42}')
+
+        with gzip.GzipFile(fileobj=io.BytesIO(payload)) as fp:
+            self.assertEqual(b'{"answer": 42}', fp.read())
+
+    def test_get_uncompressed(self, swift_mock):
+        swift_conn = swift_mock.return_value
+        swift_conn.get_object.return_value = ({}, json.dumps(self.data))
+
+        result = swift.get_introspection_data(self.uuid)
+
+        self.assertEqual(json.dumps(self.data), result)
+
+    def test_get_corrupted(self, swift_mock):
+        swift_conn = swift_mock.return_value
+        swift_conn.get_object.return_value = (
+            {'x-object-meta-inspector-encoding': 'gzip'}, b'not gzip')
+
+        self.assertRaisesRegex(utils.Error, 'Failed to decompress',
+                               swift.get_introspection_data, self.uuid)
+
+    def test_get_unknown_compression(self, swift_mock):
+        swift_conn = swift_mock.return_value
+        swift_conn.get_object.return_value = (
+            {'x-object-meta-inspector-encoding': 'lzma'}, b'data')
+
+        self.assertRaisesRegex(utils.Error, 'Unsupported compression',
+                               swift.get_introspection_data, self.uuid)
+
+    def test_decompress_stream(self, swift_mock):
+        self.cfg.config(data_compression='gzip', group='swift')
+        payload, _headers = swift.compress(json.dumps(self.data))
+        chunks = [payload[i:i + 16] for i in range(0, len(payload), 16)]
+
+        result = b''.join(swift.decompress_stream(chunks, 'gzip'))
+
+        self.assertEqual(self.data, json.loads(result.decode('utf-8')))
+
+    def test_decompress_stream_corrupted(self, swift_mock):
+        self.assertRaisesRegex(utils.Error, 'Failed to decompress', list,
+                               swift.decompress_stream([b'not zlib'], 'zlib'))
+
+    def test_decompress_stream_unsupported(self, swift_mock):
+        self.assertRaisesRegex(utils.Error, 'Unsupported compression',
+                               swift.decompress_stream, [b'data'], 'lzma')
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Benchmark firewall backends using fake iptables executables.
+
+The fake executables are Python scripts, so every call costs roughly as much
+as starting a rootwrap process would. Nothing is changed on the host.
+"""
+
+import collections
+import optparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import mock
+from oslo_config import cfg
+
+from ironic_inspector import conf  # noqa
+from ironic_inspector import firewall
+from ironic_inspector import node_cache
+
+
+CONF = cfg.CONF
+FAKE_COMMAND = """#!%(python)s
+import sys
+if not sys.stdin.isatty():
+    sys.stdin.read()
+with open(%(log)r, 'a') as fp:
+    fp.write(' '.join(sys.argv) + '\\n')
+"""
+Port = collections.namedtuple('Port', ['address', 'extra'])
+
+
+def make_fake_command(path, name, log):
+    command = os.path.join(path, name)
+    with open(command, 'w') as fp:
+        fp.write(FAKE_COMMAND % {'python': sys.executable, 'log': log})
+    os.chmod(command, 0o755)
+    return command
+
+
+def count_calls(log):
+    if not os.path.exists(log):
+        return 0
+    with open(log) as fp:
+        return len(fp.readlines())
+
+
+def run(backend, ports, path):
+    log = os.path.join(path, '%s.log' % backend)
+    CONF.set_override('firewall_backend', backend, 'firewall')
+    firewall.INTERFACE = CONF.firewall.dnsmasq_interface
+    firewall.CHAIN = CONF.firewall.firewall_chain
+    firewall.NEW_CHAIN = firewall.CHAIN + '_temp'
+    firewall.BASE_COMMAND = (make_fake_command(path, 'iptables', log),)
+    firewall.RESTORE_COMMAND = (
+        make_fake_command(path, 'iptables-restore', log), '--noflush')
+    firewall.IPSET_COMMAND = (make_fake_command(path, 'ipset', log),)
+    firewall.IPSET = CONF.firewall.ipset_name
+    firewall.BLACKLIST_CACHE = None
+    firewall.IPSET_ENTRIES = None
+    firewall.JUMP_INSTALLED = False
+
+    ironic = mock.Mock()
+    ironic.port.list.return_value = ports
+
+    start = time.time()
+    firewall.update_filters(ironic)
+    full = (time.time() - start, count_calls(log))
+
+    # One port replaced
+    ironic.port.list.return_value = ports[1:] + [Port('52:54:01:00:00:00',
+                                                      {})]
+    start = time.time()
+    firewall.update_filters(ironic)
+    return full, (time.time() - start, count_calls(log) - full[1])
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option("-p", "--ports", dest="ports", type="int",
+                      help="number of blacklisted ports (default: 1000)",
+                      default=1000)
+    parser.add_option("-b", "--backend", dest="backends", action="append",
+                      help="backend to benchmark, can be repeated "
+                      "(default: all)")
+    (options, args) = parser.parse_args()
+    backends = options.backends or ['iptables', 'iptables-restore', 'ipset']
+
+    CONF([], project='ironic-inspector')
+    # Measure the backends, not the port cache
+    CONF.set_override('port_cache_refresh_period', 0, 'firewall')
+    ports = [Port('52:54:00:%02x:%02x:%02x' % (i >> 16, (i >> 8) & 0xff,
+                                               i & 0xff), {})
+             for i in range(options.ports)]
+
+    path = tempfile.mkdtemp()
+    try:
+        with mock.patch.object(firewall, 'should_enable_dhcp',
+                               return_value=True), \
+                mock.patch.object(node_cache, 'active_macs',
+                                  return_value=set()):
+            for backend in backends:
+                for name, (elapsed, calls) in zip(
+                        ('full', 'one change'), run(backend, ports, path)):
+                    print('%-20s %-12s %8.3f seconds %8d calls' %
+                          (backend, name, elapsed, calls))
+        for command, stats in sorted(firewall.command_statistics().items()):
+            print('%-20s %8.3f seconds per call' %
+                  (command, stats['average_time']))
+    finally:
+        shutil.rmtree(path)
+
+
+if __name__ == '__main__':
+    main()